@@ -0,0 +1,191 @@
+"""Бенчмарк профилей кодирования и накладных расходов конвейера.
+
+Запуск: python benchmarks/bench_profiles.py [--encoders cpu,nvenc] [--out result.json]
+        python benchmarks/bench_profiles.py --compare old.json new.json
+
+Синтетические клипы (testsrc2 + тон) нескольких разрешений и длительностей
+кодируются каждым профилем. Для каждого прогона сохраняются fps, время,
+размер результата и время этапов: анализ, план, кодирование, проверка, THM.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import ffmpeg_version, make_clip, make_engine
+
+from psp_engine.engine import ENCODER_NAMES
+
+DEFAULT_RESOLUTIONS = ["640x360", "1280x720", "1920x1080"]
+DEFAULT_DURATIONS = [10, 30]
+
+
+def git_revision():
+    try:
+        result = subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            capture_output=True, text=True, timeout=5,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+        return result.stdout.strip() or None
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+
+
+def timed(stages, name, func, *args):
+    started = time.perf_counter()
+    try:
+        return func(*args)
+    finally:
+        stages[name] = round(time.perf_counter() - started, 4)
+
+
+def bench_one(engine, clip, encoder, work_dir, thumb):
+    """Один прогон: клип через все этапы конвейера одним профилем"""
+    stages = {}
+    engine.encoder = encoder
+    # Кэш анализа выключен — этап probe измеряет настоящий запуск ffprobe
+    info = timed(stages, "probe", engine.probe, clip)
+    plan = timed(stages, "plan", engine.plan, clip)
+    plan["work_dir"] = work_dir
+    plan["temp_output"] = os.path.join(work_dir, f"out_{encoder}.mp4")
+
+    # Последний прогресс ffmpeg (скорость) из событий движка
+    progress = {}
+    engine.on_event = lambda event: event[0] == "file_progress" and progress.update(event[2])
+    timed(stages, "encode", engine.encode, plan)
+
+    output = plan["temp_output"]
+    size = os.path.getsize(output)
+    timed(stages, "verify", engine.check_psp_compatibility, output)
+    if thumb:
+        engine.thumb_path = thumb
+        timed(stages, "thm", engine.make_thm, os.path.join(work_dir, "out.THM"))
+    os.remove(output)
+
+    frames = info.duration * 30000 / 1001
+    return {
+        "clip": os.path.basename(clip),
+        "resolution": f"{info.width}x{info.height}",
+        "duration": round(info.duration, 3),
+        "encoder": encoder,
+        "wall": stages["encode"],
+        "fps": round(frames / stages["encode"], 1) if stages["encode"] else 0,
+        "speed": progress.get("speed", 0),
+        "size": size,
+        "bitrate": int(size * 8 / info.duration) if info.duration else 0,
+        "stages": stages,
+        # Все, что не ffmpeg: анализ, план, проверка и обложка
+        "overhead": round(sum(t for name, t in stages.items() if name != "encode"), 4),
+    }
+
+
+def make_thumb(engine, clip, work_dir):
+    """Кадр из клипа для этапа THM; None, если Pillow недоступен"""
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        return None
+    path = os.path.join(work_dir, "thumb.png")
+    subprocess.run([engine.ffmpeg_path, "-v", "error", "-y", "-i", clip, "-frames:v", "1", path], check=True)
+    return path
+
+
+def compare(old_path, new_path):
+    """Таблица изменений fps и размера между двумя прогонами"""
+    with open(old_path, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(new_path, encoding="utf-8") as f:
+        new = json.load(f)
+
+    key = lambda r: (r["clip"], r["encoder"])  # noqa: E731
+    before = {key(r): r for r in old["results"]}
+    print(f"{old.get('revision')} -> {new.get('revision')}")
+    print(f"{'клип':<28} {'кодер':<6} {'fps':>16} {'размер, КБ':>20}")
+    for result in new["results"]:
+        prev = before.get(key(result))
+        if not prev:
+            continue
+        fps_delta = (result["fps"] / prev["fps"] - 1) * 100 if prev["fps"] else 0
+        print(
+            f"{result['clip']:<28} {result['encoder']:<6} "
+            f"{prev['fps']:>6.0f} → {result['fps']:<5.0f}{fps_delta:+4.0f}% "
+            f"{prev['size'] // 1024:>8} → {result['size'] // 1024:<8}"
+        )
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк профилей кодирования PSP")
+    parser.add_argument("--encoders", default="cpu",
+                        help="профили через запятую: cpu, nvenc, qsv, amf или all (все доступные)")
+    parser.add_argument("--resolutions", default=",".join(DEFAULT_RESOLUTIONS), help="разрешения клипов")
+    parser.add_argument("--durations", default=",".join(map(str, DEFAULT_DURATIONS)), help="длительности клипов, секунд")
+    parser.add_argument("--repeat", type=int, default=1, help="повторов каждого прогона (берется лучший)")
+    parser.add_argument("--out", help="файл JSON с результатами")
+    parser.add_argument("--ffmpeg", help="путь к ffmpeg")
+    parser.add_argument("--compare", nargs=2, metavar=("СТАРЫЙ", "НОВЫЙ"), help="сравнить два файла результатов")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        return compare(*args.compare)
+
+    engine = make_engine(args.ffmpeg)
+    if engine is None:
+        return 2
+    engine.allow_stream_copy = False
+
+    encoders = [e.strip() for e in args.encoders.split(",") if e.strip()]
+    if encoders == ["all"]:
+        encoders = ["cpu"] + [e for e, ok in engine.detect_encoders().items() if ok]
+    unknown = [e for e in encoders if e not in ENCODER_NAMES or e == "auto"]
+    if unknown:
+        print(f"Неизвестные профили: {', '.join(unknown)}", file=sys.stderr)
+        return 2
+
+    report = {
+        "revision": git_revision(),
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "ffmpeg": ffmpeg_version(engine.ffmpeg_path),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "results": [],
+    }
+
+    work_dir = tempfile.mkdtemp(prefix="psp_bench_")
+    try:
+        for resolution in args.resolutions.split(","):
+            width, height = map(int, resolution.split("x"))
+            for seconds in map(int, args.durations.split(",")):
+                clip = os.path.join(work_dir, f"clip_{width}x{height}_{seconds}s.mp4")
+                make_clip(engine.ffmpeg_path, clip, seconds, width, height)
+                thumb = make_thumb(engine, clip, work_dir)
+
+                for encoder in encoders:
+                    runs = [bench_one(engine, clip, encoder, work_dir, thumb) for _ in range(max(1, args.repeat))]
+                    best = min(runs, key=lambda r: r["wall"])
+                    report["results"].append(best)
+                    print(
+                        f"{best['clip']:<28} {encoder:<6} {best['wall']:7.2f} с {best['fps']:7.0f} fps "
+                        f"{best['size'] // 1024:7} КБ  накладные {best['overhead'] * 1000:6.0f} мс",
+                        flush=True,
+                    )
+                os.remove(clip)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+        print(f"Результаты: {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
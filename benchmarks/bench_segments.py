@@ -0,0 +1,71 @@
+"""Сравнение сегментного и обычного кодирования длинного файла.
+
+Запуск: python benchmarks/bench_segments.py [--minutes 20] [--source ФАЙЛ]
+
+Без --source создается синтетический исходник 1280x720 (testsrc2 + тон).
+Печатается время кодирования одним процессом ffmpeg и по частям.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from common import make_clip, make_engine
+
+
+def run(engine, source, work_dir, segmented):
+    """Время кодирования одного файла, секунд"""
+    engine.segment_min_duration = 1 if segmented else 0
+    plan = engine.plan(source)
+    plan["work_dir"] = work_dir
+    plan["temp_output"] = os.path.join(work_dir, "segmented.mp4" if segmented else "single.mp4")
+
+    started = time.monotonic()
+    engine.encode(plan)
+    elapsed = time.monotonic() - started
+
+    os.remove(plan["temp_output"])
+    return elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк сегментного кодирования")
+    parser.add_argument("--source", help="исходный файл (по умолчанию — синтетический)")
+    parser.add_argument("--minutes", type=float, default=20, help="длительность синтетического исходника")
+    parser.add_argument("--segments", type=int, default=0, help="число частей (0 — по числу ядер)")
+    parser.add_argument("--ffmpeg", help="путь к ffmpeg")
+    args = parser.parse_args(argv)
+
+    engine = make_engine(args.ffmpeg)
+    if engine is None:
+        return 2
+    engine.segment_count = args.segments
+    # Один файл — как в пакете из одного файла: ffmpeg сам выбирает число потоков
+    engine.threads_per_job = 0
+
+    work_dir = tempfile.mkdtemp(prefix="psp_bench_")
+    try:
+        source = args.source
+        if not source:
+            source = os.path.join(work_dir, "source.mp4")
+            print(f"Создание исходника ({args.minutes:g} мин)...", flush=True)
+            make_clip(engine.ffmpeg_path, source, int(args.minutes * 60))
+
+        duration = engine.probe(source).duration
+        print(f"Исходник: {source} ({duration / 60:.1f} мин), ядер: {os.cpu_count()}")
+
+        single = run(engine, source, work_dir, segmented=False)
+        print(f"Один процесс:  {single:7.1f} с ({duration / single:.1f}x)")
+
+        segmented = run(engine, source, work_dir, segmented=True)
+        print(f"По сегментам:  {segmented:7.1f} с ({duration / segmented:.1f}x)")
+        print(f"Ускорение:     {single / segmented:7.2f}x")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,38 @@
+"""Общие функции бенчмарков: синтетические исходники и движок"""
+import os
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from psp_engine import ConversionEngine  # noqa: E402
+
+
+def make_clip(ffmpeg_path, path, seconds, width=1280, height=720, gop=300):
+    """Синтетическое видео testsrc2 + тон sine с ключевыми кадрами каждые gop кадров"""
+    subprocess.run([
+        ffmpeg_path, "-v", "error", "-y",
+        "-f", "lavfi", "-i", f"testsrc2=size={width}x{height}:rate=30000/1001:duration={seconds}",
+        "-f", "lavfi", "-i", f"sine=frequency=440:sample_rate=48000:duration={seconds}",
+        "-c:v", "libx264", "-preset", "ultrafast", "-g", str(gop),
+        "-c:a", "aac", "-b:a", "128k",
+        path,
+    ], check=True)
+
+
+def make_engine(ffmpeg_path=None):
+    """Движок без кэшей и вывода событий; None, если ffmpeg/ffprobe не найдены"""
+    engine = ConversionEngine(ffmpeg_path=ffmpeg_path, on_event=lambda event: None,
+                              probe_cache=None, capability_cache=None)
+    if not engine.ffmpeg_path or not engine.ffprobe_path:
+        print("FFmpeg/ffprobe не найдены", file=sys.stderr)
+        return None
+    return engine
+
+
+def ffmpeg_version(ffmpeg_path):
+    try:
+        result = subprocess.run([ffmpeg_path, "-version"], capture_output=True, text=True, timeout=10)
+        return result.stdout.splitlines()[0] if result.stdout else None
+    except (OSError, subprocess.TimeoutExpired):
+        return None
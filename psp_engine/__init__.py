@@ -0,0 +1,46 @@
+"""Движок конвертации видео для PSP (без GUI).
+
+Импорт пакета не тянет customtkinter/tkinter — его можно использовать
+на сервере, из cron или через ``python -m psp_engine``.
+"""
+from .engine import (
+    ConversionEngine,
+    ENCODER_NAMES,
+    PSP_PROFILES,
+    PSP_ROOT_DIR,
+    PSP_VIDEO_DIR,
+    VIDEO_EXTS,
+    encoder_from_choice,
+    find_ffmpeg,
+    find_ffprobe,
+)
+from .capabilities import CapabilityCache
+from .events import EventBuffer, JsonLinesSink
+from .media_info import MediaInfo, StreamInfo
+from .metrics import Metrics, MetricsServer
+from .probe_cache import ProbeCache
+from .scheduler import EncoderLane, LaneScheduler
+from .watch import FolderWatcher
+
+__all__ = [
+    "CapabilityCache",
+    "ConversionEngine",
+    "ENCODER_NAMES",
+    "EncoderLane",
+    "EventBuffer",
+    "FolderWatcher",
+    "JsonLinesSink",
+    "LaneScheduler",
+    "Metrics",
+    "MetricsServer",
+    "PSP_PROFILES",
+    "PSP_ROOT_DIR",
+    "PSP_VIDEO_DIR",
+    "ProbeCache",
+    "VIDEO_EXTS",
+    "encoder_from_choice",
+    "find_ffmpeg",
+    "find_ffprobe",
+    "MediaInfo",
+    "StreamInfo",
+]
@@ -0,0 +1,325 @@
+"""Командная строка: python -m psp_engine ПАПКА [опции]"""
+import argparse
+import os
+import shutil
+import signal
+import sys
+import time
+
+from .engine import ConversionEngine, ENCODER_NAMES, PSP_PROFILES, parse_profiles
+from .events import JsonLinesSink, fan_out
+from .manifest import Manifest
+from .metrics import Metrics, MetricsServer
+from .packing import STICK_DIR, format_size, parse_size
+from .progress import format_file_progress
+from .scheduler import ORDER_SCAN, ORDERS
+from .tuning import DEFAULT_QUALITY_FLOOR
+
+
+# Прогресс печатается не чаще одного раза в PROGRESS_INTERVAL секунд
+PROGRESS_INTERVAL = 5.0
+_last_progress = {"time": 0.0, "text": None}
+# Строка прогресса файлов в терминале: перерисовывается на месте через \r
+_status = {"files": {}, "width": 0}
+
+
+def clear_status():
+    """Стирает строку прогресса файлов перед обычным выводом"""
+    if _status["width"]:
+        sys.stdout.write("\r" + " " * _status["width"] + "\r")
+        sys.stdout.flush()
+        _status["width"] = 0
+
+
+def show_file_progress(index, info):
+    """Прогресс кодируемых файлов одной обновляемой строкой (только в терминале)"""
+    files = _status["files"]
+    if info["percent"] >= 100:
+        files.pop(index, None)
+    else:
+        files[index] = info
+    if not sys.stdout.isatty():
+        return
+    text = "   ".join(format_file_progress(i, files[i]) for i in sorted(files))
+    width = shutil.get_terminal_size().columns - 1
+    text = text[:width]
+    sys.stdout.write("\r" + text.ljust(_status["width"]))
+    sys.stdout.flush()
+    _status["width"] = len(text)
+
+
+def print_event(event):
+    kind = event[0]
+    if kind == "file_progress":
+        show_file_progress(event[1], event[2])
+        return
+    if kind in ("log", "progress", "warn", "error", "success"):
+        clear_status()
+    if kind == "log":
+        print(event[1], file=sys.stderr if event[2] in ("error", "warning") else sys.stdout, flush=True)
+    elif kind == "progress":
+        if len(event) > 2:
+            now = time.monotonic()
+            files_done = event[2].split(" ")[0]
+            # Завершение файла печатается всегда, промежуточный прогресс — с ограничением частоты
+            if files_done != _last_progress["text"] or now - _last_progress["time"] >= PROGRESS_INTERVAL:
+                _last_progress.update(time=now, text=files_done)
+                print(f"Прогресс: {event[1] * 100:.1f}% ({event[2]})", flush=True)
+    elif kind in ("warn", "error"):
+        print(event[1], file=sys.stderr, flush=True)
+    elif kind == "success":
+        print(event[1], flush=True)
+    elif kind == "finish":
+        clear_status()
+        _status["files"].clear()
+
+
+def print_packing(engine, folder):
+    """Раскладка по картам со списком файлов, без кодирования"""
+    engine.input_folder = folder
+    packing = engine.plan_capacity(engine.find_videos(folder))
+    engine.report_packing(packing)
+    for n, stick in enumerate(packing.sticks):
+        print(f"\n{STICK_DIR.format(n + 1)}:")
+        for item in sorted(stick, key=lambda i: i.path):
+            print(f"  {format_size(item.size_at(packing.video_cap)):>10}  {os.path.relpath(item.path, folder)}")
+    return 1 if packing.oversized else 0
+
+
+def profiles_arg(value):
+    try:
+        return parse_profiles(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def print_dead_letters(folder):
+    """Список проблемных файлов из манифеста папки"""
+    path = os.path.join(folder, Manifest.FILENAME)
+    if not os.path.exists(path):
+        print("Манифест не найден — папка еще не конвертировалась")
+        return 0
+    manifest = Manifest(path)
+    try:
+        entries = manifest.dead_letters()
+    finally:
+        manifest.close()
+    if not entries:
+        print("Проблемных файлов нет")
+        return 0
+    print(f"Проблемных файлов: {len(entries)} (повторить — --retry-dead)")
+    for entry in entries:
+        print(f"  {os.path.relpath(entry['source'], folder)} — попыток: {entry['attempts']}, ошибка: {entry['error']}")
+    return 1
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m psp_engine",
+        description="Конвертация видео для PSP в структуру MP_ROOT/100ANV01",
+    )
+    parser.add_argument("folder", help="папка с видео (обрабатывается рекурсивно)")
+    parser.add_argument("--encoder", choices=sorted(ENCODER_NAMES), default="cpu",
+                        help="кодер видео (по умолчанию cpu; auto — все GPU-кодеры и CPU одновременно)")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="параллельных задач (0 — автоматически)")
+    parser.add_argument("--thumb", help="изображение для обложек .THM")
+    parser.add_argument("--no-auto-thumb", action="store_true",
+                        help="без --thumb не создавать обложки из кадров видео")
+    parser.add_argument("--ffmpeg", help="путь к ffmpeg")
+    parser.add_argument("--profiles", type=profiles_arg, default=[], metavar="СПИСОК",
+                        help=f"профили через запятую ({', '.join(PSP_PROFILES)}); несколько кодируются за одно декодирование,"
+                             " дополнительные — в PSP_ШxВ/MP_ROOT")
+    parser.add_argument("--output", metavar="ПАПКА",
+                        help="куда записать MP_ROOT (например, смонтированная карта памяти); по умолчанию — рядом с исходниками")
+    parser.add_argument("--scratch", metavar="ПАПКА",
+                        help="рабочая папка для временных файлов на быстром диске или auto; по умолчанию файлы пишутся сразу на место")
+    parser.add_argument("--include", action="append", default=[], metavar="ШАБЛОН",
+                        help="конвертировать только файлы, совпавшие с шаблоном (например \"Сериалы/*\" или \"*.mkv\"); можно повторять")
+    parser.add_argument("--exclude", action="append", default=[], metavar="ШАБЛОН",
+                        help="пропускать файлы и папки, совпавшие с шаблоном; можно повторять")
+    parser.add_argument("--probe-cache", metavar="ФАЙЛ",
+                        help="файл кэша анализа видео (SQLite)")
+    parser.add_argument("--no-probe-cache", action="store_true",
+                        help="не использовать кэш анализа видео")
+    parser.add_argument("--redetect", action="store_true",
+                        help="заново проверить кодеры ffmpeg и GPU, не используя кэш")
+    parser.add_argument("--no-copy", action="store_true",
+                        help="всегда перекодировать, даже уже совместимые с PSP файлы")
+    parser.add_argument("--segment-long", type=float, default=0, metavar="МИН",
+                        help="кодировать частями параллельно файлы длиннее МИН минут (0 — выключено)")
+    parser.add_argument("--segments", type=int, default=0,
+                        help="число частей для сегментного кодирования (0 — по числу ядер)")
+    parser.add_argument("--adaptive-bitrate", action="store_true",
+                        help="подбирать битрейт видео по сложности каждого файла вместо 768k")
+    parser.add_argument("--capacity", metavar="ОБЪЕМ",
+                        help="разложить результат по картам памяти такого объема (например 4G, 32G)")
+    parser.add_argument("--sticks", type=int, default=0,
+                        help="сколько карт доступно: битрейт снижается, чтобы все поместилось (0 — сколько нужно)")
+    parser.add_argument("--plan-only", action="store_true",
+                        help="только показать раскладку по картам, ничего не кодируя")
+    parser.add_argument("--tune", action="store_true",
+                        help="подобрать пресет libx264 пробными кодированиями (сохраняется для похожих файлов)")
+    parser.add_argument("--quality-floor", type=float, default=DEFAULT_QUALITY_FLOOR, metavar="SSIM",
+                        help=f"минимальный SSIM при подборе пресета (по умолчанию {DEFAULT_QUALITY_FLOOR})")
+    parser.add_argument("--job-timeout", type=float, default=0, metavar="МИН",
+                        help="остановить ffmpeg, работающий дольше МИН минут (0 — без предела)")
+    parser.add_argument("--stall-timeout", type=float, default=300, metavar="СЕК",
+                        help="остановить ffmpeg, который ничего не выводит СЕК секунд (0 — не проверять)")
+    parser.add_argument("--deep-verify", action="store_true",
+                        help="проверять готовые файлы по заголовку MP4, а не по параметрам кодирования")
+    parser.add_argument("--order", choices=ORDERS, default=ORDER_SCAN,
+                        help="порядок файлов: scan — как найдены, shortest — сначала короткие,"
+                             " longest — сначала длинные (меньше общее время при нескольких задачах)")
+    parser.add_argument("--priority", action="append", default=[], metavar="ШАБЛОН",
+                        help="файлы, совпавшие с шаблоном, конвертируются первыми; можно повторять")
+    parser.add_argument("--retries", type=int, default=1,
+                        help="повторов файла после ошибки в том же запуске (по умолчанию 1)")
+    parser.add_argument("--retry-backoff", type=float, default=10, metavar="СЕК",
+                        help="пауза перед первым повтором, дальше вдвое больше (по умолчанию 10)")
+    parser.add_argument("--dead-after", type=int, default=3, metavar="N",
+                        help="после N неудачных попыток подряд файл пропускается в следующих запусках (0 — никогда)")
+    parser.add_argument("--retry-dead", action="store_true",
+                        help="снова попробовать файлы из списка проблемных")
+    parser.add_argument("--dead-letters", action="store_true",
+                        help="только показать список проблемных файлов")
+    parser.add_argument("--force", action="store_true",
+                        help="перекодировать все файлы, даже уже сконвертированные")
+    parser.add_argument("--no-manifest", action="store_true",
+                        help="не вести манифест конвертации в папке")
+    parser.add_argument("--watch", action="store_true",
+                        help="после конвертации следить за папкой и конвертировать новые файлы")
+    parser.add_argument("--settle", type=float, default=10, metavar="СЕК",
+                        help="файл берется в работу, когда не меняется СЕК секунд (по умолчанию 10)")
+    parser.add_argument("--poll-interval", type=float, default=5, metavar="СЕК",
+                        help="период опроса папок без inotify (по умолчанию 5)")
+    parser.add_argument("--events", metavar="ФАЙЛ",
+                        help="дописывать все события (лог, прогресс) в файл строками JSON")
+    parser.add_argument("--metrics", metavar="ФАЙЛ",
+                        help="записать отчет JSON по пакету: время этапов, байты, скорость, ошибки по причинам")
+    parser.add_argument("--metrics-port", type=int, metavar="ПОРТ",
+                        help="отдавать счетчики в формате Prometheus на http://127.0.0.1:ПОРТ/metrics (удобно с --watch)")
+    parser.add_argument("--rename", action="store_true",
+                        help="только переименовать готовые файлы в M4Vxxxxx.MP4")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    if not os.path.isdir(args.folder):
+        print(f"Папка не найдена: {args.folder}", file=sys.stderr)
+        return 2
+
+    probe_cache = None if args.no_probe_cache else (args.probe_cache or True)
+    engine = ConversionEngine(ffmpeg_path=args.ffmpeg, on_event=print_event, probe_cache=probe_cache)
+
+    if args.dead_letters:
+        return print_dead_letters(args.folder)
+
+    if args.rename:
+        try:
+            engine.rename_to_psp_format(args.folder)
+        except FileNotFoundError:
+            print("Папка PSP не найдена. Сначала сконвертируйте видео.", file=sys.stderr)
+            return 1
+        return 0
+
+    if not engine.ffmpeg_path:
+        print("FFmpeg не найден! Укажите путь через --ffmpeg", file=sys.stderr)
+        return 2
+    if not engine.ffprobe_path:
+        print("⚠️ ffprobe не найден — параметры видео читаются из вывода ffmpeg -i (без уровня H.264)", file=sys.stderr)
+
+    if args.redetect:
+        engine.detect_gpu(refresh=True)
+    if args.encoder == "auto" or args.redetect:
+        engine.detect_encoders(refresh=args.redetect)
+    if args.encoder not in ("cpu", "auto") and not engine.detect_encoders().get(args.encoder):
+        print(f"Кодер {ENCODER_NAMES[args.encoder]} недоступен в этой сборке ffmpeg", file=sys.stderr)
+        return 2
+
+    engine.encoder = args.encoder
+    engine.workers = args.workers
+    engine.thumb_path = args.thumb
+    engine.auto_thumbs = not args.no_auto_thumb
+    engine.force = args.force
+    engine.deep_verify = args.deep_verify
+    engine.allow_stream_copy = not args.no_copy
+    engine.profiles = args.profiles
+    engine.segment_min_duration = args.segment_long * 60
+    engine.segment_count = args.segments
+    engine.adaptive_bitrate = args.adaptive_bitrate
+    engine.tune = args.tune
+    engine.max_sticks = args.sticks
+    if args.capacity:
+        try:
+            engine.capacity = parse_size(args.capacity)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 2
+    engine.quality_floor = args.quality_floor
+    engine.job_timeout = args.job_timeout * 60
+    engine.stall_timeout = args.stall_timeout
+    engine.use_manifest = not args.no_manifest
+    engine.include = args.include
+    engine.output_root = args.output
+    engine.scratch_dir = args.scratch
+    engine.exclude = args.exclude
+    engine.order = args.order
+    engine.priority = args.priority
+    engine.retries = max(0, args.retries)
+    engine.retry_backoff = args.retry_backoff
+    engine.dead_letter_after = max(0, args.dead_after)
+    engine.retry_dead = args.retry_dead
+
+    if args.plan_only:
+        if not engine.capacity:
+            print("--plan-only требует --capacity", file=sys.stderr)
+            return 2
+        return print_packing(engine, args.folder)
+
+    sink = None
+    if args.events:
+        try:
+            sink = JsonLinesSink(args.events)
+        except OSError as e:
+            print(f"Не удалось открыть файл событий: {e}", file=sys.stderr)
+            return 2
+        engine.on_event = fan_out(print_event, sink.put)
+
+    server = None
+    if args.metrics or args.metrics_port is not None:
+        engine.metrics = Metrics()
+        engine.metrics_report = args.metrics
+    if args.metrics_port is not None:
+        try:
+            server = MetricsServer(engine.metrics, args.metrics_port)
+        except OSError as e:
+            print(f"Не удалось открыть порт метрик: {e}", file=sys.stderr)
+            if sink is not None:
+                sink.close()
+            return 2
+        print(f"📈 Метрики: http://127.0.0.1:{server.port}/metrics", flush=True)
+
+    # Ctrl+C останавливает все запущенные процессы ffmpeg
+    signal.signal(signal.SIGINT, lambda signum, frame: engine.request_stop())
+
+    try:
+        if args.watch:
+            summary = engine.watch_folder(args.folder, settle=args.settle, poll_interval=args.poll_interval)
+            return 130 if summary["stopped"] else 0
+
+        summary = engine.process_folder(args.folder)
+    finally:
+        if server is not None:
+            server.close()
+        if sink is not None:
+            sink.close()
+    if summary["stopped"]:
+        return 130
+    return 1 if summary["failed"] or summary["dead"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""Битрейт по сложности содержимого и прогноз размера результата"""
+import os
+import shutil
+import tempfile
+
+# Пробные фрагменты: доли длительности файла и длина фрагмента, секунд
+SAMPLE_POINTS = (0.1, 0.3, 0.5, 0.7, 0.9)
+SAMPLE_SECONDS = 6
+
+# Пробное кодирование с постоянным качеством: его битрейт и есть «сложность»
+ANALYSIS_CRF = 23
+# Пресет итогового кодирования сжимает лучше ultrafast примерно на столько
+PRESET_EFFICIENCY = 0.7
+
+# Пределы битрейта видео для PSP, бит/с
+MIN_VIDEO_BITRATE = 256_000
+MAX_VIDEO_BITRATE = 1_200_000
+BITRATE_STEP = 16_000
+
+# Заголовки и индекс MP4 сверх потоков
+CONTAINER_OVERHEAD = 1.02
+
+
+def parse_bitrate(value):
+    """"768k" / "1.2M" / 768000 в бит/с; 0 если не удалось разобрать"""
+    if isinstance(value, (int, float)):
+        return int(value)
+    text = (value or "").strip().lower()
+    scale = {"k": 1000, "m": 1000_000}.get(text[-1:], 1)
+    try:
+        return int(float(text.rstrip("km")) * scale)
+    except ValueError:
+        return 0
+
+
+def format_bitrate(bits):
+    """Бит/с в виде "768k" для ffmpeg"""
+    return f"{int(round(bits / 1000))}k"
+
+
+def choose_bitrate(complexity):
+    """Битрейт видео по сложности, в пределах PSP, с шагом BITRATE_STEP"""
+    target = complexity * PRESET_EFFICIENCY
+    target = round(target / BITRATE_STEP) * BITRATE_STEP
+    return int(min(MAX_VIDEO_BITRATE, max(MIN_VIDEO_BITRATE, target)))
+
+
+def expected_video_rate(bitrate, complexity=0.0):
+    """Ожидаемый средний битрейт видео: CRF не тратит бит больше, чем нужно содержимому"""
+    if complexity > 0:
+        return min(bitrate, complexity * PRESET_EFFICIENCY)
+    return bitrate
+
+
+def predict_size(duration, video_rate, audio_rate):
+    """Прогноз размера файла в байтах"""
+    return int(duration * (video_rate + audio_rate) / 8 * CONTAINER_OVERHEAD)
+
+
+def sample_starts(duration):
+    if duration <= SAMPLE_SECONDS * len(SAMPLE_POINTS):
+        return [0.0]
+    return [min(duration - SAMPLE_SECONDS, duration * point) for point in SAMPLE_POINTS]
+
+
+def measure_complexity(engine, plan):
+    """Битрейт пробного CRF-кодирования фрагментов в разрешении PSP, бит/с; 0 при ошибке.
+
+    Фрагменты кодируются ultrafast с той же цепочкой scale/pad/fps,
+    поэтому проход занимает доли секунды на фрагмент.
+    """
+    info = plan["info"]
+    width, height = plan["width"], plan["height"]
+    chain = (
+        f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+        f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,fps=30000/1001"
+    )
+
+    total_bits = total_seconds = 0.0
+    os.makedirs(plan["work_dir"], exist_ok=True)
+    work_dir = tempfile.mkdtemp(prefix=".psp_cx_", dir=plan["work_dir"])
+    try:
+        for n, start in enumerate(sample_starts(plan["duration"])):
+            length = min(SAMPLE_SECONDS, plan["duration"] - start)
+            if length <= 0:
+                continue
+            sample = os.path.join(work_dir, f"sample{n}.mp4")
+            cmd = [
+                engine.ffmpeg_path, "-nostats", "-progress", "pipe:1",
+                "-ss", f"{start:.3f}", "-t", f"{length:.3f}", "-i", plan["input_file"],
+                "-map", f"0:{info.video.index}", "-an",
+                "-vf", chain,
+                "-c:v", "libx264", "-preset", "ultrafast", "-crf", str(ANALYSIS_CRF),
+                "-profile:v", "baseline", "-pix_fmt", "yuv420p",
+                "-f", "mp4", "-y", sample,
+            ]
+            engine.run_ffmpeg(cmd)
+            total_bits += os.path.getsize(sample) * 8
+            total_seconds += length
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return total_bits / total_seconds if total_seconds else 0.0
@@ -0,0 +1,247 @@
+"""Поиск ffmpeg и проверка аппаратных кодеров с кэшем результатов"""
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .probe_cache import user_cache_dir
+
+# Аппаратные кодеры H.264: ключ -> имя в ffmpeg
+HW_ENCODERS = {
+    "amf": "h264_amf",
+    "nvenc": "h264_nvenc",
+    "qsv": "h264_qsv",
+}
+
+# Переменная окружения с путем к ffmpeg (имеет приоритет над поиском)
+FFMPEG_ENV = "PSP_FFMPEG"
+
+# Сведения о GPU не зависят от ffmpeg — обновляются раз в неделю
+GPU_INFO_TTL = 7 * 24 * 3600
+
+NO_WINDOW = subprocess.CREATE_NO_WINDOW if hasattr(subprocess, 'CREATE_NO_WINDOW') else 0
+
+
+def default_capability_path():
+    return os.path.join(user_cache_dir(), "capabilities.json")
+
+
+def _exe(name):
+    return name + ".exe" if sys.platform == "win32" else name
+
+
+def ffmpeg_candidates():
+    """Пути, где может лежать ffmpeg, в порядке приоритета"""
+    app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    candidates = [
+        os.environ.get(FFMPEG_ENV),
+        shutil.which("ffmpeg"),
+        # Рядом с программой или собранным exe
+        os.path.join(os.path.dirname(sys.executable), _exe("ffmpeg")),
+        os.path.join(app_dir, _exe("ffmpeg")),
+        os.path.join(app_dir, "bin", _exe("ffmpeg")),
+    ]
+    if sys.platform == "win32":
+        candidates += [
+            r"C:\ffmpeg\bin\ffmpeg.exe",
+            r"C:\Program Files\ffmpeg\bin\ffmpeg.exe",
+            r"C:\Program Files (x86)\ffmpeg\bin\ffmpeg.exe",
+        ]
+    else:
+        candidates += [
+            "/usr/local/bin/ffmpeg",
+            "/opt/homebrew/bin/ffmpeg",
+            "/usr/bin/ffmpeg",
+            "/snap/bin/ffmpeg",
+        ]
+    return [path for path in candidates if path]
+
+
+def find_ffmpeg():
+    """Поиск ffmpeg: PSP_FFMPEG, PATH, папка программы, типичные места установки"""
+    for path in ffmpeg_candidates():
+        if os.path.isfile(path) and os.access(path, os.X_OK):
+            return os.path.abspath(path)
+    return None
+
+
+def _run(cmd, timeout):
+    return subprocess.run(
+        cmd,
+        capture_output=True,
+        text=True,
+        encoding='utf-8',
+        errors='replace',
+        timeout=timeout,
+        creationflags=NO_WINDOW,
+    )
+
+
+def list_encoders(ffmpeg_path):
+    """Имена видеокодеров из ffmpeg -encoders"""
+    result = _run([ffmpeg_path, "-hide_banner", "-encoders"], timeout=10)
+    encoders = []
+    for line in result.stdout.splitlines():
+        # " V....D libx264   описание"
+        match = re.match(r"\s*V\S{5}\s+(\S+)", line)
+        if match:
+            encoders.append(match.group(1))
+    return encoders
+
+
+def test_encoder(ffmpeg_path, codec, timeout=15):
+    """Пробное кодирование нескольких кадров: кодер есть в сборке, но работает ли он"""
+    cmd = [
+        ffmpeg_path, "-hide_banner", "-v", "error",
+        "-f", "lavfi", "-i", "color=black:size=368x208:rate=30000/1001",
+        "-frames:v", "5",
+        "-pix_fmt", "yuv420p",
+        "-c:v", codec,
+        "-f", "null", "-",
+    ]
+    try:
+        return _run(cmd, timeout).returncode == 0
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+
+
+def detect_capabilities(ffmpeg_path):
+    """Список кодеров и результат пробного кодирования для каждого аппаратного"""
+    try:
+        encoders = list_encoders(ffmpeg_path)
+    except (OSError, subprocess.TimeoutExpired):
+        encoders = []
+
+    present = {key: codec for key, codec in HW_ENCODERS.items() if codec in encoders}
+    working = {key: False for key in HW_ENCODERS}
+    if present:
+        with ThreadPoolExecutor(max_workers=len(present)) as pool:
+            results = pool.map(lambda codec: test_encoder(ffmpeg_path, codec), present.values())
+            working.update(zip(present, results))
+
+    return {
+        "encoders": encoders,
+        "hardware": working,
+        "detected": time.time(),
+    }
+
+
+def detect_gpu_info():
+    """Производитель и модель GPU средствами ОС"""
+    names = []
+    try:
+        if sys.platform == "win32":
+            result = _run(
+                ["powershell", "-NoProfile", "-Command",
+                 "Get-CimInstance Win32_VideoController | Select-Object -ExpandProperty Name"],
+                timeout=10,
+            )
+            names = [line.strip() for line in result.stdout.splitlines() if line.strip()]
+        elif sys.platform == "darwin":
+            result = _run(["system_profiler", "SPDisplaysDataType"], timeout=10)
+            names = [line.split(":", 1)[1].strip() for line in result.stdout.splitlines() if "Chipset Model" in line]
+        elif shutil.which("lspci"):
+            result = _run(["lspci"], timeout=5)
+            names = [
+                line.split(": ", 1)[1].strip()
+                for line in result.stdout.splitlines()
+                if ": " in line and ("VGA" in line or "3D controller" in line or "Display controller" in line)
+            ]
+    except (OSError, subprocess.TimeoutExpired):
+        pass
+
+    gpu_info = {"vendor": "unknown", "model": "unknown", "supports_amf": False}
+    # Дискретная карта важнее встроенной
+    for vendor, keys in (("nvidia", ("nvidia",)), ("amd", ("amd", "radeon", "ati ")), ("intel", ("intel",))):
+        for name in names:
+            if any(key in name.lower() for key in keys):
+                gpu_info.update(vendor=vendor, model=name, supports_amf=vendor == "amd")
+                return gpu_info
+    if names:
+        gpu_info["model"] = names[0]
+    return gpu_info
+
+
+class CapabilityCache:
+    """Кэш возможностей ffmpeg с ключом (путь к ffmpeg, размер, mtime).
+
+    Хранится в JSON: записей мало, читаются один раз при запуске.
+    Обновленный ffmpeg (другой размер или mtime) проверяется заново.
+    """
+
+    SCHEMA_VERSION = 1
+
+    def __init__(self, path=None):
+        self.path = path or default_capability_path()
+        self.lock = threading.Lock()
+        self.data = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {"version": self.SCHEMA_VERSION, "ffmpeg": {}}
+        if not isinstance(data, dict) or data.get("version") != self.SCHEMA_VERSION:
+            return {"version": self.SCHEMA_VERSION, "ffmpeg": {}}
+        data.setdefault("ffmpeg", {})
+        return data
+
+    def _save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Запись через временный файл — параллельный запуск не прочитает половину JSON
+        temp = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, ensure_ascii=False, indent=1)
+        os.replace(temp, self.path)
+
+    @staticmethod
+    def _key(ffmpeg_path):
+        path = os.path.abspath(ffmpeg_path)
+        st = os.stat(path)
+        return path, st.st_size, st.st_mtime_ns
+
+    def capabilities(self, ffmpeg_path, refresh=False):
+        """Возможности ffmpeg: из кэша или с проверкой кодеров"""
+        path, size, mtime_ns = self._key(ffmpeg_path)
+        with self.lock:
+            entry = self.data["ffmpeg"].get(path)
+            if not refresh and entry and entry.get("size") == size and entry.get("mtime_ns") == mtime_ns:
+                return entry["capabilities"]
+
+        capabilities = detect_capabilities(ffmpeg_path)
+        with self.lock:
+            self.data["ffmpeg"][path] = {"size": size, "mtime_ns": mtime_ns, "capabilities": capabilities}
+            self._try_save()
+        return capabilities
+
+    def gpu_info(self, refresh=False):
+        with self.lock:
+            entry = self.data.get("gpu")
+            if not refresh and entry and time.time() - entry.get("detected", 0) < GPU_INFO_TTL:
+                return dict(entry["info"])
+
+        info = detect_gpu_info()
+        with self.lock:
+            self.data["gpu"] = {"info": info, "detected": time.time()}
+            self._try_save()
+        return dict(info)
+
+    def _try_save(self):
+        # Кэш необязателен: без записи проверка просто повторится при следующем запуске
+        try:
+            self._save()
+        except OSError:
+            pass
+
+    def clear(self):
+        with self.lock:
+            self.data = {"version": self.SCHEMA_VERSION, "ffmpeg": {}}
+            self._try_save()
@@ -0,0 +1,1845 @@
+"""Движок конвертации видео для PSP без графического интерфейса"""
+import os
+import hashlib
+import itertools
+import time
+import threading
+import json
+import subprocess
+import re
+import shutil
+import sqlite3
+from dataclasses import replace
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from .bitrate import (
+    MAX_VIDEO_BITRATE,
+    MIN_VIDEO_BITRATE,
+    choose_bitrate,
+    expected_video_rate,
+    format_bitrate,
+    measure_complexity,
+    parse_bitrate,
+    predict_size,
+)
+from .capabilities import HW_ENCODERS, CapabilityCache, detect_capabilities, detect_gpu_info, find_ffmpeg
+from .manifest import Manifest
+from .media_info import MediaInfo, StreamInfo
+from .metrics import STATUS_DONE, STATUS_FAILED, STATUS_RETRIED, STATUS_SKIPPED, NullMetrics, failure_cause
+from .mp4 import AVC_PROFILES, read_mp4_info
+from .naming import NameIndex
+from .packing import STICK_DIR, PackItem, format_size, pack, stick_usage
+from .probe_cache import ProbeCache
+from .progress import BatchProgress, FileProgress, format_duration, parse_number
+from .scanner import VideoScanner, matches
+from .scheduler import ORDER_LONGEST, ORDER_SCAN, ORDER_SHORTEST, EncoderLane, LaneScheduler, order_jobs
+from .segments import SegmentedEncoder
+from .staging import SCRATCH_AUTO, choose_work_dir, finalize, prepare_scratch, same_device
+from .supervisor import REASON_CANCEL, REASON_STALL, REASON_TIMEOUT, FFmpegError, FFmpegSupervisor
+from .thumbnails import CoverCache, FrameExtractor
+from .tuning import DEFAULT_QUALITY_FLOOR, PresetTuner, apply_profile
+from .watch import FolderWatcher
+
+VIDEO_EXTS = {'.mp4', '.mkv', '.avi', '.mov', '.wmv', '.flv', '.webm', '.mpg', '.m4v'}
+
+# PSP требует строгую структуру папок
+PSP_ROOT_DIR = "MP_ROOT"
+PSP_VIDEO_DIR = "100ANV01"
+
+# Разрешения, которые воспроизводит PSP
+PSP_RESOLUTIONS = [(320, 240), (368, 208), (320, 176), (384, 160), (416, 176)]
+PSP_MAX_VIDEO_BITRATE = 1500_000
+
+# Профили вывода: auto — 320x240 для 4:3 и 368x208 для остального,
+# 480x272 — полный экран PSP (прошивка 3.30 и новее)
+PSP_PROFILES = {"auto": None, "368x208": (368, 208), "320x240": (320, 240), "480x272": (480, 272)}
+# Дополнительные профили записываются в свое дерево MP_ROOT в этой папке
+PROFILE_DIR = "PSP_{}"
+
+# Режимы обработки файла
+MODE_ENCODE = "encode"  # полное перекодирование
+MODE_COPY_VIDEO = "copy_video"  # видео копируется, аудио перекодируется
+MODE_COPY = "copy"  # только перепаковка в MP4
+
+# Префикс временных файлов и рабочих папок движка рядом с исходниками
+WORK_PREFIX = ".psp_"
+
+
+def is_source_video(name):
+    """Файл — исходное видео, а не временный результат конвертации"""
+    return os.path.splitext(name)[1].lower() in VIDEO_EXTS and not name.startswith(WORK_PREFIX)
+
+
+def is_work_dir(name):
+    """Каталог с результатами (MP_ROOT) или рабочими файлами движка"""
+    return name == PSP_ROOT_DIR or name.startswith(WORK_PREFIX)
+
+
+ENCODER_NAMES = {
+    "cpu": "CPU (libx264)",
+    "auto": "GPU + CPU",
+    "amf": "AMD AMF",
+    "nvenc": "NVIDIA NVENC",
+    "qsv": "Intel QSV",
+}
+
+ORDER_NAMES = {
+    ORDER_SCAN: "в порядке обхода",
+    ORDER_SHORTEST: "сначала короткие",
+    ORDER_LONGEST: "сначала длинные",
+}
+
+
+def parse_profiles(text):
+    """Список профилей из строки "368x208,480x272"; ValueError для неизвестных"""
+    profiles = [name.strip().lower() for name in text.split(",") if name.strip()]
+    unknown = [name for name in profiles if name not in PSP_PROFILES]
+    if unknown or not profiles:
+        raise ValueError(f"Неизвестный профиль: {', '.join(unknown) or text!r} (доступны {', '.join(PSP_PROFILES)})")
+    return profiles
+
+
+def profile_size(profile, aspect_ratio):
+    """Разрешение профиля для видео с соотношением сторон aspect_ratio"""
+    size = PSP_PROFILES[profile]
+    if size:
+        return size
+    if abs(aspect_ratio - 4/3) < 0.2:  # 4:3 видео
+        return 320, 240
+    return 368, 208  # 16:9 видео
+
+
+def scale_filter(width, height):
+    """Масштабирование с сохранением пропорций и полосами до width x height"""
+    return f"scale={width}:{height}:force_original_aspect_ratio=decrease,pad={width}:{height}:(ow-iw)/2:(oh-ih)/2"
+
+
+def encoder_from_choice(choice):
+    """Ключ энкодера по тексту из интерфейса или командной строки"""
+    text = (choice or "").lower()
+    if text in ENCODER_NAMES:
+        return text
+    if "gpu + cpu" in text:
+        return "auto"
+    if "amd" in text:
+        return "amf"
+    if "nvidia" in text:
+        return "nvenc"
+    if "intel" in text:
+        return "qsv"
+    return "cpu"
+
+
+def is_psp_fps(fps):
+    return abs(fps - 29.97) < 0.05 or abs(fps - 30) < 0.05
+
+
+def is_psp_profile(profile):
+    profile = (profile or "").lower()
+    return "baseline" in profile or profile == "main"
+
+
+def option_value(params, *names):
+    """Значение первого найденного параметра кодера ("-profile:v", "-profile", ...)"""
+    for name in names:
+        if name in params[:-1]:
+            return params[params.index(name) + 1]
+    return None
+
+
+def encoder_profile(params):
+    """Профиль H.264 из параметров кодера; у AMF он задается числом"""
+    value = option_value(params, "-profile:v", "-profile")
+    if value and value.isdigit():
+        return {256: "Constrained Baseline", 257: "Constrained High"}.get(int(value)) or AVC_PROFILES.get(int(value))
+    return value.replace("_", " ").title() if value else None
+
+
+def encoder_level(params):
+    """Уровень H.264 из параметров кодера ("30" или "3.0") в виде 30"""
+    value = option_value(params, "-level:v", "-level")
+    try:
+        level = float(value)
+    except (TypeError, ValueError):
+        return None
+    return int(round(level * 10)) if level < 10 else int(level)
+
+
+def is_psp_level(level):
+    # Уровень неизвестен — не считаем это нарушением
+    return not level or level <= 30
+
+
+def psp_video_compliant(video):
+    """Видеодорожку можно скопировать на PSP без перекодирования"""
+    return bool(
+        video
+        and video.codec_name == "h264"
+        and (video.width, video.height) in PSP_RESOLUTIONS
+        and is_psp_fps(video.fps)
+        and is_psp_profile(video.profile)
+        and is_psp_level(video.level)
+        and not video.rotation
+        and video.pix_fmt in (None, "yuv420p")
+        and (not video.bit_rate or video.bit_rate <= PSP_MAX_VIDEO_BITRATE)
+    )
+
+
+def psp_audio_compliant(audio):
+    """Аудиодорожку можно скопировать на PSP без перекодирования"""
+    return bool(
+        audio
+        and audio.codec_name == "aac"
+        and audio.sample_rate == 44100
+        and 0 < audio.channels <= 2
+    )
+
+
+def find_ffprobe(ffmpeg_path):
+    """ffprobe из той же папки, что и ffmpeg"""
+    if not ffmpeg_path:
+        return None
+    directory, name = os.path.split(ffmpeg_path)
+    candidate = os.path.join(directory, name.lower().replace("ffmpeg", "ffprobe"))
+    if directory and os.path.exists(candidate):
+        return candidate
+    return shutil.which("ffprobe")
+
+
+def get_current_time():
+    """Получение текущего времени"""
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+class ConversionEngine:
+    """Конвертация папки с видео в структуру MP_ROOT/100ANV01 для PSP.
+
+    События передаются в on_event кортежами ("log", msg, tag),
+    ("progress", value, text), ("file_progress", index, info),
+    ("warn", msg), ("success", msg), ("finish", None).
+    """
+
+    # Потоков libx264 на одну задачу: при 368x208 кодер не масштабируется дальше
+    CPU_THREADS_PER_JOB = 4
+    # Одновременных сессий аппаратного кодера (потребительские GPU ограничены)
+    GPU_MAX_SESSIONS = 2
+    # Не чаще раза за столько секунд промежуточный прогресс файла и пакета уходит в on_event
+    PROGRESS_INTERVAL = 0.25
+    # Файлов, которые ищутся до запуска задач: маленькой папке число задач подбирается по ней
+    PREFETCH_FILES = 32
+
+    def __init__(self, ffmpeg_path=None, on_event=None, probe_cache=True, capability_cache=True):
+        self.ffmpeg_path = ffmpeg_path or find_ffmpeg()
+        self.ffprobe_path = find_ffprobe(self.ffmpeg_path)
+        self.on_event = on_event or (lambda event: None)
+
+        # capability_cache: как probe_cache — True, путь к файлу, объект CapabilityCache или None
+        if capability_cache is True or isinstance(capability_cache, str):
+            capability_cache = CapabilityCache(capability_cache if isinstance(capability_cache, str) else None)
+        self.capability_cache = capability_cache if capability_cache else None
+
+        # probe_cache: True — кэш по умолчанию, путь к файлу, объект ProbeCache или None
+        if probe_cache is True or isinstance(probe_cache, str):
+            try:
+                probe_cache = ProbeCache(probe_cache if isinstance(probe_cache, str) else None)
+            except (OSError, sqlite3.Error):
+                probe_cache = None
+        self.probe_cache = probe_cache if probe_cache else None
+
+        # Настройки конвертации
+        self.encoder = "cpu"  # "auto" — все найденные GPU-кодеры и CPU одновременно
+        self.lanes = None  # готовый список EncoderLane вместо подбора по encoder
+        self.workers = 0  # 0 — подобрать автоматически
+        # Проверка результата: False — по параметрам кодирования и итогам ffmpeg,
+        # True — по заголовку moov готового файла (без запуска процессов)
+        self.deep_verify = False
+        self.thumb_path = None  # общая обложка .THM для всех файлов
+        self.auto_thumbs = True  # без общей обложки — кадр из каждого видео
+        self.cover_cache = CoverCache()
+        self.frame_extractor = FrameExtractor(self)
+        self.use_manifest = True  # пропускать файлы, уже сконвертированные с теми же настройками
+        self.force = False  # перекодировать все, даже актуальные
+        self.allow_stream_copy = True  # не перекодировать уже совместимые дорожки
+        # Профили вывода (PSP_PROFILES); несколько — все кодируются одним запуском ffmpeg
+        # из одного декодирования, первый пишется в обычный MP_ROOT
+        self.profiles = []
+        # Длинные файлы (от segment_min_duration секунд) кодируются частями параллельно; 0 — выключено
+        self.segment_min_duration = 0
+        self.segment_count = 0  # 0 — подобрать по числу ядер
+        self.job_timeout = 0  # предел времени одного запуска ffmpeg, секунд; 0 — без предела
+        self.stall_timeout = 300  # ffmpeg без вывода столько секунд считается зависшим; 0 — не проверять
+        # Подбор пресета libx264 по пробным кодированиям (результат хранится для класса исходников)
+        self.tune = False
+        self.quality_floor = DEFAULT_QUALITY_FLOOR  # минимальный SSIM
+        self.tuner = None
+        self.adaptive_bitrate = False  # битрейт видео по сложности каждого файла вместо 768k
+        # Раскладка по картам памяти: объем карты в байтах (0 — выключено) и предел числа карт
+        self.capacity = 0
+        self.max_sticks = 0
+        self.packing = None  # путь -> (номер карты, предел битрейта видео)
+        # Куда писать: папка для MP_ROOT (None — рядом с исходниками) и рабочая папка
+        # для временных файлов (None — сразу в папку назначения, "auto" — системная
+        # временная папка, если она на другом диске)
+        self.output_root = None
+        self.scratch_dir = None
+        # Шаблоны glob для пути относительно папки или имени файла
+        self.include = []  # если заданы — конвертируются только совпавшие файлы
+        self.exclude = []  # файлы и папки, которые пропускаются
+        # Очередь пакета: порядок (ORDER_*), шаблоны glob файлов, которые идут первыми,
+        # повторы после ошибки с паузой retry_backoff, удваивающейся с каждой попыткой
+        self.order = ORDER_SCAN
+        self.priority = []
+        self.retries = 1
+        self.retry_backoff = 10.0
+        # После стольких неудачных попыток подряд (между запусками) файл пропускается; 0 — никогда
+        self.dead_letter_after = 3
+        self.retry_dead = False  # вернуть в очередь файлы из списка проблемных
+        # Замеры этапов: NullMetrics — выключены, Metrics() — отчет по пакету и /metrics
+        self.metrics = NullMetrics()
+        self.metrics_report = None  # путь JSON-отчета, перезаписывается после каждого пакета
+
+        self.input_folder = None
+        self.stop_requested = False
+        self.total_files = 0
+        self.current_progress = 0
+        self.completed_files = 0
+        self.failed_files = 0
+        self.skipped_files = 0
+        self.dead_files = 0
+        self.threads_per_job = 0
+        self.batch_workers = 1
+        self.batch = None
+        self.scanner = None  # идет обход папки, total_files еще растет
+        self.manifest = None
+        self.available_encoders = {"nvenc": False, "amf": False, "qsv": False}
+        self.gpu_info = {"vendor": "unknown", "model": "unknown", "supports_amf": False}
+
+        # Все процессы ffmpeg запускаются и останавливаются через супервизор
+        self.supervisor = FFmpegSupervisor()
+        self.process_lock = threading.Lock()
+        self.name_lock = threading.Lock()
+        self._name_indexes = {}  # папка PSP -> NameIndex (строится один раз за пакет)
+        self._progress_sent = {}  # ключ прогресса -> время последней отправки
+        self._retries = {}  # путь -> (неудачных попыток в пакете, кодер для повтора)
+        self._scratch_warned = False  # о нехватке места в scratch_dir уже сообщено в этом пакете
+        self._job_ctx = threading.local()
+
+    def emit(self, *event):
+        self.on_event(event)
+
+    def log(self, msg, tag=None):
+        prefix = getattr(self._job_ctx, "prefix", "")
+        if prefix:
+            msg = "\n".join(f"{prefix} {line}" if line else line for line in msg.split("\n"))
+        self.emit("log", msg, tag)
+
+    def detect_gpu(self, refresh=False):
+        """Определение конкретной модели GPU (результат кэшируется)"""
+        try:
+            gpu_info = self.capability_cache.gpu_info(refresh) if self.capability_cache else detect_gpu_info()
+        except Exception as e:
+            self.log(f"Ошибка определения GPU: {e}", "warning")
+            gpu_info = {"vendor": "unknown", "model": "unknown", "supports_amf": False}
+
+        self.gpu_info = gpu_info
+        return gpu_info
+
+    def detect_encoders(self, refresh=False):
+        """Определение работающих GPU-энкодеров (пробное кодирование, результат кэшируется)"""
+        encoders = {key: False for key in HW_ENCODERS}
+
+        if not self.ffmpeg_path:
+            self.available_encoders = encoders
+            return encoders
+
+        try:
+            if self.capability_cache:
+                capabilities = self.capability_cache.capabilities(self.ffmpeg_path, refresh)
+            else:
+                capabilities = detect_capabilities(self.ffmpeg_path)
+            encoders.update(capabilities["hardware"])
+        except Exception as e:
+            self.log(f"Ошибка проверки энкодеров: {e}", "warning")
+
+        self.available_encoders = encoders
+        return encoders
+
+    def log_available_encoders(self):
+        if not self.ffmpeg_path:
+            self.log("❌ FFMPEG НЕ НАЙДЕН!", "error")
+            return
+
+        if not self.ffprobe_path:
+            self.log("⚠️ ffprobe не найден — параметры видео читаются из вывода ffmpeg -i (без уровня H.264)", "warning")
+
+        # Информация о GPU
+        self.log(f"\n🔍 Обнаружено GPU: {self.gpu_info['model']}", "info")
+        self.log(f"   Производитель: {self.gpu_info['vendor'].upper()}")
+
+        lines = ["\n📊 Доступные энкодеры:"]
+
+        # AMD
+        if self.available_encoders["amf"]:
+            lines.append("  ✅ AMD AMF (H.264) - для AMD")
+        else:
+            lines.append("  ❌ AMD AMF - не обнаружен")
+
+        # NVIDIA
+        if self.available_encoders["nvenc"]:
+            lines.append("  ✅ NVIDIA NVENC")
+        else:
+            lines.append("  ❌ NVIDIA NVENC - не обнаружен")
+
+        # Intel
+        if self.available_encoders["qsv"]:
+            lines.append("  ✅ Intel QSV")
+        else:
+            lines.append("  ❌ Intel QSV - не обнаружен")
+
+        # CPU
+        lines.append("  ✅ CPU (libx264) - РЕКОМЕНДУЕТСЯ для PSP")
+
+        self.log("\n".join(lines))
+
+    def request_stop(self):
+        self.stop_requested = True
+        self.log("⏹ Остановка...", "warning")
+        self.supervisor.cancel_all()
+
+    def rename_to_psp_format(self, input_folder):
+        """Переименование существующих файлов в формат PSP"""
+        psp_video_dir = os.path.join(input_folder, PSP_ROOT_DIR, PSP_VIDEO_DIR)
+        if not os.path.exists(psp_video_dir):
+            raise FileNotFoundError(psp_video_dir)
+
+        # Порядок имен фиксирован — номера не зависят от порядка в каталоге ФС
+        files = sorted(f for f in os.listdir(psp_video_dir) if f.endswith('_PSP.mp4') or f.endswith('.MP4') and not f.startswith('M4V'))
+
+        if not files:
+            self.log("Нет файлов для переименования")
+            return 0
+
+        renamed = 0
+        index = NameIndex(psp_video_dir)
+
+        # Исходники этих файлов неизвестны — в каталог они не записываются,
+        # индекс нужен только для свободных номеров
+        for file in files:
+            old_path = os.path.join(psp_video_dir, file)
+            new_path = index.allocate()
+            new_name = os.path.basename(new_path)
+            try:
+                os.rename(old_path, new_path)
+            finally:
+                index.release(new_path)
+
+            # Создаем информационный файл
+            info_file = os.path.join(psp_video_dir, f"{os.path.splitext(new_name)[0]}.txt")
+            with open(info_file, 'w', encoding='utf-8') as f:
+                f.write(f"Оригинальный файл: {file}\n")
+                f.write(f"PSP файл: {new_name}\n")
+                f.write(f"Дата: {get_current_time()}\n")
+
+            renamed += 1
+            self.log(f"  ✅ {file} -> {new_name}")
+
+        self.log(f"📝 Переименовано файлов: {renamed}")
+        return renamed
+
+    def scan(self, input_folder):
+        """Ленивый обход папки: видео без MP_ROOT и рабочих файлов, с учетом include/exclude"""
+        return VideoScanner(input_folder, is_source_video, is_work_dir, self.include, self.exclude)
+
+    def find_videos(self, input_folder):
+        return list(self.scan(input_folder))
+
+    def process_folder(self, input_folder):
+        """Конвертация всех видео в папке; возвращает сводку по пакету.
+
+        Задачи запускаются, пока обход дерева еще идет. Раскладке по картам
+        и упорядочиванию очереди нужен полный список, поэтому с capacity,
+        order или priority папка обходится целиком.
+        """
+        self.stop_requested = False
+        scanner = self.scan(input_folder)
+        full = self.capacity or self.order != ORDER_SCAN or self.priority
+        return self.process_files(input_folder, list(scanner) if full else scanner)
+
+    def process_files(self, input_folder, files, extend_sticks=False):
+        """Конвертация файлов из папки input_folder; возвращает сводку.
+
+        files — список или VideoScanner, из которого задачи берутся по мере обхода.
+        extend_sticks — раскладка по картам дополняет уже записанные STICKn
+        (следующие пакеты --watch), а не начинается с пустой STICK1.
+        """
+        self.input_folder = input_folder
+        self.completed_files = 0
+        self.failed_files = 0
+        self.skipped_files = 0
+        self.dead_files = 0
+        self.packing = None
+        self.scanner = None
+        self._name_indexes = {}
+        self._retries = {}
+        self._scratch_warned = False
+        self.metrics.begin_batch()
+        if self.scratch_dir and self.scratch_dir != SCRATCH_AUTO and not prepare_scratch(self.scratch_dir):
+            self.log(f"⚠️ Не удалось создать рабочую папку {self.scratch_dir} — файлы пишутся сразу в папку назначения", "warning")
+            self._scratch_warned = True
+
+        jobs = None
+        if isinstance(files, VideoScanner):
+            source = iter(files)
+            head = list(itertools.islice(source, self.PREFETCH_FILES))
+            if files.finished.is_set():
+                files = head  # папка небольшая — обход уже закончен
+            else:
+                self.scanner = files
+                jobs = self._stream_jobs(head, source)
+        files = list(files) if jobs is None else []
+
+        if files and self.capacity:
+            used = stick_usage(self.output_root or input_folder) if extend_sticks else ()
+            packing = self.plan_capacity(files, used=used)
+            self.report_packing(packing)
+            self.packing = packing.assignments()
+            files = [fp for fp in files if os.path.normpath(fp) in self.packing]
+
+        if files and (self.order != ORDER_SCAN or self.priority):
+            files = self.order_files(files)
+
+        if jobs is None:
+            self.total_files = len(files)
+            if not self.total_files:
+                self.emit("warn", "Видео не найдены")
+                self._finish()
+                self._write_metrics_report()
+                return self._summary()
+            self.log(f"\n📊 Найдено файлов: {self.total_files}")
+            jobs = enumerate(files, 1)
+        else:
+            self.total_files = self.PREFETCH_FILES
+            self.log(f"\n🔎 Найдено уже {self.total_files} файлов, поиск продолжается параллельно с конвертацией")
+
+        # Пока обход не закончен, число файлов неизвестно и задачи не ограничиваются им
+        scheduler = LaneScheduler(self.lanes or self._plan_lanes(None if self.scanner else self.total_files))
+        self.batch_workers = scheduler.slots
+        self.log(f"⚡ Параллельных задач: {scheduler.slots}, потоков на задачу: {self.threads_per_job or 'авто'}")
+        if len(scheduler.lanes) > 1:
+            self.log("   " + ", ".join(f"{ENCODER_NAMES.get(lane.encoder, lane.encoder)} × {lane.limit}" for lane in scheduler.lanes))
+
+        self.batch = BatchProgress(self.total_files)
+        self.manifest = self._open_manifest(input_folder)
+        if self.manifest is not None and self.retry_dead:
+            revived = self.manifest.revive()
+            if revived:
+                self.log(f"🔁 Проблемные файлы возвращены в очередь: {revived}")
+
+        try:
+            scheduler.run(
+                jobs,
+                lambda job, lane: self._convert_job(*job, lane=lane),
+                stop=lambda: self.stop_requested,
+                on_error=self._job_crashed,
+            )
+        finally:
+            if self.manifest is not None:
+                self.manifest.close()
+                self.manifest = None
+
+        self.scanner = None
+        if self.skipped_files - self.dead_files:
+            self.log(f"\n⏭ Пропущено без изменений: {self.skipped_files - self.dead_files}")
+        if self.dead_files:
+            self.log(f"⛔ Пропущено проблемных файлов: {self.dead_files} (повторить — --retry-dead)", "warning")
+
+        if self.stop_requested:
+            self.log("⏹ Прервано пользователем", "warning")
+        else:
+            self.emit("success", "✨ Конвертация завершена!")
+        self._finish()
+        self._write_metrics_report()
+        return self._summary()
+
+    def _stream_jobs(self, head, source):
+        """Задачи (номер, путь) по мере обхода; счетчик найденных растет вместе с ними"""
+        reported = 0.0
+        index = 0
+        for index, fp in enumerate(itertools.chain(head, source), 1):
+            if index > self.total_files:
+                self.total_files = index
+                self.batch.set_total(index)
+                now = time.monotonic()
+                if now - reported >= 0.5:
+                    reported = now
+                    self._emit_batch_progress()
+            yield index, fp
+
+        self.total_files = index
+        self.batch.set_total(index)
+        self.scanner = None
+        self.log(f"\n📊 Поиск завершен, найдено файлов: {index}")
+        self._emit_batch_progress()
+
+    def watch_folder(self, input_folder, settle=10.0, poll_interval=5.0):
+        """Конвертация папки и затем новых файлов по мере появления, до request_stop.
+
+        Файл берется в работу, когда его размер не меняется settle секунд.
+        Каталоги отслеживаются через inotify (Linux) или опросом их mtime.
+        """
+        self.stop_requested = False
+        scanner = self.scan(input_folder)
+        watcher = FolderWatcher(input_folder, scanner.accepts, scanner.skips_dir, settle, poll_interval)
+        # Наблюдение начинается до первого прохода — файлы, скопированные во время него, не теряются
+        watcher.start()
+        self.log(f"👀 Наблюдение за папкой ({watcher.mode}), остановка — Ctrl+C")
+
+        processed = {}
+        batches = 0
+        try:
+            files = list(scanner)
+            while not self.stop_requested:
+                files = [fp for fp in files if processed.get(fp) != self._file_state(fp)]
+                if files:
+                    self.process_files(input_folder, files, extend_sticks=batches > 0)
+                    batches += 1
+                    processed.update((fp, self._file_state(fp)) for fp in files)
+                files = watcher.wait_ready(timeout=1.0)
+        finally:
+            watcher.stop()
+        return {"batches": batches, "files": len(processed), "stopped": self.stop_requested}
+
+    @staticmethod
+    def _file_state(path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return st.st_size, st.st_mtime_ns
+
+    def plan_capacity(self, files, capacity=None, max_sticks=None, used=()):
+        """Раскладка файлов по картам по прогнозу размеров, без кодирования"""
+        self.probe_many(files)
+        items = []
+        for fp in files:
+            plan = self.plan(fp, analyze=False)
+            item = PackItem(plan["input_file"], plan["duration"])
+            if plan["mode"] == MODE_ENCODE:
+                item.video_rate = parse_bitrate(plan["video_bitrate"])
+                item.audio_rate = parse_bitrate(plan["audio_bitrate"]) if plan["info"].audio else 0
+                item.complexity = plan["info"].complexity_at(plan["width"], plan["height"])
+                # Без замера сложности прогноз идет по пределу битрейта: libx264 с CRF тратит меньше,
+                # а с --adaptive-bitrate битрейт выберется при кодировании и может оказаться ниже
+                item.upper_bound = not item.complexity and (
+                    self.adaptive_bitrate or "-crf" in plan["encoder_config"]["params"]
+                )
+            else:
+                item.fixed_size = plan["predicted_size"]
+            items.append(item)
+        return pack(
+            items,
+            capacity or self.capacity,
+            self.max_sticks if max_sticks is None else max_sticks,
+            used,
+        )
+
+    def report_packing(self, packing):
+        lines = [f"\n💾 Раскладка по картам {format_size(packing.capacity)}: {len(packing.sticks)} шт."]
+        if packing.video_cap:
+            lines.append(f"   Битрейт видео снижен до {format_bitrate(packing.video_cap)}, чтобы все поместилось")
+        for n, stick in enumerate(packing.sticks):
+            size = packing.stick_size(n)
+            line = (
+                f"   {STICK_DIR.format(n + 1)}: файлов {len(stick)}, ~{format_size(size)}"
+                f" ({size / packing.usable * 100:.0f}%)"
+            )
+            if n < len(packing.used) and packing.used[n]:
+                line += f", из них записано раньше {format_size(packing.used[n])}"
+            lines.append(line)
+        estimated = packing.upper_bounds
+        if estimated:
+            if self.adaptive_bitrate:
+                reason = f"битрейт по сложности выбирается при кодировании, прогноз — по {format_bitrate(MAX_VIDEO_BITRATE)}"
+            else:
+                reason = "CRF обычно дает меньше"
+            lines.append(
+                f"   ℹ️ Для файлов без замера сложности ({len(estimated)}) размер — верхний предел: "
+                f"{reason}, и карты заполнятся не полностью"
+            )
+        self.log("\n".join(lines))
+        for stick in packing.sticks:
+            for item in stick:
+                cap = item.cap_at(packing.video_cap)
+                if item.own_cap and cap == item.own_cap:
+                    self.log(
+                        f"⚠️ Больше карты — битрейт видео снижен до {format_bitrate(cap)}: "
+                        f"{os.path.relpath(item.path, self.input_folder or '.')}",
+                        "warning",
+                    )
+        if self.max_sticks and len(packing.sticks) > self.max_sticks:
+            self.log(f"⚠️ Даже при минимальном битрейте нужно карт: {len(packing.sticks)} (лимит {self.max_sticks})", "warning")
+        for item in packing.oversized:
+            self.log(
+                f"⚠️ Не помещается на карту даже при битрейте {format_bitrate(MIN_VIDEO_BITRATE)} и пропущен: "
+                f"{os.path.relpath(item.path, self.input_folder or '.')}",
+                "warning",
+            )
+
+    def _summary(self):
+        summary = {
+            "total": self.total_files,
+            "completed": self.completed_files,
+            "failed": self.failed_files,
+            "skipped": self.skipped_files,
+            "dead": self.dead_files,
+            "stopped": self.stop_requested,
+        }
+        if self.metrics.enabled:
+            summary["metrics"] = self.metrics.report()
+        return summary
+
+    def _write_metrics_report(self):
+        if not (self.metrics.enabled and self.metrics_report):
+            return
+        try:
+            self.metrics.write_report(self.metrics_report)
+        except OSError as e:
+            self.log(f"⚠️ Отчет метрик не записан: {e}", "warning")
+
+    def _priority_rank(self, fp):
+        """Номер первого совпавшего шаблона priority; len(priority) — не приоритетный"""
+        rel_path = os.path.relpath(fp, self.input_folder).replace(os.sep, "/")
+        return next((n for n, pattern in enumerate(self.priority) if matches(rel_path, [pattern])), len(self.priority))
+
+    def order_files(self, files):
+        """Очередь пакета: сначала файлы по шаблонам priority (в порядке шаблонов), затем по order"""
+        rank = self._priority_rank if self.priority else None
+
+        infos = {}
+        if self.order != ORDER_SCAN:
+            # Длительности нужны до запуска задач — анализ всех файлов параллельно (и в кэш)
+            infos = dict(zip(files, self.probe_many(files)))
+
+        def cost(fp):
+            info = infos.get(fp)
+            if info is None:
+                return 0
+            # Длительность неизвестна — оценка по размеру, около 1 МБ на секунду
+            return info.duration or info.size / 1_000_000
+
+        ordered = order_jobs(files, cost, rank, self.order)
+        notes = []
+        if self.order != ORDER_SCAN:
+            notes.append(ORDER_NAMES[self.order])
+        if rank is not None:
+            notes.append(f"приоритетных файлов: {sum(1 for fp in files if rank(fp) < len(self.priority))}")
+        self.log(f"🔀 Очередь: {', '.join(notes)}")
+        return ordered
+
+    def _open_manifest(self, input_folder):
+        if not self.use_manifest:
+            return None
+        try:
+            return Manifest.for_folder(input_folder)
+        except (OSError, sqlite3.Error) as e:
+            self.log(f"⚠️ Манифест недоступен, все файлы будут перекодированы: {e}", "warning")
+            return None
+
+    def _plan_workers(self, total):
+        """Подбор числа параллельных задач и потоков кодера на задачу"""
+        cores = os.cpu_count() or 1
+        if self.encoder == "cpu":
+            threads = min(self.CPU_THREADS_PER_JOB, cores)
+            workers = max(1, cores // threads)
+        else:
+            threads = 0
+            workers = self.GPU_MAX_SESSIONS
+
+        if self.workers and self.workers > 0:
+            workers = self.workers
+            if self.encoder == "cpu":
+                threads = max(1, cores // workers)
+
+        workers = max(1, min(workers, total) if total is not None else workers)
+        if workers == 1:
+            threads = 0  # одна задача — ffmpeg сам использует все ядра
+        return workers, threads
+
+    def _plan_lanes(self, total):
+        """Дорожки кодирования для пакета; задает threads_per_job для CPU"""
+        if self.encoder != "auto":
+            workers, self.threads_per_job = self._plan_workers(total)
+            return [EncoderLane(self.encoder, workers)]
+
+        lanes = [
+            EncoderLane(encoder, self.GPU_MAX_SESSIONS)
+            for encoder in ("nvenc", "qsv", "amf")
+            if self.available_encoders.get(encoder)
+        ]
+        # Декодирование и масштабирование для GPU-задач тоже идут на CPU
+        cores = os.cpu_count() or 1
+        self.threads_per_job = min(self.CPU_THREADS_PER_JOB, cores)
+        cpu_workers = max(1, cores // self.threads_per_job - len(lanes))
+        if self.workers and self.workers > 0:
+            cpu_workers = max(1, self.workers - sum(lane.limit for lane in lanes))
+        lanes.append(EncoderLane("cpu", cpu_workers))
+        return lanes
+
+    def _convert_job(self, i, fp, lane=None):
+        """Конвертация одного файла в пуле потоков.
+
+        Возвращает паузу в секундах, если файл нужно повторить после ошибки
+        (задача вернется в очередь планировщика), иначе None.
+        """
+        if self.stop_requested:
+            return None
+
+        rel_path = os.path.relpath(fp, self.input_folder)
+        attempt, retry_encoder = self._retries.get(fp, (0, None))
+        header = f"\n[{i}/{self.total_files}] 📹 {rel_path}" + (f" — попытка {attempt + 1}" if attempt else "")
+
+        failed = skipped = dead = False
+        retry = None
+        plan = None
+        status, cause, bytes_out = STATUS_DONE, None, 0
+        self._job_ctx.index = i
+        self._job_ctx.lane = lane
+        self.metrics.begin_file(fp)
+        try:
+            try:
+                plan = self.plan(fp, encoder=retry_encoder)
+                if self._is_up_to_date(plan):
+                    skipped = True
+                    status = STATUS_SKIPPED
+                    self.log(f"[{i}/{self.total_files}] ⏭ {rel_path} — без изменений, пропуск")
+                elif self._is_dead(plan):
+                    skipped = dead = True
+                    status = STATUS_SKIPPED
+                    self.log(f"[{i}/{self.total_files}] ⛔ {rel_path} — в списке проблемных файлов, пропуск", "warning")
+                else:
+                    self.log(header)
+                    header = None
+                    self._job_ctx.prefix = f"[{i}]"
+                    # Повтор после ошибки аппаратного кодера идет на CPU и не влияет на счет ошибок дорожки
+                    output = self._convert_on_lane(plan, None if retry_encoder else lane)
+                    if self.metrics.enabled:
+                        bytes_out = os.path.getsize(output)
+            except Exception as e:
+                cause = REASON_CANCEL if self.stop_requested else failure_cause(e)
+                if header:
+                    self.log(header)
+                self._job_ctx.prefix = f"[{i}]"
+                gave_up = False
+                if self.manifest is not None and plan is not None:
+                    gave_up = self.manifest.mark_failed(
+                        plan["input_file"], e,
+                        counted=cause != REASON_CANCEL,
+                        dead_after=self.dead_letter_after,
+                    )
+                if cause != REASON_CANCEL and attempt < self.retries and not gave_up:
+                    status = STATUS_RETRIED
+                    retry = self.retry_backoff * 2 ** attempt
+                    self._retries[fp] = (attempt + 1, "cpu" if lane is not None and lane.hardware else retry_encoder)
+                    self.log(f"  ⚠️ Ошибка: {str(e)}", "warning")
+                    self.log(f"  🔁 Повтор {attempt + 1}/{self.retries} через {retry:g} с")
+                    self.metrics.count("retries")
+                else:
+                    failed = True
+                    status = STATUS_FAILED
+                    self.log(f"  ❌ Ошибка: {str(e)}", "error")
+                    if gave_up:
+                        self.log(f"  ⛔ Неудачных попыток подряд: {self.dead_letter_after} — файл в списке проблемных", "warning")
+        finally:
+            self.metrics.end_file(status, plan["size"] if plan else 0, bytes_out, cause)
+            self._job_ctx.prefix = ""
+            self._job_ctx.index = None
+            self._job_ctx.lane = None
+
+        if retry is not None:
+            # Файл снова ждет в очереди — его прогресс начинается заново
+            self.batch.update(i, 0)
+            self._emit_batch_progress()
+            return retry
+
+        with self.process_lock:
+            self.completed_files += 1
+            if failed:
+                self.failed_files += 1
+            if skipped:
+                self.skipped_files += 1
+            if dead:
+                self.dead_files += 1
+        if skipped:
+            self.batch.skip(i)
+        else:
+            self.batch.finish(i)
+        self._emit_batch_progress()
+        return None
+
+    def _job_crashed(self, job, error):
+        """Ошибка, вышедшая из _convert_job: файл считается неудачным, пакет продолжается"""
+        i, fp = job
+        self.log(f"[{i}] ❌ Внутренняя ошибка при обработке {os.path.basename(fp)}: {error}", "error")
+        with self.process_lock:
+            self.completed_files += 1
+            self.failed_files += 1
+        self.batch.finish(i)
+        self._emit_batch_progress()
+
+    def _convert_on_lane(self, plan, lane):
+        """Кодирование на дорожке; при ошибке аппаратного кодера — повтор на CPU"""
+        if lane is None:
+            return self.convert_plan(plan)
+        try:
+            result = self.convert_plan(plan)
+        except Exception as e:
+            if plan["mode"] != MODE_ENCODE or not lane.hardware or self.stop_requested:
+                raise
+            if lane.record(False):
+                self.log(f"  ⚠️ {ENCODER_NAMES.get(lane.encoder, lane.encoder)} отключен после {lane.failures} ошибок подряд", "warning")
+            if not lane.fallback:
+                raise
+            self.log(f"  ⚠️ {e} — повтор на CPU (libx264)", "warning")
+            # Неудачная попытка учитывается в причинах ошибок, даже если повтор удастся
+            self.metrics.failure(failure_cause(e))
+            self.metrics.count("retries")
+            return self.convert_plan(self.plan(plan["input_file"], encoder="cpu"))
+        # Перепаковка не задействует кодер и ничего не говорит о его исправности
+        if plan["mode"] == MODE_ENCODE:
+            lane.record(True)
+        return result
+
+    def _is_up_to_date(self, plan):
+        """Есть ли актуальный результат для файла по манифесту"""
+        if self.manifest is None:
+            return False
+        for settings_hash in self._accepted_hashes(plan):
+            up_to_date, plan["fingerprint"] = self.manifest.check(plan["input_file"], settings_hash)
+            if up_to_date:
+                break
+        if up_to_date and not self.force:
+            # Манифест хранит только основной результат — файлы других профилей ищутся по каталогу папки
+            for output in plan.get("outputs", []):
+                if self.name_index(output["psp_video_dir"]).output_for(plan["input_file"]) is None:
+                    return False
+        return up_to_date and not self.force
+
+    def _is_dead(self, plan):
+        """Исходник в списке проблемных манифеста (с force пробуется снова)"""
+        if self.manifest is None or self.force:
+            return False
+        return self.manifest.is_dead(plan["input_file"], plan.get("fingerprint"))
+
+    def _accepted_hashes(self, plan):
+        """Хэш настроек плана и тех же настроек на других кодерах пакета.
+
+        При смешанном пакете файл мог быть сконвертирован другим кодером
+        или повторно на CPU — такой результат тоже считается актуальным.
+        """
+        hashes = [plan["settings_hash"]]
+        lane = getattr(self._job_ctx, "lane", None)
+        if lane is None or plan["mode"] != MODE_ENCODE:
+            return hashes
+        encoders = {"cpu"} | {other.encoder for other in (self.lanes or [])}
+        if self.encoder == "auto":
+            encoders |= {encoder for encoder, ok in self.available_encoders.items() if ok}
+        for encoder in sorted(encoders - {lane.encoder}):
+            # get_encoder_config берет config дорожки этого кодера, если она задана
+            other = dict(plan, encoder_config=self.get_encoder_config(encoder))
+            hashes.append(self.settings_hash(other))
+        return hashes
+
+    def _progress_due(self, key):
+        """Пора ли отправить промежуточный прогресс (не чаще PROGRESS_INTERVAL)"""
+        now = time.monotonic()
+        with self.process_lock:
+            if now - self._progress_sent.get(key, 0.0) < self.PROGRESS_INTERVAL:
+                return False
+            self._progress_sent[key] = now
+            return True
+
+    def _emit_batch_progress(self, force=True):
+        """Общий прогресс пакета с ETA, взвешенный по длительности"""
+        if not self._progress_due("batch") and not force:
+            return
+        info = self.batch.snapshot()
+        self.current_progress = info["fraction"]
+        text = f"{info['done_files']}/{info['total_files']}"
+        if self.scanner is not None:
+            # Обход еще идет: показываем найденное на данный момент, ETA неизвестна
+            text += f"+ · поиск в {self.scanner.dirs_scanned} папках"
+        elif info["eta"] is not None and info["done_files"] < info["total_files"]:
+            text += f" · осталось ~{format_duration(info['eta'])}"
+        self.emit("progress", self.current_progress, text)
+
+    def _report_file_progress(self, progress):
+        index = getattr(self._job_ctx, "index", None)
+        if self.batch and index is not None:
+            self.batch.update(index, progress.out_time)
+        # Блоки -progress идут от каждого ffmpeg и каждой части — в события попадает не больше PROGRESS_INTERVAL
+        if progress.finished or self._progress_due(index):
+            self.emit("file_progress", index, progress.snapshot())
+        if self.batch and index is not None:
+            self._emit_batch_progress(force=False)
+
+    def _finish(self):
+        self.emit("finish", None)
+
+    def get_encoder_config(self, encoder=None):
+        """Получение конфигурации энкодера (готовая config дорожки важнее встроенной)"""
+        lane = getattr(self._job_ctx, "lane", None)
+        if encoder is None and lane is not None:
+            encoder = lane.encoder
+            if lane.config is not None:
+                return dict(lane.config)
+        encoder = encoder or self.encoder
+        for other in self.lanes or []:
+            if other.encoder == encoder and other.config is not None:
+                return dict(other.config)
+        if encoder == "amf":
+            return self._get_amf_config()
+        elif encoder == "nvenc":
+            return self._get_nvenc_config()
+        elif encoder == "qsv":
+            return self._get_qsv_config()
+        else:
+            return self._get_cpu_config()
+
+    def _get_amf_config(self):
+        """Конфигурация для AMD AMF"""
+        return {
+            "vcodec": "h264_amf",
+            "params": [
+                "-quality", "speed",
+                "-rc", "cbr",
+                "-profile", "100",  # 100 = baseline
+                "-level", "30",
+                "-bf", "0",
+                "-usage", "transcoding",
+            ],
+            "log": "🎮 Используется AMD AMF (экспериментально)"
+        }
+
+    def _get_nvenc_config(self):
+        """Конфигурация для NVIDIA NVENC"""
+        return {
+            "vcodec": "h264_nvenc",
+            "params": [
+                "-preset", "p4",
+                "-tune", "hq",
+                "-profile:v", "baseline",
+                "-level:v", "30",
+                "-rc", "cbr",
+                "-bf", "0",
+            ],
+            "log": "🎮 Используется NVIDIA NVENC (экспериментально)"
+        }
+
+    def _get_qsv_config(self):
+        """Конфигурация для Intel QSV"""
+        return {
+            "vcodec": "h264_qsv",
+            "params": [
+                "-preset", "fast",
+                "-profile:v", "baseline",
+                "-level:v", "30",
+                "-rc_mode", "CBR",
+                "-bf", "0",
+            ],
+            "log": "🎮 Используется Intel QSV (экспериментально)"
+        }
+
+    def _get_cpu_config(self):
+        """Конфигурация для CPU (рекомендуется для PSP)"""
+        return {
+            "vcodec": "libx264",
+            "params": [
+                "-preset", "fast",
+                "-tune", "fastdecode",
+                "-profile:v", "baseline",
+                "-level:v", "30",
+                "-crf", "23",
+                "-threads", str(self.threads_per_job),
+                "-bf", "0",
+                "-refs", "1",
+                "-weightp", "0",
+            ],
+            "log": "💻 Используется CPU (рекомендуется для PSP)"
+        }
+
+    def convert_file(self, input_file):
+        """Полный цикл для одного файла: анализ, план, кодирование, упаковка"""
+        return self.convert_plan(self.plan(input_file))
+
+    def convert_plan(self, plan):
+        """Кодирование и упаковка файла по готовому плану"""
+        if not self.ffmpeg_path:
+            raise Exception("FFmpeg не найден")
+
+        index = getattr(self._job_ctx, "index", None)
+        if self.batch and index is not None:
+            self.batch.add_file(index, plan["duration"])
+
+        self._prepare_output_dir(plan)
+        self._log_plan(plan)
+
+        # Временный файл (уникален для потока — соседние задачи могут иметь одно имя)
+        os.makedirs(plan["work_dir"], exist_ok=True)
+        plan["temp_output"] = os.path.join(plan["work_dir"], f"{WORK_PREFIX}temp_{plan['safe_base_name']}_{threading.get_ident()}.mp4")
+        outputs = plan.get("outputs", [])
+        for output in outputs:
+            self._prepare_output_dir(output)
+            os.makedirs(output["work_dir"], exist_ok=True)
+            output["temp_output"] = os.path.join(
+                output["work_dir"],
+                f"{WORK_PREFIX}temp_{plan['safe_base_name']}_{output['width']}x{output['height']}_{threading.get_ident()}.mp4",
+            )
+
+        if self.manifest is not None:
+            previous = self.manifest.get(plan["input_file"])
+            if previous:
+                plan["previous_output"] = previous["output"]
+                # Остаток прерванного запуска
+                if previous["temp"] and previous["temp"] != plan["temp_output"]:
+                    self._remove_temp(previous["temp"])
+            if plan.get("fingerprint") is None:
+                _, plan["fingerprint"] = self.manifest.check(plan["input_file"], plan["settings_hash"])
+            self.manifest.mark_started(plan["input_file"], plan["fingerprint"], plan["settings_hash"], plan["temp_output"])
+
+        temp_output = self.encode(plan)
+        try:
+            final_output = self.package(plan, temp_output)
+            for output in outputs:
+                self.log(f"  🎞 Профиль {output['width']}x{output['height']}:")
+                self.package(output, output["temp_output"])
+        except Exception:
+            for output in outputs:
+                self._remove_temp(output["temp_output"])
+            raise
+
+        if self.manifest is not None:
+            self.manifest.mark_done(plan["input_file"], final_output)
+        return final_output
+
+    def plan(self, input_file, encoder=None, analyze=True):
+        """Выбор параметров кодирования и путей для одного файла.
+
+        analyze=False — без пробных кодирований (сложность, подбор пресета),
+        для быстрого прогноза размеров.
+        """
+        # Исправляем пути для Windows
+        input_file = os.path.normpath(input_file)
+
+        # Создаем безопасное имя файла
+        base_name = os.path.splitext(os.path.basename(input_file))[0]
+        safe_base_name = re.sub(r'[<>:"/\\|?*\[\]&]', '_', base_name)
+
+        output_dir = os.path.dirname(input_file)
+
+        # PSP требует строгую структуру папок
+        psp_root = os.path.join(self.output_root or output_dir, PSP_ROOT_DIR)
+        stick, video_cap = (self.packing or {}).get(input_file, (None, None))
+        if stick is not None:
+            # Раскладка по картам: у каждой карты свое дерево MP_ROOT в папке пакета
+            psp_root = os.path.join(self.output_root or self.input_folder, STICK_DIR.format(stick), PSP_ROOT_DIR)
+        psp_video_dir = os.path.join(psp_root, PSP_VIDEO_DIR)
+
+        # Получаем информацию о видео для определения оптимальных параметров
+        info = self.probe(input_file)
+        # Результат PSP почти всегда меньше исходника — его размер берется как запас места
+        work_dir = self._choose_work_dir(psp_video_dir, info.size)
+
+        # Определяем соотношение сторон при показе (SAR, поворот, обложки учтены)
+        aspect_ratio = info.display_aspect or 16/9
+
+        # Выбираем оптимальное разрешение для PSP
+        profiles = self.profiles or ["auto"]
+        video_width, video_height = profile_size(profiles[0], aspect_ratio)
+
+        # Уже совместимые дорожки копируются без перекодирования; для нескольких
+        # профилей видео все равно декодируется, и копия ничего не экономит
+        mode = MODE_ENCODE
+        if (
+            self.allow_stream_copy and len(profiles) == 1 and psp_video_compliant(info.video)
+            and (profiles[0] == "auto" or (info.width, info.height) == (video_width, video_height))
+        ):
+            video_width, video_height = info.width, info.height
+            mode = MODE_COPY if info.audio is None or psp_audio_compliant(info.audio) else MODE_COPY_VIDEO
+
+        plan = {
+            "input_file": input_file,
+            "base_name": base_name,
+            "safe_base_name": safe_base_name,
+            "output_dir": output_dir,
+            "psp_video_dir": psp_video_dir,
+            "work_dir": work_dir,
+            "stick": stick,
+            "duration": info.duration,
+            "size": info.size,
+            "info": info,
+            "mode": mode,
+            "width": video_width,
+            "height": video_height,
+            # Битрейт для PSP
+            "video_bitrate": "768k",
+            "audio_bitrate": "128k",
+            # Получаем конфигурацию энкодера
+            "encoder_config": self.get_encoder_config(encoder),
+        }
+        if self.adaptive_bitrate and mode == MODE_ENCODE and info.video and info.duration:
+            self._apply_adaptive_bitrate(plan, measure=analyze)
+        if video_cap and mode == MODE_ENCODE:
+            plan["video_bitrate"] = format_bitrate(min(parse_bitrate(plan["video_bitrate"]), video_cap))
+        if analyze and self.tune and mode == MODE_ENCODE and plan["encoder_config"]["vcodec"] == "libx264" and info.video:
+            self._apply_tuning(plan)
+        if mode == MODE_ENCODE and info.video and len(profiles) > 1:
+            plan["outputs"] = self._profile_plans(plan, profiles[1:], aspect_ratio)
+        plan["predicted_size"] = self.predict_size(plan)
+        plan["settings_hash"] = self.settings_hash(plan)
+        return plan
+
+    def _profile_plans(self, plan, profiles, aspect_ratio):
+        """Планы дополнительных профилей: те же битрейт и кодер, свои разрешение и папка"""
+        # <база>/MP_ROOT/100ANV01 -> <база>/PSP_480x272/MP_ROOT/100ANV01
+        base = os.path.dirname(os.path.dirname(plan["psp_video_dir"]))
+        sizes = {(plan["width"], plan["height"])}
+        outputs = []
+        for name in profiles:
+            width, height = profile_size(name, aspect_ratio)
+            if (width, height) in sizes:
+                continue
+            sizes.add((width, height))
+            psp_video_dir = os.path.join(base, PROFILE_DIR.format(f"{width}x{height}"), PSP_ROOT_DIR, PSP_VIDEO_DIR)
+            output = dict(
+                plan,
+                width=width,
+                height=height,
+                psp_video_dir=psp_video_dir,
+                work_dir=self._choose_work_dir(psp_video_dir, plan["size"]),
+            )
+            output["predicted_size"] = self.predict_size(output)
+            outputs.append(output)
+        return outputs
+
+    def _choose_work_dir(self, dest_dir, needed):
+        """Рабочая папка файла; о возврате к папке назначения из-за места сообщается раз за пакет"""
+        work_dir = choose_work_dir(dest_dir, self.scratch_dir, needed)
+        if (
+            work_dir == dest_dir
+            and self.scratch_dir
+            and self.scratch_dir != SCRATCH_AUTO
+            and not self._scratch_warned
+        ):
+            self._scratch_warned = True
+            self.log(
+                f"⚠️ Мало места в рабочей папке {self.scratch_dir} — "
+                f"часть файлов пишется сразу в папку назначения",
+                "warning",
+            )
+        return work_dir
+
+    def _apply_adaptive_bitrate(self, plan, measure=True):
+        """Битрейт видео по сложности файла.
+
+        Сложность зависит от разрешения результата, поэтому измеряется и
+        кэшируется с анализом отдельно для каждого WxH.
+        """
+        info = plan["info"]
+        complexity = info.complexity_at(plan["width"], plan["height"])
+        if not complexity and not measure:
+            # Сложность еще неизвестна — для прогноза берется верхний предел
+            plan["video_bitrate"] = format_bitrate(MAX_VIDEO_BITRATE)
+            return
+        if not complexity:
+            try:
+                with self.metrics.stage("complexity"):
+                    complexity = measure_complexity(self, plan)
+            except Exception as e:
+                self.log(f"  ⚠️ Анализ сложности не удался: {e}", "warning")
+                return
+            if complexity:
+                info.complexity[f"{plan['width']}x{plan['height']}"] = complexity
+            if self.probe_cache is not None and complexity:
+                try:
+                    self.probe_cache.put(plan["input_file"], info.to_dict())
+                except sqlite3.Error as e:
+                    self._disable_probe_cache(e)
+        if complexity:
+            plan["video_bitrate"] = format_bitrate(choose_bitrate(complexity))
+
+    def predict_size(self, plan):
+        """Ожидаемый размер результата в байтах"""
+        info = plan["info"]
+        if plan["mode"] == MODE_COPY:
+            return info.size
+        audio_rate = parse_bitrate(plan["audio_bitrate"]) if info.audio else 0
+        if plan["mode"] == MODE_COPY_VIDEO:
+            video_rate = info.video.bit_rate or max(0, info.bit_rate - (info.audio.bit_rate if info.audio else 0))
+        else:
+            complexity = info.complexity_at(plan["width"], plan["height"])
+            video_rate = expected_video_rate(parse_bitrate(plan["video_bitrate"]), complexity)
+        return predict_size(plan["duration"], video_rate, audio_rate)
+
+    def _apply_tuning(self, plan):
+        """Пресет и CRF, подобранные для класса исходника"""
+        with self.name_lock:
+            if self.tuner is None or self.tuner.quality_floor != self.quality_floor:
+                self.tuner = PresetTuner(self, quality_floor=self.quality_floor)
+        try:
+            with self.metrics.stage("tune"):
+                profile = self.tuner.profile_for(plan)
+        except Exception as e:
+            self.log(f"  ⚠️ Подбор пресета не удался: {e}", "warning")
+            return
+        if profile:
+            plan["encoder_config"] = apply_profile(plan["encoder_config"], profile)
+            plan["tuning"] = profile
+
+    def _display_dir(self, path):
+        """Папка для лога: относительно папки пакета (PSP_480x272/MP_ROOT/100ANV01/), иначе полный путь"""
+        base = self.output_root or self.input_folder
+        if base:
+            rel_path = os.path.relpath(path, base)
+            if not rel_path.startswith(os.pardir):
+                return rel_path.replace(os.sep, "/") + "/"
+        return path
+
+    def _prepare_output_dir(self, plan):
+        try:
+            os.makedirs(plan["psp_video_dir"], exist_ok=True)
+            self.log(f"  📁 Создана структура папок: {self._display_dir(plan['psp_video_dir'])}")
+        except Exception as e:
+            self.log(f"  ⚠️ Ошибка создания папок: {e}", "warning")
+            if plan["work_dir"] == plan["psp_video_dir"]:
+                plan["work_dir"] = plan["output_dir"]
+            plan["psp_video_dir"] = plan["output_dir"]
+
+    def _log_plan(self, plan):
+        if plan["mode"] == MODE_COPY:
+            self.log(f"  ⚡ Исходник уже совместим с PSP ({plan['width']}x{plan['height']}) — перепаковка без перекодирования")
+            return
+        if plan["mode"] == MODE_COPY_VIDEO:
+            self.log(f"  ⚡ Видео совместимо с PSP ({plan['width']}x{plan['height']}) — копируется, перекодируется только аудио")
+            return
+
+        if plan.get("outputs"):
+            sizes = ", ".join(f"{p['width']}x{p['height']}" for p in [plan, *plan["outputs"]])
+            self.log(f"  📐 Профили: {sizes} — одно декодирование на все")
+        elif (plan["width"], plan["height"]) == (320, 240):
+            self.log(f"  📐 Формат 4:3 -> 320x240")
+        elif (plan["width"], plan["height"]) == (368, 208):
+            self.log(f"  📐 Формат 16:9 -> 368x208")
+        else:
+            self.log(f"  📐 Разрешение -> {plan['width']}x{plan['height']}")
+        self.log(plan["encoder_config"]["log"])
+
+    def settings_hash(self, plan):
+        """Хэш настроек, от которых зависит результат кодирования"""
+        cmd = self.build_command(plan, "")
+        # Пустые строки — пути результатов, их еще нет
+        args = [arg for arg in cmd[1:] if arg not in (plan["input_file"], "")]
+        # Число потоков зависит от загрузки пакета, а не от результата
+        if "-threads" in args:
+            pos = args.index("-threads")
+            del args[pos:pos + 2]
+        # Другая карта — другое место результата
+        if plan.get("stick") is not None:
+            args.append(f"stick={plan['stick']}")
+        return hashlib.sha1("\0".join(args).encode("utf-8")).hexdigest()[:16]
+
+    def build_command(self, plan, output_file):
+        """Команда ffmpeg для кодирования по плану"""
+        if plan.get("outputs"):
+            return self.build_multi_command(plan, output_file)
+        video = plan["info"].video if plan.get("info") else None
+
+        cmd = [
+            self.ffmpeg_path,
+            # Машиночитаемый прогресс в stdout, stderr только для сообщений
+            "-nostats",
+            "-progress", "pipe:1",
+            "-i", plan["input_file"],
+            # Основная видеодорожка (не обложка) и первая аудиодорожка, если есть
+            "-map", f"0:{video.index}" if video else "0:v:0",
+            "-map", "0:a:0?",
+        ]
+
+        if plan["mode"] == MODE_COPY:
+            cmd.extend(["-c", "copy"])
+        else:
+            cmd.extend(self.video_args(plan))
+            cmd.extend(self.audio_args(plan))
+
+        cmd.extend(self.container_args(output_file))
+        return cmd
+
+    def build_multi_command(self, plan, output_file):
+        """Одна команда на все профили плана: декодирование и fps один раз, split по профилям"""
+        video = plan["info"].video
+        targets = [(plan, output_file)] + [(output, output.get("temp_output", "")) for output in plan["outputs"]]
+        labels = "".join(f"[s{n}]" for n in range(len(targets)))
+        graph = [f"[0:{video.index}]fps=30000/1001,split={len(targets)}{labels}"]
+        graph.extend(f"[s{n}]{scale_filter(target['width'], target['height'])}[v{n}]" for n, (target, _) in enumerate(targets))
+
+        cmd = [
+            self.ffmpeg_path,
+            "-nostats",
+            "-progress", "pipe:1",
+            "-i", plan["input_file"],
+            "-filter_complex", ";".join(graph),
+        ]
+        # Параметры вывода относятся к следующему за ними файлу
+        for n, (target, path) in enumerate(targets):
+            cmd.extend(["-map", f"[v{n}]", "-map", "0:a:0?"])
+            cmd.extend(self.video_codec_args(target))
+            cmd.extend(self.audio_args(target))
+            cmd.extend(self.container_args(path))
+        return cmd
+
+    def video_args(self, plan):
+        """Параметры видеокодера"""
+        if plan["mode"] == MODE_COPY_VIDEO:
+            return ["-c:v", "copy"]
+
+        # Параметры для PSP
+        return ["-vf", f"{scale_filter(plan['width'], plan['height'])},fps=30000/1001"] + self.video_codec_args(plan)
+
+    def video_codec_args(self, plan):
+        """Кодер, битрейт и буфер видео без фильтров"""
+        video_bitrate = plan["video_bitrate"]
+        encoder_config = plan["encoder_config"]
+
+        args = [
+            "-c:v", encoder_config["vcodec"],
+            "-b:v", video_bitrate,
+            "-maxrate", video_bitrate,
+            # Буфер VBV на две секунды потока
+            "-bufsize", format_bitrate(parse_bitrate(video_bitrate) * 2),
+            "-pix_fmt", "yuv420p",
+        ]
+
+        # Добавляем параметры энкодера
+        args.extend(encoder_config["params"])
+        return args
+
+    def audio_args(self, plan):
+        """Параметры аудио для PSP"""
+        return [
+            "-c:a", "aac",
+            "-b:a", plan["audio_bitrate"],
+            "-ar", "44100",
+            "-ac", "2",
+        ]
+
+    def container_args(self, output_file):
+        """Параметры контейнера MP4"""
+        return [
+            "-movflags", "+faststart",
+            "-f", "mp4",
+            "-map_metadata", "-1",
+            "-metadata", "title=",
+            "-metadata", "encoder=",
+            "-y",
+            output_file
+        ]
+
+    def encode(self, plan):
+        """Кодирование во временный файл; возвращает его путь"""
+        temp_output = plan["temp_output"]
+
+        if plan["mode"] == MODE_ENCODE:
+            self.log(f"  ⚙️ Битрейт видео: {plan['video_bitrate']}")
+        if plan["mode"] != MODE_COPY:
+            self.log(f"  ⚙️ Битрейт аудио: {plan['audio_bitrate']}")
+
+        outputs = plan.get("outputs", [])
+        try:
+            with self.metrics.stage("encode"):
+                encoder = SegmentedEncoder.for_plan(self, plan)
+                if encoder:
+                    self.log(f"  🧩 Сегментное кодирование: {len(encoder.ranges)} частей, {encoder.workers} параллельно")
+                    progress = encoder.run(temp_output)
+                else:
+                    self.log(f"  🚀 Запуск FFmpeg...")
+                    progress = self.run_ffmpeg(
+                        self.build_command(plan, temp_output),
+                        FileProgress(plan["duration"]),
+                        self._report_file_progress,
+                    )
+
+            # Проверяем созданные файлы
+            for path in [temp_output] + [output["temp_output"] for output in outputs]:
+                if not (os.path.exists(path) and os.path.getsize(path) > 100000):
+                    raise Exception("Выходной файл не создан или слишком мал")
+
+            plan["encoded_seconds"] = progress.out_time
+            for output in outputs:
+                output["encoded_seconds"] = progress.out_time
+            if self.metrics.enabled:
+                # У сегментного кодирования нет общего счетчика кадров — оценка по частоте результата
+                frames = parse_number(progress.fields.get("frame")) or progress.out_time * 30000 / 1001
+                self.metrics.count("encoded_seconds", progress.out_time)
+                self.metrics.count("encoded_frames", int(frames))
+                self.metrics.annotate(encode_fps=round(progress.fps, 1), encode_speed=round(progress.speed, 2))
+            if progress.speed > 0:
+                self.log(f"  ⏱ Скорость кодирования: {progress.speed:.1f}x, {progress.fps:.0f} fps")
+
+            predicted = plan.get("predicted_size")
+            if predicted:
+                actual = os.path.getsize(temp_output)
+                self.log(
+                    f"  📦 Размер: прогноз {predicted / 1048576:.1f} МБ, итог {actual / 1048576:.1f} МБ"
+                    f" ({(actual / predicted - 1) * 100:+.0f}%)"
+                )
+
+        except Exception as e:
+            self._remove_temp(temp_output)
+            for output in outputs:
+                self._remove_temp(output["temp_output"])
+            raise e
+
+        return temp_output
+
+    def run_ffmpeg(self, cmd, progress=None, on_progress=None):
+        """Запуск ffmpeg с разбором -progress; исключение при ошибке, зависании или остановке"""
+
+        def on_stdout(line):
+            # Читаем блоки прогресса из stdout
+            if progress is not None and progress.feed(line) and on_progress:
+                on_progress(progress)
+
+        result = self.supervisor.run(
+            cmd,
+            on_stdout=on_stdout,
+            on_stderr=self._log_stderr,
+            timeout=self.job_timeout,
+            stall_timeout=self.stall_timeout,
+            should_stop=lambda: self.stop_requested,
+        )
+
+        if self.stop_requested or result.reason == REASON_CANCEL:
+            raise FFmpegError("Остановлено пользователем", REASON_CANCEL)
+        if result.reason == REASON_TIMEOUT:
+            raise FFmpegError(f"FFmpeg не уложился в {format_duration(self.job_timeout)} и остановлен", REASON_TIMEOUT)
+        if result.reason == REASON_STALL:
+            raise FFmpegError(f"FFmpeg завис: нет вывода {self.stall_timeout:.0f} с, процесс остановлен", REASON_STALL)
+
+        # Проверяем результат
+        if result.returncode != 0:
+            last = next((line.strip() for line in reversed(result.stderr) if line.strip()), "")
+            raise FFmpegError(f"FFmpeg ошибка (код {result.returncode})" + (f": {last}" if last else ""))
+
+        return progress
+
+    def _log_stderr(self, line):
+        if "error" in line.lower() or "failed" in line.lower():
+            if "h264_amf" not in line.lower():  # Игнорируем ошибки AMF если используем CPU
+                self.log(f"  ⚠️ {line.strip()}", "warning")
+
+    def _remove_temp(self, temp_output):
+        if os.path.exists(temp_output):
+            try:
+                os.remove(temp_output)
+            except:
+                pass
+
+    def package(self, plan, temp_output):
+        """Размещение результата в MP_ROOT/100ANV01 и создание THM"""
+        psp_video_dir = plan["psp_video_dir"]
+
+        try:
+            # Перекодирование заменяет прежний файл исходника (по манифесту или каталогу),
+            # новый файл получает следующий номер; имя занято до конца переноса
+            index = self.name_index(psp_video_dir)
+            final_output = index.allocate(plan["input_file"], preferred=plan.get("previous_output"))
+            psp_filename = os.path.basename(final_output)
+
+            try:
+                if not same_device(temp_output, psp_video_dir):
+                    self.log(f"  📤 Перенос на другой диск: {psp_video_dir}")
+                with self.metrics.stage("move"):
+                    finalize(temp_output, final_output)
+            except BaseException:
+                index.release(final_output)
+                raise
+        except Exception as e:
+            self._remove_temp(temp_output)
+            raise e
+
+        try:
+            index.record(
+                final_output, plan["input_file"],
+                title=plan["base_name"],
+                resolution=f"{plan['width']}x{plan['height']}",
+                date=get_current_time(),
+            )
+        except OSError as e:
+            self.log(f"  ⚠️ Каталог не обновлен: {e}", "warning")
+
+        # Создаем информационный файл (имя как у видео — описание не перепутать)
+        info_file = os.path.join(psp_video_dir, os.path.splitext(psp_filename)[0] + ".txt")
+        try:
+            with open(info_file, 'w', encoding='utf-8') as f:
+                f.write(f"Оригинальный файл: {plan['base_name']}\n")
+                f.write(f"PSP файл: {psp_filename}\n")
+                f.write(f"Разрешение: {plan['width']}x{plan['height']}\n")
+                f.write(f"Дата конвертации: {get_current_time()}\n")
+        except:
+            pass
+
+        self.log(f"  ✅ PSP файл создан: {psp_filename}", "success")
+        self.log(f"  📁 Папка на PSP: {self._display_dir(os.path.dirname(final_output))}")
+
+        # Проверяем совместимость
+        with self.metrics.stage("verify"):
+            self.verify_output(plan, final_output)
+
+        # Создание THM файла
+        try:
+            thm_file = os.path.join(psp_video_dir, os.path.splitext(psp_filename)[0] + ".THM")
+            with self.metrics.stage("thm"):
+                source = self.make_thm(thm_file, plan)
+            if source:
+                self.log(f"  🖼️ THM создан ({source}): {os.path.getsize(thm_file)} байт")
+        except Exception as e:
+            self.log(f"  ⚠️ Ошибка THM: {e}", "warning")
+
+        return final_output
+
+    def name_index(self, psp_video_dir):
+        """Индекс имен папки PSP: читается один раз за пакет и общий для всех задач"""
+        key = os.path.abspath(psp_video_dir)
+        with self.name_lock:
+            index = self._name_indexes.get(key)
+            if index is None:
+                index = self._name_indexes[key] = NameIndex(key)
+            return index
+
+    def make_thm(self, thm_file, plan=None):
+        """Обложка 160x120: выбранное изображение или кадр из видео плана.
+
+        Возвращает источник обложки ("обложка" или "кадр") или None, если THM не создан.
+        """
+        if self.thumb_path and os.path.exists(self.thumb_path):
+            # Картинка уменьшается один раз на пакет, дальше копируются готовые байты
+            data, source = self.cover_cache.get(self.thumb_path), "обложка"
+        elif plan is not None and self.auto_thumbs:
+            data, source = self.frame_extractor.get(plan), "кадр"
+        else:
+            return None
+        if not data:
+            return None
+        with open(thm_file, "wb") as f:
+            f.write(data)
+        return source
+
+    def verify_output(self, plan, output_file):
+        """Проверка результата: по плану и итогам ffmpeg или, с deep_verify, по moov файла"""
+        expected_duration = plan["duration"] if plan.get("encoded_seconds") is not None else 0
+        if self.deep_verify:
+            self.check_psp_compatibility(output_file, expected_duration=expected_duration)
+        else:
+            self.check_psp_compatibility(
+                output_file,
+                info=self.expected_output(plan),
+                expected_duration=expected_duration,
+            )
+
+    def expected_output(self, plan):
+        """MediaInfo результата из плана: параметры кодера, фильтров и длительность из -progress"""
+        source = plan["info"]
+        if plan["mode"] == MODE_ENCODE:
+            params = plan["encoder_config"]["params"]
+            video = StreamInfo(
+                index=0, codec_type="video", codec_name="h264",
+                profile=encoder_profile(params), level=encoder_level(params),
+                width=plan["width"], height=plan["height"],
+                fps=30000 / 1001,  # фильтр fps в video_args
+            )
+        else:
+            video = replace(source.video, index=0) if source.video else None
+        if plan["mode"] == MODE_COPY:
+            audio = replace(source.audio, index=1) if source.audio else None
+        else:
+            audio = StreamInfo(index=1, codec_type="audio", codec_name="aac", sample_rate=44100, channels=2) if source.audio else None
+        return MediaInfo(
+            path=plan.get("temp_output") or plan["input_file"],
+            duration=plan.get("encoded_seconds") or 0.0,
+            streams=[stream for stream in (video, audio) if stream],
+        )
+
+    def check_psp_compatibility(self, video_file, info=None, expected_duration=0):
+        """Проверка совместимости с PSP.
+
+        info — ожидаемые параметры результата; без него читается заголовок
+        MP4 (moov) самого файла, в том числе расположение moov (faststart).
+        """
+        try:
+            faststart = None
+            if info is None:
+                info, faststart = read_mp4_info(video_file)
+            video = info.video
+            audio = info.audio
+
+            self.log("  📊 Проверка совместимости с PSP:")
+
+            checks = []
+            warnings = []
+
+            # Разрешение
+            width, height = info.width, info.height
+            if width and height:
+                if (width, height) in PSP_RESOLUTIONS or (width, height) in PSP_PROFILES.values():
+                    checks.append(f"  ✅ Разрешение: {width}x{height}")
+                else:
+                    warnings.append(f"  ⚠️ Разрешение {width}x{height} может не поддерживаться")
+
+            # FPS
+            if is_psp_fps(info.fps):
+                checks.append("  ✅ FPS: 29.97/30")
+            else:
+                warnings.append("  ⚠️ FPS должен быть 29.97 или 30")
+
+            # Профиль
+            profile = (video.profile if video and video.profile else "").lower()
+            if "baseline" in profile:
+                checks.append("  ✅ Профиль: Baseline")
+            elif "main" in profile:
+                checks.append("  ✅ Профиль: Main (поддерживается)")
+            else:
+                warnings.append("  ⚠️ Профиль должен быть Baseline или Main")
+
+            # Уровень
+            if video and video.level:
+                if is_psp_level(video.level):
+                    checks.append(f"  ✅ Level: {video.level / 10:.1f}")
+                else:
+                    warnings.append(f"  ⚠️ Level {video.level / 10:.1f} выше 3.0")
+
+            # Аудио
+            if audio and audio.codec_name == "aac":
+                checks.append("  ✅ Аудио кодек: AAC")
+
+            if audio and audio.sample_rate == 44100:
+                checks.append("  ✅ Аудио частота: 44.1 kHz")
+
+            # Индекс в начале файла — PSP не читает конец файла перед показом
+            if faststart is True:
+                checks.append("  ✅ moov в начале файла (faststart)")
+            elif faststart is False:
+                warnings.append("  ⚠️ moov в конце файла: нет faststart")
+
+            # Обрыв кодирования: результат заметно короче исходника
+            if expected_duration and info.duration < expected_duration * 0.97 - 1:
+                warnings.append(
+                    f"  ⚠️ Длительность {format_duration(info.duration)} меньше исходной {format_duration(expected_duration)}"
+                )
+
+            # Выводим результаты
+            for check in checks:
+                self.log(check)
+
+            if warnings:
+                self.log("  ⚠️ Предупреждения:", "warning")
+                for warning in warnings:
+                    self.log(warning, "warning")
+
+            if len(warnings) == 0:
+                self.log("  ✅ Видео полностью совместимо с PSP!", "success")
+            elif len(warnings) <= 2:
+                self.log("  ⚠️ Видео должно работать на PSP", "warning")
+            else:
+                self.log("  ❌ Видео может не работать на PSP", "error")
+
+        except Exception as e:
+            self.log(f"  ⚠️ Ошибка проверки: {e}", "warning")
+
+    def probe(self, input_file):
+        """Информация о файле (MediaInfo): из кэша, через ffprobe или ffmpeg -i"""
+        if self.probe_cache is not None:
+            try:
+                data = self.probe_cache.get(input_file)
+                if data is not None:
+                    self.metrics.count("probe_cache_hits")
+                    return MediaInfo.from_dict(data)
+            except sqlite3.Error as e:
+                self._disable_probe_cache(e)
+
+        with self.metrics.stage("probe"):
+            info = self._probe_ffprobe(input_file)
+
+        # Неудачный анализ не кэшируется — файл может быть еще не докопирован
+        if self.probe_cache is not None and info.ok:
+            try:
+                self.probe_cache.put(input_file, info.to_dict())
+            except sqlite3.Error as e:
+                self._disable_probe_cache(e)
+        return info
+
+    def probe_many(self, files, workers=None):
+        """Анализ нескольких файлов параллельно (заполняет кэш заранее)"""
+        workers = workers or min(8, (os.cpu_count() or 1) * 2)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(self.probe, files))
+
+    def _disable_probe_cache(self, error):
+        self.log(f"⚠️ Кэш анализа отключен: {error}", "warning")
+        self.probe_cache = None
+
+    def _probe_ffprobe(self, input_file):
+        """Один запуск ffprobe с выводом всех потоков и контейнера в JSON"""
+        try:
+            size = os.path.getsize(input_file)
+        except OSError:
+            size = 0
+        info = MediaInfo(path=input_file, size=size)
+
+        if not self.ffprobe_path:
+            return self._probe_ffmpeg(input_file, size)
+
+        cmd = [
+            self.ffprobe_path,
+            "-v", "error",
+            "-print_format", "json",
+            "-show_format",
+            "-show_streams",
+            input_file,
+        ]
+        try:
+            result = subprocess.run(
+                cmd,
+                capture_output=True,
+                text=True,
+                encoding='utf-8',
+                errors='replace',
+                creationflags=subprocess.CREATE_NO_WINDOW if hasattr(subprocess, 'CREATE_NO_WINDOW') else 0
+            )
+            if result.returncode == 0 and result.stdout.strip():
+                info = MediaInfo.from_ffprobe(input_file, size, json.loads(result.stdout))
+        except (OSError, ValueError):
+            pass
+        return info
+
+    def _probe_ffmpeg(self, input_file, size):
+        """Без ffprobe: разбор вывода ffmpeg -i (как до перехода на ffprobe)"""
+        info = MediaInfo(path=input_file, size=size)
+        if not self.ffmpeg_path:
+            return info
+        try:
+            result = subprocess.run(
+                [self.ffmpeg_path, "-hide_banner", "-i", input_file],
+                capture_output=True,
+                text=True,
+                encoding='utf-8',
+                errors='replace',
+                creationflags=subprocess.CREATE_NO_WINDOW if hasattr(subprocess, 'CREATE_NO_WINDOW') else 0
+            )
+        except OSError:
+            return info
+        return MediaInfo.from_ffmpeg(input_file, size, result.stderr)
+
+    def get_video_info(self, input_file):
+        """Получение информации о видео"""
+        info = self.probe(input_file)
+        return info.duration, info.size, info.width, info.height
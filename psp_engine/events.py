@@ -0,0 +1,122 @@
+"""Доставка событий движка: пакетами для GUI и строками JSON в файл"""
+import json
+import queue
+import threading
+import time
+
+# Строк лога за один проход интерфейса; остальное сворачивается в одну строку
+MAX_BATCH_LINES = 500
+
+
+def fan_out(*handlers):
+    """Обработчик on_event, передающий событие всем handlers"""
+    handlers = [h for h in handlers if h]
+
+    def on_event(event):
+        for handler in handlers:
+            handler(event)
+
+    return on_event
+
+
+def event_to_dict(event):
+    """Событие-кортеж в словарь для JSON"""
+    kind = event[0]
+    record = {"time": round(time.time(), 3), "type": kind}
+    if kind == "log":
+        record["msg"] = event[1]
+        record["tag"] = event[2] if len(event) > 2 else None
+    elif kind == "progress":
+        record["value"] = round(event[1], 4)
+        record["text"] = event[2] if len(event) > 2 else None
+    elif kind == "file_progress":
+        record["index"] = event[1]
+        record.update(event[2])
+    elif len(event) > 1 and event[1] is not None:
+        record["msg"] = event[1]
+    return record
+
+
+class EventBuffer:
+    """Буфер событий для главного потока GUI.
+
+    put() вызывается из рабочих потоков и только добавляет событие в
+    список. drain() забирает все накопленное за такт: строки лога
+    подряд, последний общий прогресс, последний прогресс каждого файла
+    и остальные события по порядку.
+    """
+
+    def __init__(self, max_lines=MAX_BATCH_LINES):
+        self.max_lines = max_lines
+        self.lock = threading.Lock()
+        self.events = []
+
+    def put(self, event):
+        with self.lock:
+            self.events.append(event)
+
+    def drain(self):
+        """(строки лога [(текст, тег)], прогресс или None, {файл: прогресс}, прочие события)"""
+        with self.lock:
+            events, self.events = self.events, []
+
+        lines, other = [], []
+        progress = None
+        files = {}
+        for event in events:
+            kind = event[0]
+            if kind == "log":
+                lines.append((event[1], event[2] if len(event) > 2 else None))
+            elif kind == "progress":
+                progress = event
+            elif kind == "file_progress":
+                files[event[1]] = event[2]
+            else:
+                other.append(event)
+
+        if len(lines) > self.max_lines:
+            skipped = len(lines) - self.max_lines
+            lines = [(f"… пропущено строк лога: {skipped}", "warning")] + lines[-self.max_lines:]
+        return lines, progress, files, other
+
+
+class JsonLinesSink:
+    """Поток событий в файл: одна строка JSON на событие.
+
+    Запись идет в отдельном потоке, поэтому медленный диск не тормозит
+    кодирование; файл можно читать tail -f во время работы.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "a", encoding="utf-8")
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name="event-sink", daemon=True)
+        self.thread.start()
+
+    def put(self, event):
+        self.queue.put(event_to_dict(event))
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        self.file.close()
+
+    def _run(self):
+        while True:
+            records = [self.queue.get()]
+            # Все, что накопилось, пишется одним блоком
+            while True:
+                try:
+                    records.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            done = None in records
+            lines = [json.dumps(r, ensure_ascii=False) + "\n" for r in records if r is not None]
+            try:
+                self.file.writelines(lines)
+                self.file.flush()
+            except OSError:
+                pass
+            if done:
+                return
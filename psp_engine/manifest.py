@@ -0,0 +1,168 @@
+"""Манифест конвертации: что уже сделано в папке и с какими настройками"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+# Статусы записей
+STATUS_ENCODING = "encoding"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+STATUS_DEAD = "dead"  # слишком много неудачных попыток — пропускается до revive
+
+
+def file_fingerprint(path, chunk_size=64 * 1024):
+    """Быстрый отпечаток содержимого: размер + SHA-1 начала и конца файла"""
+    size = os.path.getsize(path)
+    digest = hashlib.sha1(str(size).encode())
+    with open(path, "rb") as f:
+        digest.update(f.read(chunk_size))
+        if size > chunk_size * 2:
+            f.seek(-chunk_size, os.SEEK_END)
+            digest.update(f.read(chunk_size))
+    return digest.hexdigest()
+
+
+class Manifest:
+    """Состояние конвертации файлов одной папки (SQLite в корне папки).
+
+    Для каждого исходника хранится отпечаток содержимого, хэш настроек
+    кодирования, имя результата и статус. Повторный запуск пропускает файлы,
+    у которых не изменились ни содержимое, ни настройки, а результат на месте.
+    Неудачные попытки считаются между запусками: файл, который раз за разом
+    не конвертируется, попадает в список проблемных (STATUS_DEAD).
+    """
+
+    FILENAME = ".psp_manifest.sqlite"
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                " source TEXT PRIMARY KEY,"
+                " size INTEGER,"
+                " mtime_ns INTEGER,"
+                " fingerprint TEXT,"
+                " settings_hash TEXT,"
+                " output TEXT,"
+                " temp TEXT,"
+                " status TEXT,"
+                " error TEXT,"
+                " updated REAL,"
+                " attempts INTEGER NOT NULL DEFAULT 0)"
+            )
+            columns = {row[1] for row in self.conn.execute("PRAGMA table_info(files)")}
+            if "attempts" not in columns:
+                # Манифест прежней версии
+                self.conn.execute("ALTER TABLE files ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+
+    @classmethod
+    def for_folder(cls, folder):
+        return cls(os.path.join(folder, cls.FILENAME))
+
+    def get(self, source):
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM files WHERE source = ?", (os.path.abspath(source),)).fetchone()
+        return dict(row) if row else None
+
+    def check(self, source, settings_hash):
+        """Проверка исходника: (результат актуален, отпечаток содержимого).
+
+        Если размер и mtime совпадают с записью, файл не читается.
+        """
+        source = os.path.abspath(source)
+        st = os.stat(source)
+        entry = self.get(source)
+
+        if entry and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+            fingerprint = entry["fingerprint"]
+        else:
+            fingerprint = file_fingerprint(source)
+            if entry and entry["fingerprint"] == fingerprint:
+                # Файл только «потрогали» — запоминаем новый mtime, чтобы не читать его снова
+                with self.lock, self.conn:
+                    self.conn.execute(
+                        "UPDATE files SET size = ?, mtime_ns = ? WHERE source = ?",
+                        (st.st_size, st.st_mtime_ns, source),
+                    )
+
+        up_to_date = bool(
+            entry
+            and entry["status"] == STATUS_DONE
+            and entry["fingerprint"] == fingerprint
+            and entry["settings_hash"] == settings_hash
+            and entry["output"]
+            and os.path.exists(entry["output"])
+        )
+        return up_to_date, fingerprint
+
+    def mark_started(self, source, fingerprint, settings_hash, temp):
+        source = os.path.abspath(source)
+        st = os.stat(source)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO files (source, size, mtime_ns, fingerprint, settings_hash, temp, status, error, updated)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, NULL, ?)"
+                " ON CONFLICT(source) DO UPDATE SET size = excluded.size, mtime_ns = excluded.mtime_ns,"
+                " fingerprint = excluded.fingerprint, settings_hash = excluded.settings_hash,"
+                " temp = excluded.temp, status = excluded.status, error = NULL, updated = excluded.updated,"
+                # Другой исходник — неудачи прежнего к нему не относятся
+                " attempts = CASE WHEN fingerprint IS excluded.fingerprint THEN attempts ELSE 0 END",
+                (source, st.st_size, st.st_mtime_ns, fingerprint, settings_hash, temp, STATUS_ENCODING, time.time()),
+            )
+
+    def mark_done(self, source, output):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE files SET output = ?, temp = NULL, status = ?, error = NULL, updated = ?, attempts = 0 WHERE source = ?",
+                (os.path.abspath(output), STATUS_DONE, time.time(), os.path.abspath(source)),
+            )
+
+    def mark_failed(self, source, error, counted=True, dead_after=0):
+        """Неудачная попытка; counted=False — не считать (остановка пользователем).
+
+        После dead_after неудачных попыток подряд (0 — никогда) файл
+        переходит в STATUS_DEAD. Возвращает True, если это произошло сейчас.
+        """
+        source = os.path.abspath(source)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE files SET temp = NULL, attempts = attempts + ?, error = ?, updated = ?,"
+                " status = CASE WHEN ? > 0 AND attempts + ? >= ? THEN ? ELSE ? END WHERE source = ?",
+                (int(counted), str(error), time.time(), dead_after, int(counted), dead_after,
+                 STATUS_DEAD, STATUS_FAILED, source),
+            )
+            row = self.conn.execute("SELECT status FROM files WHERE source = ?", (source,)).fetchone()
+        return bool(counted and row and row["status"] == STATUS_DEAD)
+
+    def is_dead(self, source, fingerprint):
+        """В списке проблемных ли исходник с этим содержимым (измененный файл пробуется снова)"""
+        entry = self.get(source)
+        return bool(entry and entry["status"] == STATUS_DEAD and entry["fingerprint"] == fingerprint)
+
+    def dead_letters(self):
+        """Записи файлов из списка проблемных"""
+        with self.lock:
+            rows = self.conn.execute("SELECT * FROM files WHERE status = ? ORDER BY source", (STATUS_DEAD,))
+            return [dict(row) for row in rows]
+
+    def revive(self):
+        """Вернуть все проблемные файлы в очередь; возвращает их число"""
+        with self.lock, self.conn:
+            return self.conn.execute(
+                "UPDATE files SET status = ?, attempts = 0 WHERE status = ?",
+                (STATUS_FAILED, STATUS_DEAD),
+            ).rowcount
+
+    def entries(self):
+        with self.lock:
+            return [dict(row) for row in self.conn.execute("SELECT * FROM files ORDER BY source")]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,269 @@
+"""Информация о видеофайле по данным ffprobe -print_format json (или вывода ffmpeg -i)"""
+import re
+from dataclasses import asdict, dataclass, field
+from fractions import Fraction
+from typing import Dict, List, Optional
+
+
+def parse_rate(value):
+    """Частота "30000/1001" или "29.97" в виде числа; 0 если неизвестна"""
+    try:
+        rate = Fraction(value)
+    except (ValueError, TypeError, ZeroDivisionError):
+        return 0.0
+    return float(rate) if rate > 0 else 0.0
+
+
+def parse_ratio(value):
+    """Соотношение "16:9" в виде числа; 0 если неизвестно"""
+    try:
+        num, den = (int(part) for part in value.split(":"))
+    except (ValueError, AttributeError):
+        return 0.0
+    return num / den if num > 0 and den > 0 else 0.0
+
+
+def parse_int(value, default=0):
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        return default
+
+
+def parse_float(value, default=0.0):
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return default
+
+
+# Раскладки каналов ffmpeg без числа в названии
+FFMPEG_LAYOUTS = {"mono": 1, "stereo": 2, "quad": 4}
+
+# Строки вывода ffmpeg -i: длительность, контейнер, потоки и поворот
+FFMPEG_DURATION_RE = re.compile(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)(?:, start: (-?[\d.]+))?(?:, bitrate: (\d+) kb/s)?")
+FFMPEG_INPUT_RE = re.compile(r"^Input #0, (.+?), from ", re.MULTILINE)
+FFMPEG_STREAM_RE = re.compile(r"^\s*Stream #0:(\d+)[^:]*: (Video|Audio|Subtitle|Data|Attachment): (.*)$")
+FFMPEG_ROTATION_RE = re.compile(r"rotation of (-?[\d.]+) degrees")
+
+
+@dataclass
+class StreamInfo:
+    index: int
+    codec_type: str
+    codec_name: Optional[str] = None
+    profile: Optional[str] = None
+    level: Optional[int] = None
+    width: int = 0
+    height: int = 0
+    sample_aspect: float = 1.0
+    display_aspect: float = 0.0
+    fps: float = 0.0
+    pix_fmt: Optional[str] = None
+    rotation: int = 0
+    bit_rate: int = 0
+    sample_rate: int = 0
+    channels: int = 0
+    channel_layout: Optional[str] = None
+    attached_pic: bool = False  # обложка внутри контейнера, а не видеодорожка
+
+    @classmethod
+    def from_ffprobe(cls, data):
+        disposition = data.get("disposition") or {}
+        tags = data.get("tags") or {}
+
+        # Поворот: тег rotate (старые сборки) или матрица в side_data
+        rotation = parse_int(tags.get("rotate"))
+        for side_data in data.get("side_data_list") or []:
+            if "rotation" in side_data:
+                rotation = parse_int(side_data["rotation"])
+        rotation %= 360
+
+        level = data.get("level")
+        fps = parse_rate(data.get("avg_frame_rate")) or parse_rate(data.get("r_frame_rate"))
+
+        return cls(
+            index=parse_int(data.get("index")),
+            codec_type=data.get("codec_type") or "unknown",
+            codec_name=data.get("codec_name"),
+            profile=data.get("profile"),
+            level=level if isinstance(level, int) and level > 0 else None,
+            width=parse_int(data.get("width")),
+            height=parse_int(data.get("height")),
+            sample_aspect=parse_ratio(data.get("sample_aspect_ratio")) or 1.0,
+            display_aspect=parse_ratio(data.get("display_aspect_ratio")),
+            fps=fps,
+            pix_fmt=data.get("pix_fmt"),
+            rotation=rotation,
+            bit_rate=parse_int(data.get("bit_rate")),
+            sample_rate=parse_int(data.get("sample_rate")),
+            channels=parse_int(data.get("channels")),
+            channel_layout=data.get("channel_layout"),
+            attached_pic=bool(disposition.get("attached_pic")),
+        )
+
+    @classmethod
+    def from_ffmpeg_line(cls, index, kind, description):
+        """Поток из строки "Stream #0:1: Video: h264 (High) ..., 1920x1080 [SAR 1:1 DAR 16:9], 29.97 fps"."""
+        codec = re.match(r"(\w+)(?: \(([^)/]+)\))?", description)
+        stream = cls(
+            index=index,
+            codec_type=kind.lower(),
+            codec_name=codec.group(1) if codec else None,
+            profile=codec.group(2) if codec else None,
+            attached_pic="(attached pic)" in description,
+        )
+        bit_rate = re.search(r"(\d+) kb/s", description)
+        if bit_rate:
+            stream.bit_rate = int(bit_rate.group(1)) * 1000
+        if stream.codec_type == "video":
+            size = re.search(r"(?<![\w.])(\d{2,5})x(\d{2,5})\b", description)
+            if size:
+                stream.width, stream.height = int(size.group(1)), int(size.group(2))
+            aspect = re.search(r"SAR (\d+:\d+) DAR (\d+:\d+)", description)
+            if aspect:
+                stream.sample_aspect = parse_ratio(aspect.group(1)) or 1.0
+                stream.display_aspect = parse_ratio(aspect.group(2))
+            fps = re.search(r"([\d.]+) fps", description)
+            stream.fps = parse_float(fps.group(1)) if fps else 0.0
+            pix_fmt = re.search(r"\), (\w+)[(,]|^\w+[^,]*, (\w+)[(,]", description)
+            if pix_fmt:
+                stream.pix_fmt = pix_fmt.group(1) or pix_fmt.group(2)
+        elif stream.codec_type == "audio":
+            audio = re.search(r"(\d+) Hz, ([^,]+)", description)
+            if audio:
+                stream.sample_rate = int(audio.group(1))
+                stream.channel_layout = audio.group(2).strip()
+                layout = stream.channel_layout
+                channels = re.match(r"(\d+) channels", layout)
+                if channels:
+                    stream.channels = int(channels.group(1))
+                elif layout in FFMPEG_LAYOUTS:
+                    stream.channels = FFMPEG_LAYOUTS[layout]
+                else:
+                    # "5.1(side)" -> 6, "7.1" -> 8
+                    numbers = re.match(r"(\d+)\.(\d+)", layout)
+                    stream.channels = int(numbers.group(1)) + int(numbers.group(2)) if numbers else 0
+        return stream
+
+    @property
+    def rotated(self):
+        return self.rotation in (90, 270)
+
+    @property
+    def aspect(self):
+        """Соотношение сторон при показе с учетом SAR и поворота"""
+        if self.display_aspect:
+            aspect = self.display_aspect
+        elif self.width and self.height:
+            aspect = self.width * self.sample_aspect / self.height
+        else:
+            return 0.0
+        return 1 / aspect if self.rotated else aspect
+
+
+@dataclass
+class MediaInfo:
+    path: str
+    size: int = 0
+    duration: float = 0.0
+    start_time: float = 0.0
+    bit_rate: int = 0
+    format_name: Optional[str] = None
+    streams: List[StreamInfo] = field(default_factory=list)
+    # Битрейт пробного CRF-кодирования, бит/с, по разрешению результата ("480x272")
+    complexity: Dict[str, float] = field(default_factory=dict)
+
+    @classmethod
+    def from_ffprobe(cls, path, size, data):
+        fmt = data.get("format") or {}
+        streams = [StreamInfo.from_ffprobe(s) for s in data.get("streams") or []]
+        return cls(
+            path=path,
+            size=size,
+            duration=parse_float(fmt.get("duration")),
+            start_time=parse_float(fmt.get("start_time")),
+            bit_rate=parse_int(fmt.get("bit_rate")),
+            format_name=fmt.get("format_name"),
+            streams=streams,
+        )
+
+    @classmethod
+    def from_ffmpeg(cls, path, size, output):
+        """Разбор stderr "ffmpeg -i" — когда ffprobe нет; уровень H.264 так не узнать"""
+        info = cls(path=path, size=size)
+        match = FFMPEG_INPUT_RE.search(output)
+        if match:
+            info.format_name = match.group(1)
+        match = FFMPEG_DURATION_RE.search(output)
+        if match:
+            h, m, sec, start, bit_rate = match.groups()
+            info.duration = int(h) * 3600 + int(m) * 60 + float(sec)
+            info.start_time = parse_float(start)
+            info.bit_rate = parse_int(bit_rate) * 1000
+        for line in output.splitlines():
+            match = FFMPEG_STREAM_RE.match(line)
+            if match:
+                info.streams.append(StreamInfo.from_ffmpeg_line(int(match.group(1)), match.group(2), match.group(3)))
+                continue
+            # Поворот выводится в side data под своим потоком
+            match = FFMPEG_ROTATION_RE.search(line)
+            if match and info.streams:
+                info.streams[-1].rotation = int(round(float(match.group(1)))) % 360
+        return info
+
+    @classmethod
+    def from_dict(cls, data):
+        data = dict(data)
+        data["streams"] = [StreamInfo(**s) for s in data.get("streams", [])]
+        # Старый кэш хранил одно число без разрешения — такое значение не годится
+        if not isinstance(data.get("complexity"), dict):
+            data["complexity"] = {}
+        return cls(**data)
+
+    def to_dict(self):
+        return asdict(self)
+
+    def complexity_at(self, width, height):
+        """Сложность, измеренная для результата width x height; 0 — не измерялась"""
+        return self.complexity.get(f"{width}x{height}", 0.0)
+
+    @property
+    def video(self):
+        """Основная видеодорожка (обложки-картинки пропускаются)"""
+        for stream in self.streams:
+            if stream.codec_type == "video" and not stream.attached_pic:
+                return stream
+        return None
+
+    @property
+    def audio(self):
+        for stream in self.streams:
+            if stream.codec_type == "audio":
+                return stream
+        return None
+
+    @property
+    def width(self):
+        return self.video.width if self.video else 0
+
+    @property
+    def height(self):
+        return self.video.height if self.video else 0
+
+    @property
+    def fps(self):
+        return self.video.fps if self.video else 0.0
+
+    @property
+    def rotation(self):
+        return self.video.rotation if self.video else 0
+
+    @property
+    def display_aspect(self):
+        return self.video.aspect if self.video else 0.0
+
+    @property
+    def ok(self):
+        """Файл удалось проанализировать"""
+        return bool(self.duration or self.streams)
@@ -0,0 +1,291 @@
+"""Метрики этапов конвертации: отчет по пакету и текст для Prometheus"""
+import collections
+import contextlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Этапы, которые замеряет движок (в отчете идут в этом порядке)
+STAGES = ("probe", "complexity", "tune", "encode", "move", "verify", "thm")
+
+# Исходы файла
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+STATUS_SKIPPED = "skipped"
+STATUS_RETRIED = "retried"  # попытка не удалась, файл вернулся в очередь
+
+# Общий пустой контекст: выключенные метрики ничего не создают на каждый замер
+_NO_STAGE = contextlib.nullcontext()
+
+
+def failure_cause(error):
+    """Причина ошибки для счетчика: cancel, timeout, stall, exit, io или other"""
+    reason = getattr(error, "reason", None)
+    if reason:
+        return reason
+    if isinstance(error, OSError):
+        return "io"
+    return "other"
+
+
+class StageStats:
+    """Сумма, число и максимум длительностей одного этапа"""
+
+    __slots__ = ("count", "seconds", "max", "errors")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.max = 0.0
+        self.errors = 0
+
+    def add(self, seconds, ok):
+        self.count += 1
+        self.seconds += seconds
+        self.max = max(self.max, seconds)
+        if not ok:
+            self.errors += 1
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "seconds": round(self.seconds, 3),
+            "avg": round(self.seconds / self.count, 3) if self.count else 0.0,
+            "max": round(self.max, 3),
+            "errors": self.errors,
+        }
+
+
+class Totals:
+    """Этапы, счетчики и причины ошибок за период (пакет или все время работы)"""
+
+    def __init__(self):
+        self.stages = collections.defaultdict(StageStats)
+        self.counters = collections.Counter()
+        self.failures = collections.Counter()
+
+    def to_dict(self):
+        order = {name: n for n, name in enumerate(STAGES)}
+        stages = sorted(self.stages.items(), key=lambda item: (order.get(item[0], len(order)), item[0]))
+        return {
+            "stages": {name: stats.to_dict() for name, stats in stages},
+            "counters": dict(sorted(self.counters.items())),
+            "failures": dict(sorted(self.failures.items())),
+        }
+
+
+class NullMetrics:
+    """Метрики выключены: все вызовы ничего не делают"""
+
+    enabled = False
+
+    def stage(self, name):
+        return _NO_STAGE
+
+    def count(self, name, value=1):
+        pass
+
+    def failure(self, cause):
+        pass
+
+    def begin_batch(self):
+        pass
+
+    def begin_file(self, path):
+        pass
+
+    def annotate(self, **fields):
+        pass
+
+    def end_file(self, status, bytes_in=0, bytes_out=0, cause=None):
+        pass
+
+    def report(self):
+        return None
+
+
+class Metrics:
+    """Замеры этапов, байтов, скорости кодирования и ошибок.
+
+    Счетчики ведутся дважды: за текущий пакет (отчет report) и за все
+    время работы процесса (prometheus — для наблюдения в режиме --watch,
+    где счетчики не должны сбрасываться между пакетами). Этап, выполненный
+    внутри задачи файла, попадает и в запись этого файла.
+    """
+
+    enabled = True
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.total = Totals()
+        self.batch = Totals()
+        self.files = []
+        self.batches = 0
+        self.batch_started = None
+        self.active = 0
+        self._local = threading.local()
+
+    def begin_batch(self):
+        with self.lock:
+            self.batch = Totals()
+            self.files = []
+            self.batches += 1
+            self.batch_started = time.time()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            elapsed = time.perf_counter() - started
+            with self.lock:
+                self.total.stages[name].add(elapsed, ok)
+                self.batch.stages[name].add(elapsed, ok)
+            record = getattr(self._local, "file", None)
+            if record is not None:
+                stages = record["stages"]
+                stages[name] = round(stages.get(name, 0.0) + elapsed, 3)
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.total.counters[name] += value
+            self.batch.counters[name] += value
+
+    def failure(self, cause):
+        with self.lock:
+            self.total.failures[cause] += 1
+            self.batch.failures[cause] += 1
+
+    def begin_file(self, path):
+        """Начало задачи файла в текущем потоке"""
+        self._local.file = {"path": path, "stages": {}}
+        self._local.started = time.perf_counter()
+        with self.lock:
+            self.active += 1
+
+    def annotate(self, **fields):
+        """Дополнительные поля записи текущего файла (скорость кодирования и т.п.)"""
+        record = getattr(self._local, "file", None)
+        if record is not None:
+            record.update(fields)
+
+    def end_file(self, status, bytes_in=0, bytes_out=0, cause=None):
+        """Итог задачи файла: статус, размеры исходника и результата, причина ошибки"""
+        record = getattr(self._local, "file", None)
+        if record is None:
+            return
+        self._local.file = None
+        record["seconds"] = round(time.perf_counter() - self._local.started, 3)
+        record["status"] = status
+        record["bytes_in"] = bytes_in
+        record["bytes_out"] = bytes_out
+        if cause:
+            record["cause"] = cause
+        with self.lock:
+            self.active -= 1
+            self.files.append(record)
+            for totals in (self.total, self.batch):
+                totals.counters[f"files_{status}"] += 1
+                if status == STATUS_DONE:
+                    totals.counters["bytes_in"] += bytes_in
+                    totals.counters["bytes_out"] += bytes_out
+                if cause:
+                    totals.failures[cause] += 1
+
+    def report(self):
+        """Отчет о последнем пакете (словарь для JSON)"""
+        with self.lock:
+            report = self.batch.to_dict()
+            files = list(self.files)
+            started = self.batch_started
+        counters = report["counters"]
+        encode = report["stages"].get("encode")
+        if encode and encode["seconds"]:
+            # Средняя скорость: кадры и секунды видео на секунду работы кодера
+            counters["encode_fps"] = round(counters.get("encoded_frames", 0) / encode["seconds"], 1)
+            counters["encode_speed"] = round(counters.get("encoded_seconds", 0) / encode["seconds"], 2)
+        report["started"] = started
+        report["elapsed"] = round(time.time() - started, 3) if started else 0.0
+        report["files"] = files
+        return report
+
+    def write_report(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=2)
+
+    def prometheus(self):
+        """Счетчики за все время работы в текстовом формате Prometheus"""
+        with self.lock:
+            stages = {name: (s.count, s.seconds, s.errors) for name, s in self.total.stages.items()}
+            counters = dict(self.total.counters)
+            failures = dict(self.total.failures)
+            active, batches = self.active, self.batches
+
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+                value = value if isinstance(value, int) else round(value, 6)
+                lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+        metric("psp_stage_seconds_total", "counter", "Time spent in each stage",
+               [({"stage": name}, s[1]) for name, s in sorted(stages.items())])
+        metric("psp_stage_runs_total", "counter", "Stage executions",
+               [({"stage": name}, s[0]) for name, s in sorted(stages.items())])
+        metric("psp_stage_errors_total", "counter", "Stage executions that raised an error",
+               [({"stage": name}, s[2]) for name, s in sorted(stages.items())])
+        metric("psp_files_total", "counter", "Finished file jobs by status",
+               [({"status": status}, counters.get(f"files_{status}", 0))
+                for status in (STATUS_DONE, STATUS_FAILED, STATUS_SKIPPED, STATUS_RETRIED)])
+        metric("psp_failures_total", "counter", "Failures by cause",
+               [({"cause": cause}, n) for cause, n in sorted(failures.items())])
+        metric("psp_retries_total", "counter", "Jobs retried after a failure or on another encoder",
+               [({}, counters.get("retries", 0))])
+        metric("psp_bytes_in_total", "counter", "Source bytes of converted files",
+               [({}, counters.get("bytes_in", 0))])
+        metric("psp_bytes_out_total", "counter", "Bytes written to MP_ROOT",
+               [({}, counters.get("bytes_out", 0))])
+        metric("psp_encoded_seconds_total", "counter", "Seconds of video encoded",
+               [({}, counters.get("encoded_seconds", 0))])
+        metric("psp_encoded_frames_total", "counter", "Frames encoded",
+               [({}, counters.get("encoded_frames", 0))])
+        metric("psp_jobs_active", "gauge", "File jobs in progress", [({}, active)])
+        metric("psp_batches_total", "counter", "Batches started", [({}, batches)])
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """HTTP-сервер /metrics для Prometheus в фоновом потоке (только localhost по умолчанию)"""
+
+    def __init__(self, metrics, port, host="127.0.0.1"):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # запросы не попадают в лог конвертации
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, name="metrics-http", daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
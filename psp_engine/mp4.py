@@ -0,0 +1,194 @@
+"""Разбор заголовка MP4 (moov) без запуска ffprobe"""
+import os
+import struct
+
+from .media_info import MediaInfo, StreamInfo
+
+# Профили H.264 из avcC (AVCProfileIndication)
+AVC_PROFILES = {66: "Baseline", 77: "Main", 88: "Extended", 100: "High", 110: "High 10", 122: "High 4:2:2", 244: "High 4:4:4"}
+# objectTypeIndication дескриптора esds
+AAC_OBJECT_TYPES = {0x40, 0x66, 0x67, 0x68}
+
+# Больше moov быть не может: даже у многочасового файла таблицы занимают мегабайты
+MAX_MOOV_SIZE = 256 * 1024 * 1024
+
+
+def iter_boxes(data, offset=0, end=None):
+    """(тип, начало содержимого, конец) для боксов подряд внутри data"""
+    end = len(data) if end is None else end
+    while offset + 8 <= end:
+        size, kind = struct.unpack_from(">I4s", data, offset)
+        header = 8
+        if size == 1:
+            if offset + 16 > end:
+                return
+            size = struct.unpack_from(">Q", data, offset + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header or offset + size > end:
+            return
+        yield kind.decode("latin-1"), offset + header, offset + size
+        offset += size
+
+
+def find_box(data, path, offset=0, end=None):
+    """(начало, конец) содержимого бокса по пути вида "mdia/minf/stbl"; None, если нет"""
+    for name in path.split("/"):
+        for kind, start, stop in iter_boxes(data, offset, end):
+            if kind == name:
+                offset, end = start, stop
+                break
+        else:
+            return None
+    return offset, end
+
+
+def read_top_level(path):
+    """Порядок боксов верхнего уровня и содержимое moov"""
+    order, moov = [], None
+    file_size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        offset = 0
+        while offset + 8 <= file_size:
+            f.seek(offset)
+            header = f.read(16)
+            size, kind = struct.unpack_from(">I4s", header)
+            header_size = 8
+            if size == 1:
+                size = struct.unpack_from(">Q", header, 8)[0]
+                header_size = 16
+            elif size == 0:
+                size = file_size - offset
+            if size < header_size:
+                raise ValueError("Поврежденный заголовок MP4")
+            kind = kind.decode("latin-1")
+            order.append(kind)
+            if kind == "moov":
+                if size > MAX_MOOV_SIZE:
+                    raise ValueError("Слишком большой moov")
+                f.seek(offset + header_size)
+                moov = f.read(size - header_size)
+            offset += size
+    if moov is None:
+        raise ValueError("В файле нет moov — это не MP4 или запись не завершена")
+    return order, moov
+
+
+def parse_timing(data, start):
+    """(timescale, duration) из mvhd/mdhd"""
+    if data[start] == 1:
+        timescale, duration = struct.unpack_from(">IQ", data, start + 4 + 16)
+    else:
+        timescale, duration = struct.unpack_from(">II", data, start + 4 + 8)
+    return timescale, duration
+
+
+def descriptor(data, offset):
+    """(тег, начало содержимого, длина) дескриптора MPEG-4 в esds"""
+    tag = data[offset]
+    offset += 1
+    length = 0
+    for _ in range(4):
+        byte = data[offset]
+        offset += 1
+        length = (length << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            break
+    return tag, offset, length
+
+
+def aac_object_type(data, start, end):
+    """objectTypeIndication из esds (бокс внутри mp4a)"""
+    box = find_box(data, "esds", start, end)
+    if box is None:
+        return None
+    offset = box[0] + 4  # версия и флаги
+    tag, offset, _ = descriptor(data, offset)
+    if tag != 0x03:
+        return None
+    flags = data[offset + 2]
+    offset += 3
+    if flags & 0x80:
+        offset += 2
+    if flags & 0x40:
+        offset += 1 + data[offset]
+    if flags & 0x20:
+        offset += 2
+    tag, offset, _ = descriptor(data, offset)
+    return data[offset] if tag == 0x04 else None
+
+
+def parse_track(data, index, start, end):
+    """StreamInfo дорожки trak; None для дорожек, кроме видео и звука"""
+    hdlr = find_box(data, "mdia/hdlr", start, end)
+    mdhd = find_box(data, "mdia/mdhd", start, end)
+    stbl = find_box(data, "mdia/minf/stbl", start, end)
+    if not (hdlr and mdhd and stbl):
+        return None
+    handler = data[hdlr[0] + 8:hdlr[0] + 12].decode("latin-1")
+    timescale, _ = parse_timing(data, mdhd[0])
+
+    stsd = find_box(data, "stsd", *stbl)
+    if stsd is None:
+        return None
+    # Первая запись описания: после версии, флагов и числа записей
+    entries = list(iter_boxes(data, stsd[0] + 8, stsd[1]))
+    if not entries:
+        return None
+    codec, entry_start, entry_end = entries[0]
+
+    if handler == "vide":
+        width, height = struct.unpack_from(">HH", data, entry_start + 24)
+        stream = StreamInfo(index=index, codec_type="video", codec_name=codec, width=width, height=height)
+        if codec in ("avc1", "avc3"):
+            stream.codec_name = "h264"
+            avcc = find_box(data, "avcC", entry_start + 78, entry_end)
+            if avcc:
+                profile, compatibility, level = data[avcc[0] + 1:avcc[0] + 4]
+                name = AVC_PROFILES.get(profile, str(profile))
+                if profile == 66 and compatibility & 0x40:
+                    name = "Constrained Baseline"
+                stream.profile, stream.level = name, level
+        stts = find_box(data, "stts", *stbl)
+        if stts and timescale:
+            count = struct.unpack_from(">I", data, stts[0] + 4)[0]
+            frames = ticks = 0
+            for n in range(count):
+                sample_count, delta = struct.unpack_from(">II", data, stts[0] + 8 + n * 8)
+                frames += sample_count
+                ticks += sample_count * delta
+            if ticks:
+                stream.fps = frames * timescale / ticks
+        return stream
+
+    if handler == "soun":
+        channels, _, _, _, rate = struct.unpack_from(">HHHHI", data, entry_start + 16)
+        stream = StreamInfo(index=index, codec_type="audio", codec_name=codec, channels=channels, sample_rate=rate >> 16)
+        if codec == "mp4a" and aac_object_type(data, entry_start + 28, entry_end) in AAC_OBJECT_TYPES:
+            stream.codec_name = "aac"
+        return stream
+    return None
+
+
+def read_mp4_info(path):
+    """(MediaInfo, faststart) по заголовку MP4; ValueError, если файл не разобрать.
+
+    faststart — moov записан перед mdat, PSP начинает показ без чтения конца файла.
+    """
+    try:
+        order, moov = read_top_level(path)
+        info = MediaInfo(path=path, size=os.path.getsize(path), format_name="mp4")
+        mvhd = find_box(moov, "mvhd")
+        if mvhd:
+            timescale, duration = parse_timing(moov, mvhd[0])
+            info.duration = duration / timescale if timescale else 0.0
+        tracks = [(start, end) for kind, start, end in iter_boxes(moov) if kind == "trak"]
+        for index, (start, end) in enumerate(tracks):
+            stream = parse_track(moov, index, start, end)
+            if stream:
+                info.streams.append(stream)
+    except (struct.error, IndexError) as e:
+        raise ValueError(f"Поврежденный moov: {e}")
+    faststart = "mdat" in order and order.index("moov") < order.index("mdat")
+    return info, faststart
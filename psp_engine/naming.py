@@ -0,0 +1,137 @@
+"""Имена M4Vxxxxx.MP4 в папке PSP: индекс занятых номеров и каталог исходников"""
+import json
+import os
+import re
+import threading
+
+# Файлы PSP и недописанные копии (staging.finalize) занимают номер одинаково
+NAME_RE = re.compile(r"^(?:\.psp_part_)?M4V(\d{5})\.MP4$", re.IGNORECASE)
+FIRST_NUMBER = 10000
+LAST_NUMBER = 99999
+
+CATALOG_FILENAME = ".psp_catalog.json"
+
+
+def psp_name(number):
+    return f"M4V{number:05d}.MP4"
+
+
+def name_number(filename):
+    """Номер из имени M4Vxxxxx.MP4; None для остальных файлов"""
+    match = NAME_RE.match(filename or "")
+    return int(match.group(1)) if match else None
+
+
+class NameIndex:
+    """Номера M4V одной папки PSP.
+
+    Папка читается один раз, дальше номера выдаются из памяти под
+    блокировкой: параллельные задачи не получают одно имя и не проверяют
+    диск в цикле. Номера идут по возрастанию, поэтому список на PSP
+    совпадает с порядком конвертации; после 99999 заполняются пропуски.
+
+    Каталог (.psp_catalog.json) хранит исходник и описание каждого файла:
+    повторная конвертация и переименование того же исходника дают прежнее имя.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.catalog_path = os.path.join(directory, CATALOG_FILENAME)
+        self.lock = threading.Lock()
+        self.catalog = self._load_catalog()  # имя -> запись
+        self.by_source = {entry.get("source"): name for name, entry in self.catalog.items()}
+        self.used = set()
+        self.pending = set()  # выданы задачам, файл еще не на месте
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    number = name_number(entry.name)
+                    if number is not None:
+                        self.used.add(number)
+        except FileNotFoundError:
+            pass
+        self.next_number = max(self.used, default=FIRST_NUMBER - 1) + 1
+
+    def _load_catalog(self):
+        try:
+            with open(self.catalog_path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return {name: entry for name, entry in data.items() if isinstance(entry, dict)} if isinstance(data, dict) else {}
+
+    def allocate(self, source=None, preferred=None):
+        """Путь для результата исходника.
+
+        preferred (прежний результат из манифеста) и имя из каталога
+        используются повторно — файл заменяется на месте; иначе выдается
+        следующий свободный номер. Номер занят до release или record.
+        """
+        names = []
+        if preferred and os.path.dirname(os.path.abspath(preferred)) == os.path.abspath(self.directory):
+            names.append(os.path.basename(preferred))
+        with self.lock:
+            if source is not None:
+                names.append(self.by_source.get(source))
+            number = None
+            for name in names:
+                candidate = name_number(name)
+                if candidate is None or candidate in self.pending:
+                    continue
+                # Имя из манифеста могло достаться другому исходнику по каталогу
+                if self.catalog.get(psp_name(candidate), {}).get("source") in (None, source):
+                    number = candidate
+                    break
+            if number is None:
+                number = self._next_free()
+            self.used.add(number)
+            self.pending.add(number)
+        return os.path.join(self.directory, psp_name(number))
+
+    def _next_free(self):
+        if self.next_number <= LAST_NUMBER:
+            number = self.next_number
+            self.next_number += 1
+            return number
+        for number in range(FIRST_NUMBER, LAST_NUMBER + 1):
+            if number not in self.used:
+                return number
+        raise Exception(f"Нет свободных имен M4V в {self.directory}")
+
+    def output_for(self, source):
+        """Путь готового файла исходника по каталогу; None, если записи или файла нет"""
+        with self.lock:
+            name = self.by_source.get(source)
+        if name is None:
+            return None
+        path = os.path.join(self.directory, name)
+        return path if os.path.exists(path) else None
+
+    def release(self, path):
+        """Отмена выданного имени: если файл так и не появился, номер снова свободен"""
+        number = name_number(os.path.basename(path))
+        with self.lock:
+            self.pending.discard(number)
+            if not os.path.exists(path):
+                self.used.discard(number)
+
+    def record(self, path, source, **fields):
+        """Запись каталога для готового файла; каталог сразу сохраняется"""
+        name = os.path.basename(path)
+        with self.lock:
+            self.pending.discard(name_number(name))
+            previous = self.catalog.get(name, {}).get("source")
+            if previous is not None and self.by_source.get(previous) == name:
+                del self.by_source[previous]
+            old_name = self.by_source.get(source)
+            if old_name and old_name != name:
+                self.catalog.pop(old_name, None)
+            self.catalog[name] = dict(fields, source=source)
+            self.by_source[source] = name
+            self._save()
+
+    def _save(self):
+        temp = f"{self.catalog_path}.{os.getpid()}.tmp"
+        with open(temp, "w", encoding="utf-8") as f:
+            json.dump(dict(sorted(self.catalog.items())), f, ensure_ascii=False, indent=1)
+        os.replace(temp, self.catalog_path)
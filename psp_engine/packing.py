@@ -0,0 +1,187 @@
+"""Раскладка пакета по картам памяти заданного объема"""
+import os
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from .bitrate import MIN_VIDEO_BITRATE, expected_video_rate, predict_size
+
+# Запас на файловую систему (FAT32, кластеры) от объема карты
+FS_RESERVE = 0.02
+# На файл: обложка .THM и .txt занимают минимум по кластеру
+PER_FILE_RESERVE = 64 * 1024
+
+# Папка дерева MP_ROOT для каждой карты внутри папки с видео
+STICK_DIR = "STICK{}"
+
+
+def parse_size(value):
+    """"4G", "3.8GB", "512M", "32000000" в байтах (десятичные единицы, как на упаковке)"""
+    text = str(value).strip().upper().rstrip("B")
+    scale = {"K": 1000, "M": 1000 ** 2, "G": 1000 ** 3, "T": 1000 ** 4}.get(text[-1:], 1)
+    try:
+        return int(float(text.rstrip("KMGT")) * scale)
+    except ValueError:
+        raise ValueError(f"Неверный объем: {value}")
+
+
+def format_size(size):
+    return f"{size / 1000 ** 3:.2f} ГБ" if size >= 1000 ** 3 else f"{size / 1000 ** 2:.1f} МБ"
+
+
+@dataclass
+class PackItem:
+    path: str
+    duration: float
+    video_rate: int = 0  # битрейт видео по плану, бит/с; 0 — видео копируется
+    audio_rate: int = 0
+    complexity: float = 0.0
+    fixed_size: int = 0  # байты, которые не зависят от битрейта (копируемые дорожки)
+    # CRF при неизмеренной сложности: прогноз по maxrate — верхний предел, а не ожидание
+    upper_bound: bool = False
+    own_cap: Optional[int] = None  # предел битрейта только этого файла: иначе он больше карты
+    stick: Optional[int] = None
+
+    def cap_at(self, cap=None):
+        """Действующий предел битрейта видео при общем пределе cap"""
+        caps = [c for c in (cap, self.own_cap) if c]
+        return min(caps) if caps else None
+
+    def size_at(self, cap=None):
+        """Прогноз размера при пределе битрейта видео cap (None — без предела)"""
+        size = self.fixed_size + PER_FILE_RESERVE
+        if self.video_rate:
+            cap = self.cap_at(cap)
+            rate = min(self.video_rate, cap) if cap else self.video_rate
+            size += predict_size(self.duration, expected_video_rate(rate, self.complexity), self.audio_rate)
+        return size
+
+
+def stick_usage(base):
+    """Занято на уже созданных картах STICK1, STICK2, … в папке base, байт по порядку"""
+    used = []
+    while True:
+        top = os.path.join(base, STICK_DIR.format(len(used) + 1))
+        if not os.path.isdir(top):
+            return used
+        size = 0
+        for root, _, files in os.walk(top):
+            for name in files:
+                try:
+                    size += os.path.getsize(os.path.join(root, name)) + PER_FILE_RESERVE
+                except OSError:
+                    continue
+        used.append(size)
+
+
+@dataclass
+class Packing:
+    capacity: int
+    video_cap: Optional[int] = None  # общий предел битрейта видео, если пришлось уменьшить
+    sticks: List[List[PackItem]] = field(default_factory=list)
+    oversized: List[PackItem] = field(default_factory=list)  # не помещаются даже на пустую карту
+    used: List[int] = field(default_factory=list)  # уже занято на картах до раскладки
+
+    @property
+    def usable(self):
+        return int(self.capacity * (1 - FS_RESERVE))
+
+    def stick_size(self, n):
+        used = self.used[n] if n < len(self.used) else 0
+        return used + sum(item.size_at(self.video_cap) for item in self.sticks[n])
+
+    @property
+    def upper_bounds(self):
+        """Разложенные файлы, чей прогноз — только верхний предел размера"""
+        return [item for stick in self.sticks for item in stick if item.upper_bound]
+
+    def assignments(self):
+        """путь -> (номер карты с 1, предел битрейта видео)"""
+        return {
+            item.path: (n + 1, item.cap_at(self.video_cap))
+            for n, items in enumerate(self.sticks)
+            for item in items
+        }
+
+
+def first_fit(items, usable, cap, used=()):
+    """Первый подходящий по убыванию размера: список карт (used — уже занято на первых картах)"""
+    sticks = [[] for _ in used]
+    free = [usable - size for size in used]
+    for item in sorted(items, key=lambda i: i.size_at(cap), reverse=True):
+        size = item.size_at(cap)
+        for n, space in enumerate(free):
+            if size <= space:
+                sticks[n].append(item)
+                free[n] -= size
+                break
+        else:
+            sticks.append([item])
+            free.append(usable - size)
+    return sticks
+
+
+def fit_item(item, usable):
+    """Понижает битрейт одного файла, пока он не поместится на пустую карту.
+
+    Файл, который не помещается даже на MIN_VIDEO_BITRATE, остается как есть.
+    """
+    if not item.video_rate or item.size_at() <= usable:
+        return
+    item.own_cap = MIN_VIDEO_BITRATE
+    if item.size_at() > usable:
+        item.own_cap = None
+        return
+    low, high = MIN_VIDEO_BITRATE, item.video_rate
+    while high - low > 1000:
+        middle = (low + high) // 2
+        item.own_cap = middle
+        if item.size_at() <= usable:
+            low = middle
+        else:
+            high = middle
+    item.own_cap = low
+
+
+def pack(items, capacity, max_sticks=0, used=()):
+    """Раскладка по картам; при max_sticks битрейт видео снижается, пока все не поместится.
+
+    used — байты, уже записанные на карты STICK1… прошлыми пакетами: новые
+    файлы дополняют их, а не начинают раскладку заново.
+    Только арифметика по прогнозам — тысячи файлов раскладываются мгновенно.
+    """
+    packing = Packing(capacity, used=list(used))
+    usable = packing.usable
+    top_rate = max((item.video_rate for item in items), default=0)
+    budget = usable * max_sticks - sum(used)
+
+    # Файл больше карты получает свой предел битрейта, а не пропускается
+    for item in items:
+        fit_item(item, usable)
+
+    def fits(cap):
+        return [item for item in items if item.size_at(cap) <= usable]
+
+    cap = None
+    if max_sticks:
+        total = lambda c: sum(item.size_at(c) for item in items)  # noqa: E731
+        if top_rate and total(None) > budget:
+            # Бинарный поиск наибольшего общего предела, при котором сумма помещается
+            low, high = MIN_VIDEO_BITRATE, top_rate
+            while high - low > 1000:
+                middle = (low + high) // 2
+                if total(middle) <= budget:
+                    low = middle
+                else:
+                    high = middle
+            cap = low
+        # Раскладка не бывает идеальной — понижаем дальше, пока карт больше лимита
+        while top_rate and len(first_fit(fits(cap), usable, cap, used)) > max_sticks and (cap or top_rate) > MIN_VIDEO_BITRATE:
+            cap = max(MIN_VIDEO_BITRATE, int((cap or top_rate) * 0.97))
+
+    packing.video_cap = cap
+    packing.oversized = [item for item in items if item.size_at(cap) > usable]
+    packing.sticks = first_fit(fits(cap), usable, cap, used)
+    for n, stick in enumerate(packing.sticks):
+        for item in stick:
+            item.stick = n + 1
+    return packing
@@ -0,0 +1,128 @@
+"""Постоянный кэш результатов анализа видео (SQLite)"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+def user_cache_dir():
+    """Папка для кэшей программы"""
+    base = os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "psp_converter")
+
+
+def default_cache_path():
+    return os.path.join(user_cache_dir(), "probe_cache.sqlite")
+
+
+class ProbeCache:
+    """Кэш информации о файлах с ключом (путь, размер, mtime).
+
+    Запись считается устаревшей, если у файла изменился размер или время
+    изменения. При превышении max_entries удаляются давно не читавшиеся записи.
+    """
+
+    # Увеличивается при изменении формата сохраняемой информации
+    SCHEMA_VERSION = 4
+    # Как часто (в записях) проверять размер кэша
+    EVICT_EVERY = 100
+
+    def __init__(self, path=None, max_entries=50000):
+        self.path = path or default_cache_path()
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self._puts = 0
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Одно соединение на все потоки, доступ через lock
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._init_schema()
+
+    def _init_schema(self):
+        with self.lock, self.conn:
+            version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+            if version != self.SCHEMA_VERSION:
+                self.conn.execute("DROP TABLE IF EXISTS probe")
+                self.conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS probe ("
+                " path TEXT PRIMARY KEY,"
+                " size INTEGER NOT NULL,"
+                " mtime_ns INTEGER NOT NULL,"
+                " info TEXT NOT NULL,"
+                " accessed REAL NOT NULL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS probe_accessed ON probe (accessed)")
+
+    @staticmethod
+    def _key(path):
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        return path, st.st_size, st.st_mtime_ns
+
+    def get(self, path):
+        """Информация о файле или None, если записи нет или она устарела"""
+        try:
+            path, size, mtime_ns = self._key(path)
+        except OSError:
+            return None
+
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                "SELECT size, mtime_ns, info FROM probe WHERE path = ?", (path,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[0] != size or row[1] != mtime_ns:
+                self.conn.execute("DELETE FROM probe WHERE path = ?", (path,))
+                return None
+            self.conn.execute("UPDATE probe SET accessed = ? WHERE path = ?", (time.time(), path))
+        return json.loads(row[2])
+
+    def put(self, path, info):
+        try:
+            path, size, mtime_ns = self._key(path)
+        except OSError:
+            return
+
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO probe (path, size, mtime_ns, info, accessed) VALUES (?, ?, ?, ?, ?)",
+                (path, size, mtime_ns, json.dumps(info), time.time()),
+            )
+            self._puts += 1
+            if self._puts % self.EVICT_EVERY == 0:
+                self._evict()
+
+    def invalidate(self, path):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM probe WHERE path = ?", (os.path.abspath(path),))
+
+    def clear(self):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM probe")
+
+    def evict(self):
+        """Удаление самых старых записей сверх max_entries"""
+        with self.lock, self.conn:
+            self._evict()
+
+    def _evict(self):
+        count = self.conn.execute("SELECT COUNT(*) FROM probe").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self.conn.execute(
+                "DELETE FROM probe WHERE path IN (SELECT path FROM probe ORDER BY accessed LIMIT ?)",
+                (excess,),
+            )
+
+    def count(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM probe").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
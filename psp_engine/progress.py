@@ -0,0 +1,186 @@
+"""Разбор вывода ffmpeg -progress и расчет ETA пакета"""
+import threading
+import time
+
+
+def parse_time(value):
+    """Время ffmpeg "ЧЧ:ММ:СС.мкс" в секундах; 0 если значение неизвестно"""
+    try:
+        h, m, s = value.split(":")
+        return int(h) * 3600 + int(m) * 60 + float(s)
+    except (ValueError, AttributeError):
+        return 0.0
+
+
+def parse_number(value):
+    """Число из поля -progress ("2.5x", "120.3", "N/A")"""
+    try:
+        return float((value or "").rstrip("x"))
+    except ValueError:
+        return 0.0
+
+
+def format_duration(seconds):
+    """Секунды в виде Ч:ММ:СС"""
+    if seconds is None:
+        return "--:--"
+    seconds = int(max(0, seconds))
+    h, rest = divmod(seconds, 3600)
+    m, s = divmod(rest, 60)
+    return f"{h}:{m:02d}:{s:02d}" if h else f"{m:02d}:{s:02d}"
+
+
+def format_file_progress(index, info):
+    """Строка прогресса файла вида «[3] 42% · 120 fps · 2.5x · ~01:20»"""
+    text = f"[{index}] {info['percent']:.0f}%"
+    if info.get("fps"):
+        text += f" · {info['fps']:.0f} fps"
+    if info.get("speed"):
+        text += f" · {info['speed']:.1f}x"
+    if info.get("eta") is not None and info["percent"] < 100:
+        text += f" · ~{format_duration(info['eta'])}"
+    return text
+
+
+class FileProgress:
+    """Состояние кодирования одного файла по блокам ffmpeg -progress.
+
+    ffmpeg пишет строки key=value, каждый блок заканчивается строкой
+    progress=continue или progress=end.
+    """
+
+    def __init__(self, duration):
+        self.duration = duration or 0
+        self.fields = {}
+        self.out_time = 0.0
+        self.fps = 0.0
+        self.speed = 0.0
+        self.finished = False
+
+    def feed(self, line):
+        """Обработка одной строки; True — получен полный блок"""
+        key, sep, value = line.strip().partition("=")
+        if not sep:
+            return False
+        self.fields[key] = value.strip()
+        if key != "progress":
+            return False
+
+        self._apply()
+        self.finished = self.fields["progress"] == "end"
+        return True
+
+    def _apply(self):
+        fields = self.fields
+        # out_time_ms в ffmpeg исторически тоже в микросекундах
+        micros = fields.get("out_time_us") or fields.get("out_time_ms")
+        if micros and micros.lstrip("-").isdigit():
+            self.out_time = max(0.0, int(micros) / 1_000_000)
+        elif "out_time" in fields:
+            self.out_time = parse_time(fields["out_time"])
+        self.fps = parse_number(fields.get("fps"))
+        self.speed = parse_number(fields.get("speed"))
+
+    @property
+    def percent(self):
+        if self.finished:
+            return 100.0
+        if self.duration <= 0:
+            return 0.0
+        return min(100.0, self.out_time / self.duration * 100)
+
+    @property
+    def eta(self):
+        if self.finished:
+            return 0.0
+        if self.duration <= 0 or self.speed <= 0:
+            return None
+        return max(0.0, (self.duration - self.out_time) / self.speed)
+
+    def snapshot(self):
+        return {
+            "percent": self.percent,
+            "out_time": self.out_time,
+            "duration": self.duration,
+            "fps": self.fps,
+            "speed": self.speed,
+            "eta": self.eta,
+        }
+
+
+class BatchProgress:
+    """Прогресс пакета, взвешенный по длительности файлов.
+
+    Для файлов, которые еще не проанализированы, берется средняя
+    длительность уже известных.
+    """
+
+    def __init__(self, total_files):
+        self.total_files = total_files
+        self.started = time.monotonic()
+        self.durations = {}  # номер файла -> длительность (0 если неизвестна)
+        self.encoded = {}  # номер файла -> закодировано секунд
+        self.finished = set()
+        self.skipped = set()  # не требуют работы и не учитываются в ETA
+        self.lock = threading.Lock()
+
+    def set_total(self, total_files):
+        """Число файлов выросло (обход папки еще идет)"""
+        with self.lock:
+            self.total_files = total_files
+
+    def add_file(self, index, duration):
+        with self.lock:
+            self.durations[index] = duration or 0
+
+    def update(self, index, seconds):
+        with self.lock:
+            self.encoded[index] = seconds
+
+    def finish(self, index):
+        with self.lock:
+            self.durations.setdefault(index, 0)
+            self.finished.add(index)
+
+    def skip(self, index):
+        with self.lock:
+            self.durations.pop(index, None)
+            self.encoded.pop(index, None)
+            self.skipped.add(index)
+
+    def snapshot(self):
+        with self.lock:
+            known = [d for d in self.durations.values() if d > 0]
+            average = sum(known) / len(known) if known else 0
+
+            def weight(i):
+                return self.durations[i] or average
+
+            total = sum(weight(i) for i in self.durations)
+            total += average * (self.total_files - len(self.durations) - len(self.skipped))
+            done = sum(
+                weight(i) if i in self.finished else min(self.encoded.get(i, 0), weight(i))
+                for i in self.durations
+            )
+            done_files = len(self.finished) + len(self.skipped)
+
+        elapsed = time.monotonic() - self.started
+        if total > 0:
+            fraction = done / total
+        else:
+            fraction = done_files / self.total_files if self.total_files else 0
+
+        # Скорость пакета — секунд видео за секунду работы по всем задачам
+        rate = done / elapsed if elapsed > 0 else 0
+        eta = (total - done) / rate if rate > 0 else None
+
+        return {
+            "fraction": min(1.0, fraction),
+            "done_files": done_files,
+            "total_files": self.total_files,
+            "media_done": done,
+            "media_total": total,
+            "speed": rate,
+            "elapsed": elapsed,
+            "eta": eta,
+        }
@@ -0,0 +1,76 @@
+"""Потоковый поиск видео: файлы выдаются по мере обхода дерева"""
+import fnmatch
+import os
+import threading
+
+
+def matches(rel_path, patterns):
+    """Совпадает ли путь (относительно корня, через /) или его имя с одним из шаблонов"""
+    name = rel_path.rsplit("/", 1)[-1]
+    return any(fnmatch.fnmatch(rel_path, p) or fnmatch.fnmatch(name, p) for p in patterns)
+
+
+class VideoScanner:
+    """Ленивый обход папки через os.scandir.
+
+    Итерация выдает пути видео сразу, как только они найдены, поэтому
+    конвертация начинается до конца обхода. accept(имя) и skip_dir(имя)
+    отбирают видео и пропускают рабочие папки; include/exclude — шаблоны
+    glob для пути относительно root или имени. exclude действует и на
+    каталоги: исключенный каталог не обходится.
+    """
+
+    def __init__(self, root, accept, skip_dir, include=(), exclude=()):
+        self.root = root
+        self.accept = accept
+        self.skip_dir = skip_dir
+        self.include = list(include or ())
+        self.exclude = list(exclude or ())
+        self.discovered = 0
+        self.dirs_scanned = 0
+        self.finished = threading.Event()
+
+    def _relative(self, path):
+        return os.path.relpath(path, self.root).replace(os.sep, "/")
+
+    def accepts(self, path):
+        """Нужно ли конвертировать файл (полный путь)"""
+        if not self.accept(os.path.basename(path)):
+            return False
+        rel_path = self._relative(path)
+        if self.include and not matches(rel_path, self.include):
+            return False
+        return not (self.exclude and matches(rel_path, self.exclude))
+
+    def skips_dir(self, path):
+        """Пропускается ли каталог (полный путь) вместе со всем содержимым"""
+        if self.skip_dir(os.path.basename(path)):
+            return True
+        return bool(self.exclude and matches(self._relative(path), self.exclude))
+
+    def __iter__(self):
+        self.discovered = 0
+        self.dirs_scanned = 0
+        self.finished.clear()
+        try:
+            stack = [self.root]
+            while stack:
+                subdirs = []
+                try:
+                    with os.scandir(stack.pop()) as entries:
+                        for entry in entries:
+                            # Тип берется из записи каталога — без лишнего stat на NAS
+                            if entry.is_dir(follow_symlinks=False):
+                                if not self.skips_dir(entry.path):
+                                    subdirs.append(entry.path)
+                            elif self.accepts(entry.path):
+                                self.discovered += 1
+                                yield entry.path
+                except OSError:
+                    continue
+                finally:
+                    self.dirs_scanned += 1
+                # Каталоги обходятся в порядке появления, как в os.walk
+                stack.extend(reversed(subdirs))
+        finally:
+            self.finished.set()
@@ -0,0 +1,180 @@
+"""Распределение задач между кодерами (GPU и CPU одновременно)"""
+import collections
+import heapq
+import itertools
+import threading
+import time
+import traceback
+
+# Порядок задач пакета
+ORDER_SCAN = "scan"  # как найдены при обходе
+ORDER_SHORTEST = "shortest"  # сначала короткие: первые результаты готовы раньше
+ORDER_LONGEST = "longest"  # сначала длинные: меньше общее время на нескольких задачах
+ORDERS = (ORDER_SCAN, ORDER_SHORTEST, ORDER_LONGEST)
+
+
+def order_jobs(items, cost, rank=None, order=ORDER_SCAN):
+    """Задачи по приоритету rank(item) (меньше — раньше), затем по стоимости cost(item).
+
+    Сортировка устойчивая: при равных ключах сохраняется исходный порядок.
+    Длинные первыми — жадное распределение LPT: свободный слот берет
+    самую длинную из оставшихся, и в конце пакета не остается одного
+    длинного файла на фоне простаивающих слотов.
+    """
+    rank = rank or (lambda item: 0)
+    if order == ORDER_SHORTEST:
+        return sorted(items, key=lambda item: (rank(item), cost(item)))
+    if order == ORDER_LONGEST:
+        return sorted(items, key=lambda item: (rank(item), -cost(item)))
+    return sorted(items, key=rank)
+
+
+class EncoderLane:
+    """Кодер как ресурс: сколько задач он выполняет одновременно.
+
+    config — готовая конфигурация кодера вместо get_encoder_config
+    (например, для проверки планировщика без GPU). После max_failures
+    ошибок подряд аппаратная дорожка перестает брать задачи.
+    """
+
+    def __init__(self, encoder, limit, config=None, fallback=True, max_failures=3):
+        self.encoder = encoder
+        self.limit = max(1, limit)
+        self.config = config
+        self.fallback = fallback  # при ошибке аппаратного кодера повторить на libx264
+        self.max_failures = max_failures
+        self.failures = 0
+        self.completed = 0
+        self.lock = threading.Lock()
+
+    @property
+    def hardware(self):
+        return self.encoder != "cpu"
+
+    @property
+    def disabled(self):
+        return bool(self.hardware and self.max_failures and self.failures >= self.max_failures)
+
+    def record(self, ok):
+        """Учет результата задачи; True — дорожка только что отключена"""
+        with self.lock:
+            was_disabled = self.disabled
+            if ok:
+                self.failures = 0
+                self.completed += 1
+            else:
+                self.failures += 1
+            return self.disabled and not was_disabled
+
+    def __repr__(self):
+        return f"EncoderLane({self.encoder!r}, {self.limit})"
+
+
+class LaneScheduler:
+    """Общая очередь задач: задачу берет первый освободившийся слот любой дорожки.
+
+    Для каждой дорожки запускается limit потоков; func(job, lane)
+    вызывается в потоке слота. Порядок выдачи задач сохраняется.
+    Если func возвращает число секунд, задача возвращается в очередь и
+    выдается снова не раньше, чем через это время (повтор после ошибки);
+    пока она ждет, слоты берут следующие задачи.
+    """
+
+    def __init__(self, lanes):
+        self.lanes = [lane for lane in lanes if lane.limit > 0]
+        if not self.lanes:
+            raise ValueError("Нет дорожек для кодирования")
+
+    @property
+    def slots(self):
+        return sum(lane.limit for lane in self.lanes)
+
+    def run(self, jobs, func, stop=None, on_error=None):
+        """Выполнение всех задач; возвращается после завершения последней.
+
+        jobs может быть генератором: он читается в отдельном потоке, и слоты
+        берут задачи сразу, не дожидаясь конца последовательности. Исключение
+        из func не останавливает слот: задача передается в on_error(job, error)
+        (без него печатается трассировка) и больше не выдается.
+        """
+        ready = collections.deque()
+        fed = threading.Event()
+        # Выдача задачи и счетчик выполняемых меняются под одним условием:
+        # done() не увидит момент, когда задача уже взята, но еще не учтена
+        cond = threading.Condition()
+        delayed = []  # куча (время выдачи, номер, задача)
+        sequence = itertools.count()
+        active = [0]
+
+        def take():
+            if delayed and delayed[0][0] <= time.monotonic():
+                return heapq.heappop(delayed)[2]
+            if ready:
+                return ready.popleft()
+            return None
+
+        def next_job():
+            with cond:
+                job = take()
+                if job is None:
+                    cond.wait(0.1)
+                    job = take()
+                if job is not None:
+                    active[0] += 1
+                return job
+
+        def done():
+            with cond:
+                return fed.is_set() and not ready and not delayed and not active[0]
+
+        def feed():
+            try:
+                for job in jobs:
+                    if stop and stop():
+                        break
+                    with cond:
+                        ready.append(job)
+                        cond.notify()
+            finally:
+                fed.set()
+                with cond:
+                    cond.notify_all()
+
+        def slot(lane):
+            while not (stop and stop()):
+                # Отключенная дорожка оставляет задачи остальным, пока они есть
+                if lane.disabled and any(not other.disabled for other in self.lanes):
+                    return
+                job = next_job()
+                if job is None:
+                    if done():
+                        return
+                    continue
+                delay = None
+                try:
+                    delay = func(job, lane)
+                except Exception as e:
+                    if on_error is not None:
+                        on_error(job, e)
+                    else:
+                        traceback.print_exc()
+                finally:
+                    with cond:
+                        if delay is not None:
+                            heapq.heappush(delayed, (time.monotonic() + delay, next(sequence), job))
+                        active[0] -= 1
+                        cond.notify_all()
+
+        feeder = threading.Thread(target=feed, name="lane-feeder", daemon=True)
+        threads = [
+            threading.Thread(target=slot, args=(lane,), name=f"lane-{lane.encoder}-{n}", daemon=True)
+            for lane in self.lanes
+            for n in range(lane.limit)
+        ]
+        feeder.start()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # Остановка посреди обхода: дочитывать последовательность не нужно
+        feeder.join(timeout=1.0)
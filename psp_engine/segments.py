@@ -0,0 +1,236 @@
+"""Параллельное кодирование длинного файла по сегментам"""
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .progress import FileProgress
+
+# Сегмент короче этого не выделяется — накладные расходы запуска ffmpeg
+MIN_SEGMENT_SECONDS = 60
+# Окно поиска ключевого кадра после заданной точки разреза, секунд
+KEYFRAME_WINDOW = 10
+
+
+def find_keyframe(ffprobe_path, input_file, stream_index, target, window=KEYFRAME_WINDOW, start_time=0.0):
+    """Время первого ключевого кадра не раньше target; target, если не найден.
+
+    ffprobe читает только пакеты в окне -read_intervals, без декодирования.
+    Время считается от начала файла: start_time контейнера вычитается.
+    """
+    cmd = [
+        ffprobe_path,
+        "-v", "error",
+        "-select_streams", str(stream_index),
+        "-read_intervals", f"{target + start_time:.3f}%+{window}",
+        "-show_entries", "packet=pts_time,flags",
+        "-of", "csv=p=0",
+        input_file,
+    ]
+    try:
+        result = subprocess.run(
+            cmd,
+            capture_output=True,
+            text=True,
+            timeout=30,
+            creationflags=subprocess.CREATE_NO_WINDOW if hasattr(subprocess, 'CREATE_NO_WINDOW') else 0
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return target
+
+    for line in result.stdout.splitlines():
+        pts, _, flags = line.partition(",")
+        try:
+            pts = float(pts)
+        except ValueError:
+            continue
+        pts -= start_time
+        if "K" in flags and pts >= target:
+            return pts
+    return target
+
+
+def concat_list_line(path):
+    # Экранирование одинарных кавычек для concat demuxer
+    return "file '" + path.replace("'", "'\\''") + "'\n"
+
+
+class CombinedProgress(FileProgress):
+    """Суммарный прогресс нескольких одновременно кодируемых сегментов"""
+
+    def __init__(self, duration, parts):
+        super().__init__(duration)
+        self.parts = parts
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        with self.lock:
+            self.out_time = sum(part.out_time for part in self.parts)
+            # Сегменты идут параллельно — скорости складываются
+            active = [part for part in self.parts if not part.finished]
+            if active:
+                self.speed = sum(part.speed for part in active)
+                self.fps = sum(part.fps for part in active)
+            self.finished = all(part.finished for part in self.parts)
+
+
+class SegmentedEncoder:
+    """Кодирование длинного файла: видео частями параллельно, аудио одним проходом.
+
+    Файл режется по ключевым кадрам, каждая часть кодируется отдельным
+    ffmpeg с параметрами CPU-профиля, затем части склеиваются concat demuxer
+    без перекодирования вместе с целиковой аудиодорожкой.
+    """
+
+    def __init__(self, engine, plan, ranges, workers):
+        self.engine = engine
+        self.plan = plan
+        self.ranges = ranges
+        self.workers = workers
+        self.aborted = False
+
+    @classmethod
+    def for_plan(cls, engine, plan):
+        """SegmentedEncoder, если файл стоит кодировать частями, иначе None"""
+        from .engine import MODE_ENCODE
+
+        info = plan.get("info")
+        if (
+            not engine.segment_min_duration
+            or plan["mode"] != MODE_ENCODE
+            or plan.get("outputs")  # несколько профилей идут одним запуском
+            or plan["encoder_config"]["vcodec"] != "libx264"
+            or not engine.ffprobe_path
+            or not info or not info.video
+            or plan["duration"] < max(engine.segment_min_duration, MIN_SEGMENT_SECONDS * 2)
+        ):
+            return None
+
+        cores = os.cpu_count() or 1
+        workers = max(2, cores // engine.CPU_THREADS_PER_JOB // max(1, engine.batch_workers))
+        # Частей больше, чем потоков — выравнивание нагрузки к концу файла
+        count = engine.segment_count or workers * 2
+        count = min(count, int(plan["duration"] // MIN_SEGMENT_SECONDS))
+        if count < 2:
+            return None
+
+        ranges = cls.split(engine.ffprobe_path, plan["input_file"], info.video.index, plan["duration"], count, info.start_time)
+        if len(ranges) < 2:
+            return None
+        return cls(engine, plan, ranges, min(workers, len(ranges)))
+
+    @staticmethod
+    def split(ffprobe_path, input_file, stream_index, duration, count, start_time=0.0):
+        """Границы частей [(начало, длительность)], выровненные по ключевым кадрам"""
+        points = [0.0]
+        for i in range(1, count):
+            point = find_keyframe(ffprobe_path, input_file, stream_index, duration * i / count, start_time=start_time)
+            if point - points[-1] >= MIN_SEGMENT_SECONDS / 2 and duration - point >= MIN_SEGMENT_SECONDS / 2:
+                points.append(point)
+        points.append(duration)
+        return [(start, end - start) for start, end in zip(points, points[1:])]
+
+    def _segment_video_args(self):
+        args = list(self.engine.video_args(self.plan))
+        # Каждой части — свой бюджет потоков libx264
+        if "-threads" in args:
+            args[args.index("-threads") + 1] = str(self.engine.CPU_THREADS_PER_JOB)
+        return args
+
+    def run(self, output_file):
+        engine = self.engine
+        plan = self.plan
+        info = plan["info"]
+        os.makedirs(plan["work_dir"], exist_ok=True)
+        work_dir = tempfile.mkdtemp(prefix=".psp_seg_", dir=plan["work_dir"])
+        started = time.monotonic()
+
+        # Контекст задачи (префикс лога, номер файла) переносится в потоки частей
+        prefix = getattr(engine._job_ctx, "prefix", "")
+        index = getattr(engine._job_ctx, "index", None)
+
+        parts = [FileProgress(length) for _, length in self.ranges]
+        progress = CombinedProgress(plan["duration"], parts)
+
+        def on_progress(_):
+            progress.refresh()
+            engine._report_file_progress(progress)
+
+        def in_job(func, *args):
+            if self.aborted or engine.stop_requested:
+                return None
+            engine._job_ctx.prefix = prefix
+            engine._job_ctx.index = index
+            try:
+                return func(*args)
+            except Exception:
+                self.aborted = True
+                raise
+            finally:
+                engine._job_ctx.prefix = ""
+                engine._job_ctx.index = None
+
+        video_args = self._segment_video_args()
+        segment_files = [os.path.join(work_dir, f"part{i:03d}.mp4") for i in range(len(self.ranges))]
+        audio_file = os.path.join(work_dir, "audio.m4a") if info.audio else None
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers + (1 if audio_file else 0)) as pool:
+                futures = []
+                if audio_file:
+                    # Аудио одним проходом — без щелчков и пропусков на стыках
+                    cmd = [
+                        engine.ffmpeg_path, "-nostats", "-progress", "pipe:1",
+                        "-i", plan["input_file"],
+                        "-vn", "-map", "0:a:0",
+                        *engine.audio_args(plan),
+                        "-f", "mp4", "-y", audio_file,
+                    ]
+                    futures.append(pool.submit(in_job, engine.run_ffmpeg, cmd))
+
+                for (start, length), segment_file, part in zip(self.ranges, segment_files, parts):
+                    cmd = [
+                        engine.ffmpeg_path, "-nostats", "-progress", "pipe:1",
+                        "-ss", f"{start:.3f}", "-t", f"{length:.3f}",
+                        "-i", plan["input_file"],
+                        "-map", f"0:{info.video.index}", "-an",
+                        *video_args,
+                        "-f", "mp4", "-y", segment_file,
+                    ]
+                    futures.append(pool.submit(in_job, engine.run_ffmpeg, cmd, part, on_progress))
+
+                for future in futures:
+                    future.result()
+
+            if engine.stop_requested:
+                raise Exception("Остановлено пользователем")
+
+            list_file = os.path.join(work_dir, "parts.txt")
+            with open(list_file, "w", encoding="utf-8") as f:
+                f.writelines(concat_list_line(path) for path in segment_files)
+
+            cmd = [
+                engine.ffmpeg_path, "-nostats", "-progress", "pipe:1",
+                "-f", "concat", "-safe", "0", "-i", list_file,
+            ]
+            if audio_file:
+                cmd.extend(["-i", audio_file, "-map", "0:v:0", "-map", "1:a:0"])
+            cmd.extend(["-c", "copy"])
+            cmd.extend(engine.container_args(output_file))
+            engine.run_ffmpeg(cmd)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        for part in parts:
+            part.finished = True
+        progress.refresh()
+
+        # Итоговая скорость — по реальному времени всего файла, а не сумма частей
+        elapsed = time.monotonic() - started
+        if elapsed > 0:
+            progress.speed = plan["duration"] / elapsed
+            progress.fps = progress.speed * 30000 / 1001
+        return progress
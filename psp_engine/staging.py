@@ -0,0 +1,97 @@
+"""Где писать временный файл и как переносить его в папку назначения"""
+import os
+import shutil
+import tempfile
+
+# Запас места в рабочей папке сверх прогноза размера
+SCRATCH_MARGIN = 1.2
+
+SCRATCH_AUTO = "auto"
+
+
+def device_of(path):
+    """Устройство (st_dev) пути или ближайшей существующей родительской папки"""
+    path = os.path.abspath(path)
+    while True:
+        try:
+            return os.stat(path).st_dev
+        except FileNotFoundError:
+            parent = os.path.dirname(path)
+            if parent == path:
+                raise
+            path = parent
+
+
+def same_device(a, b):
+    try:
+        return device_of(a) == device_of(b)
+    except OSError:
+        return False
+
+
+def free_space(path):
+    try:
+        return shutil.disk_usage(path).free
+    except OSError:
+        return 0
+
+
+def choose_work_dir(dest_dir, scratch=None, needed=0):
+    """Папка для временного результата.
+
+    Без scratch файл пишется прямо в папку назначения и потом атомарно
+    переименовывается. С scratch ("auto" — системная временная папка)
+    кодирование и перестановка moov (+faststart) идут на локальном диске,
+    а в назначение файл записывается один раз — если места хватает.
+    """
+    if not scratch:
+        return dest_dir
+    if scratch == SCRATCH_AUTO:
+        scratch = tempfile.gettempdir()
+        # Тот же диск — выигрыша нет, пишем сразу на место
+        if same_device(scratch, dest_dir):
+            return dest_dir
+    elif not prepare_scratch(scratch):
+        return dest_dir
+    if needed and free_space(scratch) < needed * SCRATCH_MARGIN:
+        return dest_dir
+    return scratch
+
+
+def prepare_scratch(scratch):
+    """Создает рабочую папку, если ее нет; False — создать не удалось"""
+    try:
+        os.makedirs(scratch, exist_ok=True)
+    except OSError:
+        return False
+    return True
+
+
+def finalize(temp_path, final_path):
+    """Атомарная установка результата на место final_path.
+
+    На том же устройстве — os.replace. Между устройствами файл копируется
+    в скрытый файл рядом с final_path, сбрасывается на диск и только потом
+    переименовывается: на карте памяти не остается недописанного MP4.
+    Возвращает True, если понадобилось копирование.
+    """
+    dest_dir = os.path.dirname(final_path)
+    if same_device(temp_path, dest_dir):
+        os.replace(temp_path, final_path)
+        return False
+
+    part = os.path.join(dest_dir, f".psp_part_{os.path.basename(final_path)}")
+    try:
+        with open(temp_path, "rb") as src, open(part, "wb") as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+            dst.flush()
+            os.fsync(dst.fileno())
+        os.replace(part, final_path)
+    except BaseException:
+        try:
+            os.remove(part)
+        except OSError:
+            pass
+        raise
+    os.remove(temp_path)
+    return True
@@ -0,0 +1,198 @@
+"""Запуск и контроль процессов ffmpeg в общем цикле asyncio"""
+import asyncio
+import collections
+import queue
+import subprocess
+import threading
+import time
+
+NO_WINDOW = subprocess.CREATE_NO_WINDOW if hasattr(subprocess, 'CREATE_NO_WINDOW') else 0
+
+# Причины досрочного завершения процесса
+REASON_CANCEL = "cancel"
+REASON_TIMEOUT = "timeout"
+REASON_STALL = "stall"
+REASON_EXIT = "exit"  # процесс завершился с ошибкой
+
+
+class FFmpegError(Exception):
+    """Ошибка запуска ffmpeg; reason — причина (REASON_*) для статистики ошибок"""
+
+    def __init__(self, message, reason=REASON_EXIT):
+        super().__init__(message)
+        self.reason = reason
+
+
+class FFmpegResult:
+    """Итог запуска: код возврата, последние строки stderr, причина остановки"""
+
+    def __init__(self, returncode, stderr, reason=None):
+        self.returncode = returncode
+        self.stderr = stderr
+        self.reason = reason
+
+    @property
+    def ok(self):
+        return self.returncode == 0 and self.reason is None
+
+
+class _Job:
+    def __init__(self, cmd, timeout, stall_timeout, stderr_lines, binary=False):
+        self.cmd = cmd
+        self.binary = binary
+        self.timeout = timeout
+        self.stall_timeout = stall_timeout
+        # Кольцевой буфер: длинное «шумное» кодирование не копит stderr целиком
+        self.stderr = collections.deque(maxlen=stderr_lines)
+        # Строки передаются в поток вызывающего — там контекст задачи и обработчики
+        self.events = queue.Queue()
+        self.started = self.last_output = time.monotonic()
+        self.cancel_requested = False
+        self.reason = None
+
+    def cancel(self):
+        self.cancel_requested = True
+
+
+class FFmpegSupervisor:
+    """Все процессы ffmpeg работают в одном фоновом цикле asyncio.
+
+    stdout и stderr читаются без блокировки рабочих потоков, процесс
+    останавливается по запросу, по общему лимиту времени или если он
+    ничего не выводит stall_timeout секунд: сначала terminate, через
+    KILL_GRACE секунд — kill.
+    """
+
+    # Как часто проверяются остановка и лимиты времени, секунд
+    POLL_INTERVAL = 0.25
+    # Сколько ждать завершения после terminate перед kill, секунд
+    KILL_GRACE = 5.0
+    # Сколько последних строк stderr хранить
+    STDERR_LINES = 200
+
+    def __init__(self):
+        self.loop = None
+        self.thread = None
+        self.lock = threading.Lock()
+        self.jobs = set()
+
+    def _ensure_loop(self):
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                self.thread = threading.Thread(target=self.loop.run_forever, name="ffmpeg-supervisor", daemon=True)
+                self.thread.start()
+            return self.loop
+
+    def run(self, cmd, on_stdout=None, on_stderr=None, timeout=0, stall_timeout=0, should_stop=None, binary=False):
+        """Запуск ffmpeg с ожиданием завершения в текущем потоке.
+
+        on_stdout/on_stderr вызываются для каждой строки в текущем потоке;
+        с binary=True on_stdout получает куски байтов (например, кадр в pipe:1).
+        Возвращает FFmpegResult; OSError, если процесс не запустился.
+        """
+        job = _Job(cmd, timeout, stall_timeout, self.STDERR_LINES, binary)
+        with self.lock:
+            self.jobs.add(job)
+        future = asyncio.run_coroutine_threadsafe(self._supervise(job), self._ensure_loop())
+        # None в очереди — процесс завершен, а все его строки уже переданы
+        future.add_done_callback(lambda _: job.events.put(None))
+        try:
+            while True:
+                if should_stop and should_stop():
+                    job.cancel()
+                try:
+                    event = job.events.get(timeout=self.POLL_INTERVAL)
+                except queue.Empty:
+                    continue
+                if event is None:
+                    break
+                kind, line = event
+                handler = on_stdout if kind == "stdout" else on_stderr
+                if handler:
+                    handler(line)
+            returncode = future.result()
+        finally:
+            with self.lock:
+                self.jobs.discard(job)
+        return FFmpegResult(returncode, list(job.stderr), job.reason)
+
+    def cancel_all(self):
+        """Остановка всех запущенных процессов"""
+        with self.lock:
+            jobs = list(self.jobs)
+        for job in jobs:
+            job.cancel()
+
+    async def _supervise(self, job):
+        process = await asyncio.create_subprocess_exec(
+            *job.cmd,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            limit=1024 * 1024,
+            creationflags=NO_WINDOW,
+        )
+        readers = [
+            asyncio.ensure_future(self._pump(process.stdout, job, "stdout")),
+            asyncio.ensure_future(self._pump(process.stderr, job, "stderr")),
+        ]
+
+        # returncode, а не process.wait(): wait ждет еще и закрытия pipe
+        while process.returncode is None:
+            # Закрытие обоих pipe обычно означает выход процесса — ждем его без опроса
+            _, pending = await asyncio.wait(readers, timeout=self.POLL_INTERVAL)
+            if not pending and await self._exited(process, self.POLL_INTERVAL):
+                break
+            now = time.monotonic()
+            if job.cancel_requested:
+                job.reason = REASON_CANCEL
+            elif job.timeout and now - job.started > job.timeout:
+                job.reason = REASON_TIMEOUT
+            elif job.stall_timeout and now - job.last_output > job.stall_timeout:
+                job.reason = REASON_STALL
+            else:
+                continue
+            await self._stop(process)
+            break
+
+        # Дочерние процессы ffmpeg могут держать pipe открытым — чтение не ждем бесконечно
+        _, pending = await asyncio.wait(readers, timeout=self.KILL_GRACE)
+        for reader in pending:
+            reader.cancel()
+        return process.returncode
+
+    async def _stop(self, process):
+        """terminate, а если процесс не вышел за KILL_GRACE секунд — kill"""
+        for signal_process in (process.terminate, process.kill):
+            try:
+                signal_process()
+            except ProcessLookupError:
+                return
+            if await self._exited(process, self.KILL_GRACE):
+                return
+
+    async def _exited(self, process, timeout):
+        deadline = time.monotonic() + timeout
+        while process.returncode is None and time.monotonic() < deadline:
+            await asyncio.sleep(self.POLL_INTERVAL / 5)
+        return process.returncode is not None
+
+    async def _pump(self, stream, job, kind):
+        raw = job.binary and kind == "stdout"
+        while True:
+            try:
+                data = await (stream.read(65536) if raw else stream.readline())
+            except ValueError:
+                # Строка длиннее limit — пропускаем, процесс продолжает работу
+                continue
+            if not data:
+                break
+            job.last_output = time.monotonic()
+            if raw:
+                job.events.put((kind, data))
+                continue
+            line = data.decode("utf-8", errors="replace")
+            if kind == "stderr":
+                job.stderr.append(line)
+            job.events.put((kind, line))
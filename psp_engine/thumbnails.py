@@ -0,0 +1,147 @@
+"""Обложки .THM: общая картинка пакета или кадр из самого видео"""
+import hashlib
+import io
+import os
+import threading
+
+from .probe_cache import user_cache_dir
+
+THM_WIDTH, THM_HEIGHT = 160, 120
+
+# Кадр ищется с этой доли длительности — после заставок и титров
+FRAME_POINT = 0.2
+# Из скольких кадров после точки фильтр thumbnail выбирает самый характерный
+CANDIDATE_FRAMES = 30
+# Сколько секунд после точки читается, если подходящих кадров мало
+SEARCH_SECONDS = 20
+# Кадр считается черным, если темных пикселей в нем больше стольких процентов
+BLACK_PERCENT = 90
+
+
+def default_thumb_dir():
+    return os.path.join(user_cache_dir(), "thumbs")
+
+
+def frame_time(duration):
+    """Начало поиска кадра, секунд"""
+    if duration <= 0:
+        return 0.0
+    return max(0.0, min(duration * FRAME_POINT, duration - SEARCH_SECONDS / 2))
+
+
+def frame_filter(skip_black=True):
+    """Цепочка фильтров: без черных кадров, самый характерный кадр, 160x120"""
+    chain = []
+    if skip_black:
+        # blackframe с amount=0 помечает каждый кадр долей темных пикселей, metadata отбрасывает темные
+        chain.append(
+            "blackframe=amount=0,"
+            f"metadata=select:key=lavfi.blackframe.pblack:value={BLACK_PERCENT}:function=less"
+        )
+    chain.append(f"thumbnail={CANDIDATE_FRAMES}")
+    chain.append(
+        f"scale={THM_WIDTH}:{THM_HEIGHT}:force_original_aspect_ratio=decrease,"
+        f"pad={THM_WIDTH}:{THM_HEIGHT}:(ow-iw)/2:(oh-ih)/2,setsar=1"
+    )
+    return ",".join(chain)
+
+
+def render_cover(image_path):
+    """JPEG 160x120 из картинки пользователя"""
+    # Pillow импортируется только при необходимости — быстрый старт CLI
+    from PIL import Image
+
+    with Image.open(image_path) as img:
+        img = img.convert("RGB").resize((THM_WIDTH, THM_HEIGHT), Image.Resampling.LANCZOS)
+    buffer = io.BytesIO()
+    img.save(buffer, "JPEG", quality=85, optimize=True)
+    return buffer.getvalue()
+
+
+class CoverCache:
+    """Общая обложка пакета: картинка открывается и уменьшается один раз.
+
+    Результат хранится, пока не изменились путь, размер или mtime картинки.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.key = None
+        self.data = None
+
+    def get(self, image_path):
+        st = os.stat(image_path)
+        key = (os.path.abspath(image_path), st.st_size, st.st_mtime_ns)
+        with self.lock:
+            if key != self.key:
+                self.data = render_cover(image_path)
+                self.key = key
+            return self.data
+
+
+class FrameExtractor:
+    """Кадр-обложка из видео: быстрый переход к точке и один короткий запуск ffmpeg.
+
+    Готовые кадры хранятся в папке кэша по ключу (путь, размер, mtime
+    исходника), поэтому повторная конвертация не запускает ffmpeg снова.
+    """
+
+    def __init__(self, engine, directory=None):
+        self.engine = engine
+        self.directory = directory or default_thumb_dir()
+
+    def cache_path(self, source):
+        st = os.stat(source)
+        key = f"{os.path.abspath(source)}|{st.st_size}|{st.st_mtime_ns}|{THM_WIDTH}x{THM_HEIGHT}"
+        return os.path.join(self.directory, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".jpg")
+
+    def get(self, plan):
+        """JPEG 160x120 из видео плана; None, если кадр получить не удалось"""
+        try:
+            cached = self.cache_path(plan["input_file"])
+            with open(cached, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            pass
+        except OSError:
+            cached = None
+
+        data = self.extract(plan, skip_black=True) or self.extract(plan, skip_black=False)
+        if data and cached:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                temp = f"{cached}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(temp, "wb") as f:
+                    f.write(data)
+                os.replace(temp, cached)
+            except OSError:
+                pass
+        return data
+
+    def extract(self, plan, skip_black):
+        engine = self.engine
+        video = plan["info"].video
+        if video is None:
+            return None
+        # Кадр приходит в stdout — временные файлы не нужны
+        cmd = [
+            engine.ffmpeg_path, "-v", "error", "-nostdin",
+            "-ss", f"{frame_time(plan['duration']):.3f}", "-t", str(SEARCH_SECONDS),
+            "-i", plan["input_file"],
+            "-map", f"0:{video.index}", "-an", "-sn",
+            "-vf", frame_filter(skip_black),
+            "-frames:v", "1", "-c:v", "mjpeg", "-pix_fmt", "yuvj420p", "-q:v", "3",
+            "-f", "image2pipe", "pipe:1",
+        ]
+        chunks = []
+        result = engine.supervisor.run(
+            cmd,
+            on_stdout=chunks.append,
+            should_stop=lambda: engine.stop_requested,
+            binary=True,
+        )
+        data = b"".join(chunks)
+        # JPEG начинается с маркера SOI
+        if not result.ok or not data.startswith(b"\xff\xd8"):
+            return None
+        return data
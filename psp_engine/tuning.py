@@ -0,0 +1,225 @@
+"""Подбор пресета libx264 по пробным кодированиям фрагментов исходника"""
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+
+from .probe_cache import user_cache_dir
+
+# Варианты от быстрых к медленным; перебираются все, выбирается самый быстрый подходящий
+PRESETS = ["ultrafast", "superfast", "veryfast", "faster", "fast"]
+CRF_VALUES = [23, 26]
+
+# Пробные фрагменты: доли длительности файла и длина фрагмента, секунд
+SAMPLE_POINTS = (0.2, 0.5, 0.8)
+SAMPLE_SECONDS = 8
+
+# Минимальный SSIM (0..1) относительно масштабированного исходника
+DEFAULT_QUALITY_FLOOR = 0.95
+
+
+def default_tuning_path():
+    return os.path.join(user_cache_dir(), "tuning.json")
+
+
+def source_class(info, width, height):
+    """Класс исходника: кодек, высота, частота кадров и целевое разрешение"""
+    video = info.video
+    codec = video.codec_name if video and video.codec_name else "unknown"
+    source_height = info.height or 0
+    bucket = next((h for h in (360, 480, 576, 720, 1080, 1440, 2160) if source_height <= h), 4320)
+    fps = round(info.fps) if info.fps else 0
+    return f"{codec}_{bucket}p_{fps}fps_{width}x{height}"
+
+
+def apply_profile(encoder_config, profile):
+    """Конфигурация libx264 с пресетом и CRF из профиля"""
+    params = list(encoder_config["params"])
+    for option, value in (("-preset", profile["preset"]), ("-crf", str(profile["crf"]))):
+        if option in params:
+            params[params.index(option) + 1] = value
+        else:
+            params.extend([option, value])
+    return dict(encoder_config, params=params)
+
+
+def parse_quality(stderr):
+    """(SSIM, PSNR) из итоговых строк фильтров ssim и psnr"""
+    ssim = psnr = None
+    for line in stderr:
+        match = re.search(r"SSIM .*All:([\d.]+)", line)
+        if match:
+            ssim = float(match.group(1))
+        match = re.search(r"PSNR .*average:([\d.]+|inf)", line)
+        if match:
+            psnr = float(match.group(1))
+    return ssim, psnr
+
+
+class TuningStore:
+    """Выбранные профили по классам исходников (JSON в папке кэша)"""
+
+    SCHEMA_VERSION = 1
+
+    def __init__(self, path=None):
+        self.path = path or default_tuning_path()
+        self.lock = threading.Lock()
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = None
+        if not isinstance(data, dict) or data.get("version") != self.SCHEMA_VERSION:
+            data = {"version": self.SCHEMA_VERSION, "classes": {}}
+        self.data = data
+
+    def get(self, key):
+        with self.lock:
+            profile = self.data["classes"].get(key)
+            return dict(profile) if profile else None
+
+    def put(self, key, profile):
+        with self.lock:
+            self.data["classes"][key] = profile
+            directory = os.path.dirname(self.path)
+            try:
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                temp = f"{self.path}.{os.getpid()}.tmp"
+                with open(temp, "w", encoding="utf-8") as f:
+                    json.dump(self.data, f, ensure_ascii=False, indent=1)
+                os.replace(temp, self.path)
+            except OSError:
+                pass
+
+    def clear(self):
+        with self.lock:
+            self.data["classes"] = {}
+
+
+class PresetTuner:
+    """Пробные кодирования фрагментов файла всеми вариантами пресета и CRF.
+
+    Для каждого варианта измеряются скорость и SSIM/PSNR относительно
+    исходника, приведенного к тому же разрешению и частоте кадров.
+    Выбирается самый быстрый вариант с SSIM не ниже quality_floor.
+    """
+
+    def __init__(self, engine, store=None, quality_floor=DEFAULT_QUALITY_FLOOR):
+        self.engine = engine
+        self.store = store if store is not None else TuningStore()
+        self.quality_floor = quality_floor
+        # Один подбор на класс, даже если файлы класса идут параллельно
+        self.class_locks = {}
+        self.lock = threading.Lock()
+
+    def profile_for(self, plan):
+        """Профиль для файла: сохраненный для его класса или подобранный сейчас"""
+        key = source_class(plan["info"], plan["width"], plan["height"])
+        profile = self.store.get(key)
+        if profile:
+            return profile
+
+        with self.lock:
+            class_lock = self.class_locks.setdefault(key, threading.Lock())
+        with class_lock:
+            profile = self.store.get(key)
+            if profile:
+                return profile
+            self.engine.log(f"  🎛 Подбор пресета для класса {key}...")
+            profile = self.tune(plan)
+            if profile:
+                profile["class"] = key
+                self.store.put(key, profile)
+                self.engine.log(
+                    f"  🎛 Выбрано: preset {profile['preset']}, crf {profile['crf']}"
+                    f" (SSIM {profile['ssim']:.3f}, {profile['speed']:.1f}x)"
+                )
+        return profile
+
+    def samples(self, duration):
+        """Начала пробных фрагментов, секунд"""
+        if duration <= SAMPLE_SECONDS * 2:
+            return [0.0]
+        return [max(0.0, min(duration - SAMPLE_SECONDS, duration * point)) for point in SAMPLE_POINTS]
+
+    def tune(self, plan):
+        results = []
+        os.makedirs(plan["work_dir"], exist_ok=True)
+        work_dir = tempfile.mkdtemp(prefix=".psp_tune_", dir=plan["work_dir"])
+        try:
+            starts = self.samples(plan["duration"])
+            for preset in PRESETS:
+                for crf in CRF_VALUES:
+                    if self.engine.stop_requested:
+                        return None
+                    result = self.measure(plan, {"preset": preset, "crf": crf}, starts, work_dir)
+                    if result:
+                        results.append(result)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        if not results:
+            return None
+        passing = [r for r in results if r["ssim"] >= self.quality_floor]
+        if passing:
+            return max(passing, key=lambda r: r["speed"])
+        # Порог недостижим — лучшее качество
+        return max(results, key=lambda r: r["ssim"])
+
+    def measure(self, plan, profile, starts, work_dir):
+        """Скорость и качество варианта на всех фрагментах; None при ошибке"""
+        engine = self.engine
+        candidate = dict(plan, encoder_config=apply_profile(plan["encoder_config"], profile))
+        video_args = engine.video_args(candidate)
+        chain = video_args[video_args.index("-vf") + 1]
+        video_index = plan["info"].video.index
+
+        encoded_seconds = elapsed = 0.0
+        ssim_values, psnr_values = [], []
+        for n, start in enumerate(starts):
+            length = min(SAMPLE_SECONDS, plan["duration"] - start) or SAMPLE_SECONDS
+            sample = os.path.join(work_dir, f"{profile['preset']}_{profile['crf']}_{n}.mp4")
+            encode = [
+                engine.ffmpeg_path, "-nostats", "-progress", "pipe:1",
+                "-ss", f"{start:.3f}", "-t", f"{length:.3f}", "-i", plan["input_file"],
+                "-map", f"0:{video_index}", "-an",
+                *video_args,
+                "-f", "mp4", "-y", sample,
+            ]
+            started = time.monotonic()
+            try:
+                engine.run_ffmpeg(encode)
+            except Exception:
+                return None
+            elapsed += time.monotonic() - started
+            encoded_seconds += length
+
+            # Эталон — тот же фрагмент после той же цепочки scale/pad/fps
+            compare = [
+                engine.ffmpeg_path, "-nostats",
+                "-i", sample,
+                "-ss", f"{start:.3f}", "-t", f"{length:.3f}", "-i", plan["input_file"],
+                "-filter_complex",
+                f"[0:v]split[a][b];[1:{video_index}]{chain},format=yuv420p,split[r1][r2];"
+                f"[a][r1]ssim;[b][r2]psnr",
+                "-f", "null", "-",
+            ]
+            result = engine.supervisor.run(compare, should_stop=lambda: engine.stop_requested)
+            ssim, psnr = parse_quality(result.stderr)
+            if not result.ok or ssim is None:
+                return None
+            ssim_values.append(ssim)
+            if psnr is not None:
+                psnr_values.append(psnr)
+
+        return dict(
+            profile,
+            ssim=min(ssim_values),
+            psnr=min(psnr_values) if psnr_values else None,
+            speed=encoded_seconds / elapsed if elapsed else 0.0,
+            tuned=time.time(),
+        )
@@ -0,0 +1,321 @@
+"""Наблюдение за папкой: новые и измененные видео без полного пересканирования"""
+import ctypes
+import ctypes.util
+import errno
+import os
+import queue
+import select
+import struct
+import sys
+import threading
+import time
+
+# Маски inotify (linux/inotify.h)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# IN_MODIFY не нужен: пока файл пишется, его размер проверяется опросом
+WATCH_MASK = IN_CREATE | IN_CLOSE_WRITE | IN_MOVED_TO | IN_DELETE_SELF
+EVENT_HEADER = struct.Struct("iIII")
+
+
+class InotifyBackend:
+    """События ядра Linux: одна подписка на каталог, без опроса файлов"""
+
+    def __init__(self, root, skip_dir):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        self.add_watch = libc.inotify_add_watch
+        self.add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        self.skip_dir = skip_dir
+        self.dirs = {}  # wd -> путь каталога
+        self.overflow = False
+        self.watch_tree(root)
+
+    def watch_tree(self, top):
+        """Подписка на каталог и все вложенные; возвращает найденные в них файлы"""
+        files = []
+        stack = [top]
+        while stack:
+            path = stack.pop()
+            wd = self.add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+            if wd < 0:
+                err = ctypes.get_errno()
+                if err == errno.ENOSPC:
+                    # Лимит fs.inotify.max_user_watches — наблюдатель перейдет на опрос
+                    raise OSError(err, "inotify: превышен лимит подписок")
+                continue
+            self.dirs[wd] = path
+            try:
+                with os.scandir(path) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            if not self.skip_dir(entry.path):
+                                stack.append(entry.path)
+                        else:
+                            files.append(entry.path)
+            except OSError:
+                pass
+        return files
+
+    def poll(self, timeout):
+        """Пути файлов, с которыми что-то произошло за timeout секунд"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 256 * 1024)
+        except BlockingIOError:
+            return []
+
+        changed = []
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                self.overflow = True
+                continue
+            if mask & (IN_IGNORED | IN_DELETE_SELF):
+                self.dirs.pop(wd, None)
+                continue
+            directory = self.dirs.get(wd)
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, name)
+            if mask & IN_ISDIR:
+                # Новый каталог: подписка и файлы, появившиеся до нее
+                if mask & (IN_CREATE | IN_MOVED_TO) and not self.skip_dir(path):
+                    changed.extend(self.watch_tree(path))
+            else:
+                changed.append(path)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingBackend:
+    """Опрос раз в interval секунд: каталоги сравниваются по mtime (читаются лишь
+    изменившиеся), известные видео — по размеру и mtime.
+
+    Перезапись файла на месте не меняет mtime каталога, поэтому видео
+    (accept) проверяются отдельно — так опрос видит те же изменения, что inotify.
+    """
+
+    def __init__(self, root, skip_dir, interval=5.0, accept=None):
+        self.skip_dir = skip_dir
+        self.accept = accept or (lambda path: True)
+        self.interval = interval
+        self.dirs = {}  # путь каталога -> mtime_ns
+        self.known = {}  # файл -> (размер, mtime_ns) для видео, None для остальных
+        self.overflow = False
+        self.next_scan = time.monotonic() + interval
+        self._scan_tree(root, report=False)
+
+    def _file_state(self, entry):
+        if not self.accept(entry.path):
+            return None
+        st = entry.stat(follow_symlinks=False)
+        return st.st_size, st.st_mtime_ns
+
+    def _scan_dir(self, path):
+        """([(файл, состояние)], подкаталоги) одного каталога"""
+        files, subdirs = [], []
+        try:
+            self.dirs[path] = os.stat(path).st_mtime_ns
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not self.skip_dir(entry.path):
+                            subdirs.append(entry.path)
+                    else:
+                        try:
+                            files.append((entry.path, self._file_state(entry)))
+                        except OSError:
+                            continue
+        except OSError:
+            self.dirs.pop(path, None)
+        return files, subdirs
+
+    def _scan_tree(self, top, report=True):
+        new = []
+        stack = [top]
+        while stack:
+            files, subdirs = self._scan_dir(stack.pop())
+            for path, state in files:
+                if path not in self.known:
+                    new.append(path)
+                self.known[path] = state
+            stack.extend(d for d in subdirs if d not in self.dirs)
+        return new if report else []
+
+    def poll(self, timeout):
+        """Изменившиеся файлы; до следующего опроса — пустой список через timeout"""
+        delay = self.next_scan - time.monotonic()
+        if delay > 0:
+            time.sleep(min(timeout, delay))
+            if time.monotonic() < self.next_scan:
+                return []
+        self.next_scan = time.monotonic() + self.interval
+
+        changed = []
+        rescanned = set()
+        for path, mtime_ns in list(self.dirs.items()):
+            try:
+                current = os.stat(path).st_mtime_ns
+            except OSError:
+                self.dirs.pop(path, None)
+                continue
+            if current == mtime_ns:
+                continue
+            # В каталоге что-то появилось или исчезло — перечитываем только его
+            rescanned.add(path)
+            files, subdirs = self._scan_dir(path)
+            present = dict(files)
+            for gone in [p for p in self.known if os.path.dirname(p) == path and p not in present]:
+                del self.known[gone]
+            for file_path, state in files:
+                if file_path not in self.known or self.known[file_path] != state:
+                    self.known[file_path] = state
+                    changed.append(file_path)
+            for subdir in subdirs:
+                if subdir not in self.dirs:
+                    changed.extend(self._scan_tree(subdir))
+
+        # Видео в неизменившихся каталогах: перезапись на месте видна только по самому файлу
+        for file_path, state in list(self.known.items()):
+            if state is None or os.path.dirname(file_path) in rescanned:
+                continue
+            try:
+                st = os.stat(file_path)
+            except OSError:
+                continue  # удаление заметит mtime каталога
+            current = (st.st_size, st.st_mtime_ns)
+            if current != state:
+                self.known[file_path] = current
+                changed.append(file_path)
+        return changed
+
+    def close(self):
+        pass
+
+
+class FolderWatcher:
+    """Поток наблюдения: файл становится готовым, когда перестал меняться.
+
+    Файл считается дописанным, если его размер и mtime не менялись settle
+    секунд. Готовые файлы забираются через wait_ready().
+    """
+
+    def __init__(self, root, accept, skip_dir, settle=10.0, poll_interval=5.0, backend=None):
+        self.root = root
+        self.accept = accept  # путь файла -> нужно ли его конвертировать
+        self.skip_dir = skip_dir  # путь каталога -> пропустить целиком
+        self.settle = settle
+        self.poll_interval = poll_interval
+        self.backend_name = backend
+        self.backend = None
+        self.pending = {}  # путь -> (размер, mtime_ns, с какого момента не меняется)
+        self.ready = queue.Queue()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def _make_backend(self):
+        if self.backend_name != "poll" and sys.platform.startswith("linux"):
+            try:
+                return InotifyBackend(self.root, self.skip_dir)
+            except (OSError, AttributeError):
+                pass
+        return PollingBackend(self.root, self.skip_dir, self.poll_interval, self.accept)
+
+    @property
+    def mode(self):
+        return "inotify" if isinstance(self.backend, InotifyBackend) else "опрос"
+
+    def start(self):
+        self.backend = self._make_backend()
+        self.thread = threading.Thread(target=self._run, name="folder-watcher", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread:
+            self.thread.join()
+        if self.backend:
+            self.backend.close()
+
+    def wait_ready(self, timeout=1.0):
+        """Готовые к конвертации файлы; пустой список, если за timeout ничего нет"""
+        try:
+            files = [self.ready.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while True:
+            try:
+                files.append(self.ready.get_nowait())
+            except queue.Empty:
+                return files
+
+    def _run(self):
+        while not self.stopped.is_set():
+            try:
+                # Такт в секунду — для проверки дописываемых файлов в pending;
+                # опрос каталогов идет со своим интервалом
+                changed = self.backend.poll(min(1.0, self.settle))
+            except OSError:
+                # inotify отказал (например, лимит подписок) — продолжаем опросом
+                self.backend.close()
+                self.backend = PollingBackend(self.root, self.skip_dir, self.poll_interval, self.accept)
+                changed = []
+            if self.backend.overflow:
+                # Очередь событий переполнена — один раз пересобираем наблюдение
+                self.backend.close()
+                self.backend = self._make_backend()
+                changed = list(self._all_files())
+
+            now = time.monotonic()
+            for path in changed:
+                if self.accept(path):
+                    # Новое событие — отсчет стабильности начинается заново
+                    self.pending[path] = (None, None, now)
+            self._check_pending(now)
+
+    def _all_files(self):
+        stack = [self.root]
+        while stack:
+            try:
+                with os.scandir(stack.pop()) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            if not self.skip_dir(entry.path):
+                                stack.append(entry.path)
+                        else:
+                            yield entry.path
+            except OSError:
+                continue
+
+    def _check_pending(self, now):
+        for path, (size, mtime_ns, since) in list(self.pending.items()):
+            try:
+                st = os.stat(path)
+            except OSError:
+                del self.pending[path]
+                continue
+            if (st.st_size, st.st_mtime_ns) != (size, mtime_ns):
+                self.pending[path] = (st.st_size, st.st_mtime_ns, now)
+            elif now - since >= self.settle and st.st_size > 0:
+                del self.pending[path]
+                self.ready.put(path)
@@ -0,0 +1,75 @@
+"""Дорожки кодеров без GPU: аппаратная дорожка с конфигурацией libx264 и вынужденной ошибкой"""
+import pytest
+
+from psp_engine import ConversionEngine, EncoderLane, LaneScheduler
+from psp_engine.engine import MODE_COPY, MODE_ENCODE
+
+# Признак «аппаратного» кодера в конфигурации дорожки: с ним кодирование падает
+FAKE_GPU = "-fake-gpu"
+
+
+@pytest.fixture
+def engine():
+    engine = ConversionEngine(ffmpeg_path="ffmpeg", on_event=lambda event: None)
+    engine.converted = []  # (файл, кодек, конфигурация дорожки?) каждого удачного кодирования
+
+    def plan(input_file, encoder=None, analyze=True):
+        return {
+            "input_file": input_file,
+            "mode": MODE_COPY if input_file.startswith("copy") else MODE_ENCODE,
+            "encoder_config": engine.get_encoder_config(encoder),
+        }
+
+    def convert_plan(plan):
+        config = plan["encoder_config"]
+        if plan["mode"] == MODE_ENCODE and FAKE_GPU in config["params"]:
+            raise RuntimeError("fake GPU failure")
+        engine.converted.append((plan["input_file"], config["vcodec"], FAKE_GPU in config["params"]))
+        return plan["input_file"] + ".MP4"
+
+    engine.plan = plan
+    engine.convert_plan = convert_plan
+    return engine
+
+
+def gpu_lane(engine, max_failures=3):
+    cpu = engine.get_encoder_config("cpu")
+    config = dict(cpu, params=cpu["params"] + [FAKE_GPU])
+    return EncoderLane("nvenc", 1, config=config, max_failures=max_failures)
+
+
+def run(engine, lane, files):
+    def job(fp, slot):
+        # Как в _convert_job: план строится для кодера дорожки, взявшей задачу
+        engine._job_ctx.lane = slot
+        try:
+            engine._convert_on_lane(engine.plan(fp), slot)
+        finally:
+            engine._job_ctx.lane = None
+
+    engine.lanes = [lane]
+    LaneScheduler([lane]).run(files, job)
+
+
+def test_failed_encode_falls_back_to_libx264(engine):
+    lane = gpu_lane(engine)
+    run(engine, lane, ["a.mkv"])
+    assert engine.converted == [("a.mkv", "libx264", False)]
+    assert lane.failures == 1
+    assert not lane.disabled
+
+
+def test_lane_disabled_after_max_failures(engine):
+    lane = gpu_lane(engine, max_failures=2)
+    run(engine, lane, ["a.mkv", "b.mkv"])
+    assert lane.disabled
+    assert [codec for _, codec, on_gpu in engine.converted] == ["libx264", "libx264"]
+    assert not any(on_gpu for _, _, on_gpu in engine.converted)
+
+
+def test_copy_jobs_do_not_touch_failure_counter(engine):
+    lane = gpu_lane(engine)
+    run(engine, lane, ["a.mkv", "copy.mp4"])
+    assert lane.failures == 1
+    assert lane.completed == 0
+    assert ("copy.mp4", "libx264", True) in engine.converted
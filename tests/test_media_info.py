@@ -0,0 +1,27 @@
+"""MediaInfo из вывода ffmpeg -i — запасной путь, когда ffprobe нет"""
+from psp_engine.media_info import MediaInfo
+
+FFMPEG_OUTPUT = """Input #0, mov,mp4,m4a,3gp,3g2,mj2, from 'a.mp4':
+  Duration: 00:01:02.34, start: 0.000000, bitrate: 4123 kb/s
+  Stream #0:0[0x1](und): Video: h264 (High) (avc1 / 0x31637661), yuv420p(tv, bt709, progressive), 1920x1080 [SAR 1:1 DAR 16:9], 4000 kb/s, 29.97 fps, 29.97 tbr, 90k tbn (default)
+    Side data:
+      displaymatrix: rotation of -90.00 degrees
+  Stream #0:1[0x2](und): Audio: aac (LC) (mp4a / 0x6134706D), 44100 Hz, stereo, fltp, 128 kb/s (default)
+  Stream #0:2: Video: mjpeg (Baseline), yuvj420p(pc, bt470bg/unknown/unknown), 600x600 [SAR 1:1 DAR 1:1], 90k tbr, 90k tbn (attached pic)
+At least one output file must be specified
+"""
+
+
+def test_from_ffmpeg():
+    info = MediaInfo.from_ffmpeg("a.mp4", 123, FFMPEG_OUTPUT)
+    assert info.ok
+    assert info.duration == 62.34
+    assert info.bit_rate == 4_123_000
+    assert (info.width, info.height) == (1920, 1080)
+    assert info.fps == 29.97
+    assert info.rotation == 270
+    assert info.video.profile == "High"
+    assert info.video.pix_fmt == "yuv420p"
+    assert info.audio.codec_name == "aac"
+    assert (info.audio.sample_rate, info.audio.channels) == (44100, 2)
+    assert info.streams[2].attached_pic
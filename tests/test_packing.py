@@ -0,0 +1,23 @@
+"""Раскладка по картам: файл больше карты получает свой предел битрейта"""
+from psp_engine.bitrate import MIN_VIDEO_BITRATE
+from psp_engine.packing import PackItem, pack
+
+
+def item(path, duration):
+    return PackItem(path, duration, video_rate=768_000, audio_rate=128_000)
+
+
+def test_item_larger_than_stick_gets_own_cap():
+    packing = pack([item("big", 130), item("small", 10)], 10_000_000)
+    assignments = packing.assignments()
+    assert not packing.oversized
+    stick, cap = assignments["big"]
+    assert MIN_VIDEO_BITRATE <= cap < 768_000
+    assert assignments["small"][1] is None
+    assert packing.stick_size(stick - 1) <= packing.usable
+
+
+def test_item_too_long_even_at_min_bitrate_is_oversized():
+    packing = pack([item("huge", 3000)], 10_000_000)
+    assert [i.path for i in packing.oversized] == ["huge"]
+    assert not packing.sticks